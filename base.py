@@ -1,10 +1,12 @@
+import asyncio
 import logging
+import time
 
 import discord
 from discord.ext import commands
 
-import settings
-from util import dump_command_ctx, str_2_color
+import db, executors, metrics, settings
+from util import dump_command_ctx, str_2_color, paginate_template, paginate_text, render_template_sync, DISCORD_MESSAGE_LIMIT
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,25 @@ class BaseCog(commands.Cog):
         super().__init__(*args, **kwargs)
         
         self.bot = bot
+        # page flipping tasks of `reply_paginated`
+        self._paginators = set()
+
+    # Subclasses overriding the invoke hooks must call super() to keep command metrics
+    async def cog_before_invoke(self, ctx):
+        ctx.invoke_started = time.perf_counter()
+        # attributes statements to this command, see `db.QueryStats`
+        ctx.query_stats_token = db.start_query_stats(ctx.command.qualified_name)
+
+    async def cog_after_invoke(self, ctx):
+        # also called when the command failed
+        started = getattr(ctx, 'invoke_started', None)
+        command = ctx.command.qualified_name
+        token = getattr(ctx, 'query_stats_token', None)
+        if token is not None:
+            ctx.query_stats = db.finish_query_stats(token)
+        if started is not None:
+            metrics.COMMAND_DURATION.observe(time.perf_counter() - started, cog=self.qualified_name, command=command)
+        metrics.COMMANDS.inc(cog=self.qualified_name, command=command, status='error' if ctx.command_failed else 'ok')
 
 
     async def cog_command_error(self, ctx, command_error):
@@ -52,4 +73,87 @@ class BaseCog(commands.Cog):
 
     async def debug(self, ctx, text):
         if settings.DEBUG and ctx.author.id == self.bot.author_id:
-            await self.reply_embed(ctx, 'Debug', text)
\ No newline at end of file
+            await self.reply_embed(ctx, 'Debug', text)
+
+    PREV_PAGE = '\N{BLACK LEFT-POINTING TRIANGLE}'
+    NEXT_PAGE = '\N{BLACK RIGHT-POINTING TRIANGLE}'
+
+    async def reply_paginated(self, ctx, template_name, template_context=None, timeout=120.0):
+        """Reply with a rendered template split into pages that fit in a message.
+
+        The command author flips pages with reactions. Each page is only rendered the first time it is requested,
+        except for long lists (`settings.TEMPLATES_THREAD_RENDER_ROWS`) which are rendered at once in a thread
+        so they don't block the event loop.
+
+        Returns once the first page is sent. Page flips are handled by a task until `timeout`, so the command's
+        latency doesn't include the time the author takes to read.
+        """
+        footer_len = 20
+        limit = DISCORD_MESSAGE_LIMIT - footer_len
+        object_list = (template_context or {}).get('object_list')
+        if object_list is not None and len(object_list) >= settings.TEMPLATES_THREAD_RENDER_ROWS:
+            text = await executors.run_in_thread(render_template_sync, template_name, template_context)
+            pages = paginate_text(text, limit=limit)
+        else:
+            pages = paginate_template(template_name, template_context, limit=limit)
+        handed_off = False
+        try:
+            try:
+                page, more = await pages.__anext__()
+            except StopAsyncIteration:
+                return
+            if not more:
+                await ctx.reply(page)
+                return
+
+            msg = await ctx.reply(f'{page}\n*Page 1*')
+            for emoji in (self.PREV_PAGE, self.NEXT_PAGE):
+                await msg.add_reaction(emoji)
+
+            task = asyncio.get_running_loop().create_task(self._flip_pages(ctx, msg, pages, page, more, timeout))
+            self._paginators.add(task)
+            task.add_done_callback(self._paginators.discard)
+            handed_off = True
+        finally:
+            if not handed_off:
+                await pages.aclose()
+
+    async def _flip_pages(self, ctx, msg, pages, page, more, timeout):
+        # the task copied the command's context -- its query stats are finished
+        db.query_stats.set(None)
+        rendered = [page]
+        index = 0
+
+        def check(reaction, user):
+            return reaction.message.id == msg.id and user == ctx.author and str(reaction.emoji) in (self.PREV_PAGE, self.NEXT_PAGE)
+
+        try:
+            while True:
+                try:
+                    reaction, user = await self.bot.wait_for('reaction_add', check=check, timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                if str(reaction.emoji) == self.NEXT_PAGE:
+                    if index + 1 == len(rendered) and more:
+                        try:
+                            page, more = await pages.__anext__()
+                            rendered.append(page)
+                        except StopAsyncIteration:
+                            more = False
+                    index = min(index + 1, len(rendered) - 1)
+                else:
+                    index = max(index - 1, 0)
+                await msg.edit(content=f'{rendered[index]}\n*Page {index + 1}*')
+                try:
+                    await msg.remove_reaction(reaction.emoji, user)
+                except discord.HTTPException:
+                    pass
+
+            try:
+                await msg.clear_reactions()
+            except discord.HTTPException:
+                pass
+        except Exception:
+            logger.exception(f'Paginated reply to {ctx.command} failed')
+        finally:
+            await pages.aclose()
@@ -0,0 +1,29 @@
+"""Benchmarks run through `run.py bench-*` commands."""
+import os
+import statistics
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(latencies):
+    """Summary statistics for a list of latencies in seconds, reported in ms."""
+    values = sorted(latencies)
+    return dict(
+        n=len(values),
+        mean=statistics.fmean(values) * 1000 if values else 0.0,
+        p50=percentile(values, 50) * 1000,
+        p95=percentile(values, 95) * 1000,
+        p99=percentile(values, 99) * 1000,
+    )
+
+
+def remove_sqlite_files(path):
+    """Remove a scratch SQLite database and its journal files."""
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(f'{path}{suffix}'):
+            os.remove(f'{path}{suffix}')
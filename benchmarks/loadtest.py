@@ -0,0 +1,320 @@
+"""Offline load test of the economy cogs with stand-ins for the discord objects they use.
+
+Drives `pay`, `cointoss` and `exchange` commands and reward policy `on_message` events against a scratch
+database at a fixed rate, with at most `concurrency` operations in flight -- no gateway connection or token needed.
+
+Commands are invoked the way discord.py does after parsing a message: `cog_before_invoke`, the command
+callback with converted arguments, then `cog_after_invoke` even if the command failed. Reward events go
+through the listeners the `Rewards` cog registers on the bot, like `bot.dispatch('message', ...)`.
+
+At a fixed rate latency is measured from when an operation was scheduled, so time spent waiting for a free
+slot shows up in the tail instead of as a lower rate. Without a rate every operation is scheduled at the start,
+so latency is measured from when it got a slot and the time spent waiting for one is reported separately.
+Latencies only cover operations that completed or were rejected by the bot -- lock errors and other errors
+are counted instead. After the run every balance is checked against the transaction ledger: the change of
+each balance must equal the sum of its ledger rows and no balance may be negative.
+
+A run with errors or money problems failed, see `failed`.
+
+Runs against the database configured in `settings.DB_URL`, so point it at a scratch database *before*
+this module (and `db`) is imported -- `run.py loadtest` does that.
+"""
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from discord.ext import commands
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.future import select
+
+import db
+from benchmarks import summarize
+from economy import models, archive
+from economy.cogs import Wallet, Gambling, Exchange, Rewards
+
+
+SYMBOLS = ('BPY', 'GC')
+DEFAULT_MIX = dict(pay=4, cointoss=3, exchange=1, reward=2)
+# matched by the `cheer_up` rule of the default policy
+REWARD_CONTENT = 'feeling sad about the game'
+
+
+#
+# Discord stand-ins -- only what the cogs and the policy engine touch
+
+class FakeUser:
+    def __init__(self, id, name, bot=False):
+        self.id = id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.name
+
+
+# members are users as far as the cogs are concerned
+FakeMember = FakeUser
+
+
+class FakeChannel:
+    def __init__(self, id, name='general'):
+        self.id = id
+        self.name = name
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage('', author=None, channel=self)
+
+    def typing(self):
+        return _Typing()
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, content, author, channel, mentions=()):
+        self.id = FakeMessage._next_id
+        FakeMessage._next_id += 1
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.mentions = list(mentions)
+        self.reference = None
+        self.reactions = []
+
+    async def add_reaction(self, emoji):
+        self.reactions.append(emoji)
+
+    async def reply(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+class FakeContext:
+    def __init__(self, bot, command, author, channel, mentions=()):
+        self.bot = bot
+        self.command = command
+        self.author = author
+        self.channel = channel
+        self.message = FakeMessage(f'{bot.command_prefix}{command.qualified_name}', author, channel, mentions)
+        self.command_failed = False
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+    async def reply(self, *args, **kwargs):
+        return await self.message.reply(*args, **kwargs)
+
+    def typing(self):
+        return self.channel.typing()
+
+
+class FakeBot:
+    def __init__(self, command_prefix='bp*'):
+        self.command_prefix = command_prefix
+        self.user = FakeUser(0, 'bot', bot=True)
+        # never the author of a command, so `BaseCog.debug` stays quiet
+        self.author_id = self.user.id
+        # event name: listeners
+        self.listeners = defaultdict(list)
+
+    def add_listener(self, func, name=None):
+        self.listeners[name or func.__name__].append(func)
+
+    async def dispatch(self, event, *args, **kwargs):
+        """Run the listeners of `event` one after another. (discord.py schedules them as tasks.)"""
+        for listener in self.listeners[f'on_{event}']:
+            await listener(*args, **kwargs)
+
+    async def wait_for(self, event, check=None, timeout=None):
+        # nobody reacts or replies
+        raise asyncio.TimeoutError()
+
+
+#
+# Workload
+
+def parse_mix(value):
+    """'pay=4,cointoss=1' -> {'pay': 4, 'cointoss': 1}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation {name!r}. Use one of {", ".join(DEFAULT_MIX)}.')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def setup(users, balance):
+    """Create tables with the load test currencies and `users` users with wallets holding `balance` of each."""
+    db.import_models(['economy'])
+    async with db.engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.drop_all)
+        await conn.run_sync(db.Base.metadata.create_all)
+        currency_ids = []
+        for symbol in SYMBOLS:
+            res = await conn.execute(insert(models.Currency.__table__).values(name=f'Load test {symbol}', symbol=symbol))
+            currency_ids.append(res.inserted_primary_key[0])
+        user_ids = list(range(1, users + 1))
+        await conn.execute(insert(db.User.__table__), [dict(id=user_id, name=f'user {user_id}') for user_id in user_ids])
+        await conn.execute(insert(models.Wallet.__table__), [dict(id=user_id, user_id=user_id) for user_id in user_ids])
+        await conn.execute(
+            insert(models.CurrencyBalance.__table__),
+            [dict(wallet_id=user_id, currency_id=currency_id, balance=balance) for user_id in user_ids for currency_id in currency_ids]
+        )
+    return [FakeMember(user_id, f'user {user_id}') for user_id in user_ids]
+
+
+async def balances():
+    """{(user_id, currency_id): balance}"""
+    async with db.engine.connect() as conn:
+        res = await conn.execute(
+            select(models.Wallet.user_id, models.CurrencyBalance.currency_id, models.CurrencyBalance.balance).
+            join(models.Wallet, models.Wallet.id == models.CurrencyBalance.wallet_id)
+        )
+        return {(user_id, currency_id): balance for user_id, currency_id, balance in res.all()}
+
+
+async def check_conservation(initial):
+    """Compare balance changes with the transaction ledger. Returns a list of problems, empty if all balances add up."""
+    final = await balances()
+    ledger = Counter()
+    async with db.engine.connect() as conn:
+        res = await conn.execute(select(models.TransactionLog.__table__))
+        for row in res.all():
+            for user_id, currency_id, amount in archive.balance_effects('transaction', row):
+                ledger[(user_id, currency_id)] += Decimal(amount)
+
+    problems = []
+    for key in sorted(set(initial) | set(final) | set(ledger)):
+        before, after = initial.get(key, Decimal(0)), final.get(key, Decimal(0))
+        if after - before != ledger.get(key, Decimal(0)):
+            problems.append(f'user {key[0]} currency {key[1]}: balance changed by {after - before}, ledger says {ledger.get(key, 0)}')
+        if after < 0:
+            problems.append(f'user {key[0]} currency {key[1]}: negative balance {after}')
+    return problems
+
+
+class LoadTest:
+    def __init__(self, members, amount='1'):
+        self.bot = FakeBot()
+        self.members = members
+        self.amount = amount
+        self.channel = FakeChannel(1, 'load-test')
+        self.wallet_cog = Wallet(self.bot)
+        self.gambling_cog = Gambling(self.bot)
+        self.exchange_cog = Exchange(self.bot)
+        self.rewards_cog = Rewards(self.bot)
+        self.rewards_cog.init_policy()
+
+    async def invoke(self, cog, command, author, *args, mentions=(), **kwargs):
+        """Run a command like `commands.Command.invoke` once its arguments are converted."""
+        ctx = FakeContext(self.bot, command, author, self.channel, mentions)
+        try:
+            await cog.cog_before_invoke(ctx)
+            await command.callback(cog, ctx, *args, **kwargs)
+        except Exception:
+            ctx.command_failed = True
+            raise
+        finally:
+            await cog.cog_after_invoke(ctx)
+
+    async def pay(self):
+        sender, receiver = random.sample(self.members, 2)
+        await self.invoke(self.wallet_cog, self.wallet_cog.pay, sender, [receiver], mentions=[receiver], currency_str=f'{self.amount} BPY')
+
+    async def cointoss(self):
+        await self.invoke(self.gambling_cog, self.gambling_cog.cointoss, random.choice(self.members), random.choice(['heads', 'tails']), currency_str=f'{self.amount} GC')
+
+    async def exchange(self):
+        currency_str = random.choice([f'{self.amount} GC', f'{self.amount} BPY to GC'])
+        await self.invoke(self.exchange_cog, self.exchange_cog.exchange, random.choice(self.members), currency_str=currency_str)
+
+    async def reward(self):
+        await self.bot.dispatch('message', FakeMessage(REWARD_CONTENT, random.choice(self.members), self.channel))
+
+
+def _is_lock_error(error):
+    while error is not None:
+        if isinstance(error, OperationalError) and 'locked' in str(error):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+async def run(ops=500, concurrency=20, rate=100.0, users=50, mix=None, balance=Decimal('1000')):
+    """Run `ops` operations picked from `mix` (name: weight) at `rate` operations per second (0 for as fast as possible)."""
+    mix = mix or DEFAULT_MIX
+    members = await setup(users, balance)
+    initial = await balances()
+    test = LoadTest(members)
+    names = random.choices(list(mix), weights=list(mix.values()), k=ops)
+
+    latencies = defaultdict(list)
+    # time spent waiting for a slot
+    waits = []
+    outcomes = defaultdict(Counter)
+    errors = Counter()
+    slots = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def one(i, name):
+        scheduled = start + i / rate if rate else start
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        async with slots:
+            started = time.perf_counter()
+            waits.append(started - scheduled)
+            try:
+                await getattr(test, name)()
+                outcome = 'ok'
+            except commands.CommandError:
+                # e.g. not enough money -- the bot replies with an error
+                outcome = 'rejected'
+            except Exception as e:
+                outcome = 'locked' if _is_lock_error(e) else 'error'
+                if outcome == 'error':
+                    errors[f'{type(e).__name__}: {e}'[:200]] += 1
+        if outcome in ('ok', 'rejected'):
+            latencies[name].append(time.perf_counter() - (scheduled if rate else started))
+        outcomes[name][outcome] += 1
+
+    await asyncio.gather(*[one(i, name) for i, name in enumerate(names)])
+    elapsed = time.perf_counter() - start
+    problems = await check_conservation(initial)
+    await db.engine.dispose()
+    await db.read_engine.dispose()
+
+    return dict(
+        elapsed=elapsed,
+        throughput=ops / elapsed,
+        all=summarize([latency for values in latencies.values() for latency in values]),
+        wait=summarize(waits),
+        operations={name: dict(summarize(latencies[name]), **outcomes[name]) for name in mix if outcomes[name]},
+        locked=sum(o['locked'] for o in outcomes.values()),
+        errors=errors,
+        problems=problems,
+        failed=bool(errors or problems),
+    )
@@ -0,0 +1,54 @@
+"""Render benchmark for the transaction list template.
+
+Compares building a new environment for every render (i.e. re-reading and compiling the template)
+with the shared, preloaded environment.
+"""
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import util
+from benchmarks import summarize
+
+
+def fake_transactions(n):
+    user = SimpleNamespace(id=1, name='alice')
+    related_user = SimpleNamespace(id=2, name='bob')
+    currency = SimpleNamespace(id=1, symbol='BPY')
+    now = datetime.utcnow()
+    return [
+        SimpleNamespace(
+            id=i, transaction_type=('deposit', 'withdrawal', 'payment')[i % 3],
+            created=now - timedelta(minutes=i), amount=Decimal(i) / 4, currency=currency,
+            user=user, user_id=user.id,
+            related_user=related_user if i % 3 == 2 else None,
+            related_user_id=related_user.id if i % 3 == 2 else None,
+            note=f'Transaction {i}',
+        )
+        for i in range(n)
+    ]
+
+
+async def _render(env, data):
+    tmpl = env.get_template('transactions.jinja2')
+    return await tmpl.render_async(**data)
+
+
+async def run(rows=(10, 100, 1000), repeat=20):
+    results = []
+    shared_env = util.get_template_env()
+    util.preload_templates(shared_env)
+    for n in rows:
+        data = dict(title='Transactions', object_list=fake_transactions(n), current_user_id=1)
+        timings = dict(fresh=[], shared=[])
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await _render(util.get_template_env(bytecode_cache=False), data)
+            timings['fresh'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            text = await _render(shared_env, data)
+            timings['shared'].append(time.perf_counter() - start)
+        results.append(dict(rows=n, chars=len(text), fresh=summarize(timings['fresh']), shared=summarize(timings['shared'])))
+    return results
@@ -0,0 +1,96 @@
+"""Compare settling multiplayer games per player against `EconomyService.settle_game`.
+
+The per player path is what `guess_multi` used to do: one `complete_gambling_transaction` per player,
+i.e. a balance check session and a deposit or withdrawal session each.
+
+Runs against the database configured in `settings.DB_URL`, so point it at a scratch database *before*
+this module (and `db`) is imported -- `run.py bench-settlement` does that.
+"""
+import random
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import insert, func
+from sqlalchemy.future import select
+
+import db
+from benchmarks import summarize
+from economy import models, games
+from economy.dataclasses import CurrencyAmount
+from economy.services import EconomyService
+
+
+SYMBOL = 'BPY'
+
+
+async def setup(players, balance):
+    """Create tables with one currency and `players` users with wallets holding `balance` each."""
+    db.import_models(['economy'])
+    async with db.engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.drop_all)
+        await conn.run_sync(db.Base.metadata.create_all)
+        res = await conn.execute(insert(models.Currency.__table__).values(name='Bench coin', symbol=SYMBOL))
+        currency_id = res.inserted_primary_key[0]
+        user_ids = list(range(1, players + 1))
+        await conn.execute(insert(db.User.__table__), [dict(id=user_id, name=f'player {user_id}') for user_id in user_ids])
+        await conn.execute(insert(models.Wallet.__table__), [dict(id=user_id, user_id=user_id) for user_id in user_ids])
+        await conn.execute(
+            insert(models.CurrencyBalance.__table__),
+            [dict(wallet_id=user_id, currency_id=currency_id, balance=balance) for user_id in user_ids]
+        )
+    return user_ids
+
+
+async def money_supply():
+    async with db.engine.connect() as conn:
+        res = await conn.execute(select(func.sum(models.CurrencyBalance.balance)))
+        return res.scalar_one()
+
+
+def random_outcomes(user_ids, buy_in):
+    """Net outcome per player of a game with a few random winners splitting the pot."""
+    winners = random.sample(user_ids, k=random.randint(1, min(3, len(user_ids))))
+    shares = games.split_pot(buy_in * len(user_ids), len(winners))
+    outcomes = {user_id: -buy_in for user_id in user_ids}
+    for winner, share in zip(winners, shares):
+        outcomes[winner] = share - buy_in
+    return outcomes
+
+
+async def settle_per_player(service, game_id, buy_in, outcomes):
+    for user_id, amount in outcomes.items():
+        await service.complete_gambling_transaction(
+            user=SimpleNamespace(id=user_id),
+            currency_amount=CurrencyAmount.copy(buy_in, amount=abs(amount)),
+            won=amount >= 0,
+            note=f'Bench game #{game_id}',
+        )
+
+
+async def settle_batched(service, game_id, buy_in, outcomes):
+    await service.settle_game(game_id, buy_in, outcomes, note='Bench game')
+
+
+async def run(player_counts=(10, 100, 500), games_per_run=10, buy_in=Decimal('1.00')):
+    service = EconomyService()
+    wager = CurrencyAmount(amount=buy_in, symbol=SYMBOL)
+    results = []
+    for players in player_counts:
+        # enough for every game to be lost by every player on both paths -- and for the per player path,
+        # which checks the balance against the amount even for winnings, to pay out a whole pot
+        user_ids = await setup(players, balance=buy_in * (games_per_run * 2 + players))
+        supply = await money_supply()
+        result = dict(players=players)
+        for name, settle in (('per_player', settle_per_player), ('batched', settle_batched)):
+            latencies = []
+            for game_id in range(games_per_run):
+                outcomes = random_outcomes(user_ids, buy_in)
+                start = time.perf_counter()
+                await settle(service, game_id, wager, outcomes)
+                latencies.append(time.perf_counter() - start)
+            result[name] = summarize(latencies)
+        result['conserved'] = await money_supply() == supply
+        results.append(result)
+    await db.engine.dispose()
+    return results
@@ -0,0 +1,54 @@
+"""Startup profiling.
+
+Runs the bot's startup in a subprocess with `python -X importtime` and parses the import timings.
+Optionally connects to discord and measures the time to the first `on_ready` (see `main.close_on_ready`).
+"""
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+
+PROJECT_PATH = Path(__file__).parent.parent
+
+# load every enabled extension like `run.py run` does, without connecting
+INIT_CODE = 'import main; main.init_extensions(); main.util.preload_templates()'
+READY_CODE = 'import main; main.close_on_ready = True; main.main()'
+
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output into a list of (module, self us, cumulative us) tuples."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        timings = line.split(':', 1)[1]
+        self_us, cumulative_us, name = timings.split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def by_package(modules):
+    """Sum self import time by top level package, slowest first."""
+    totals = defaultdict(int)
+    for name, self_us, _ in modules:
+        totals[name.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile(until_ready=False):
+    code = READY_CODE if until_ready else INIT_CODE
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=PROJECT_PATH, capture_output=True, text=True)
+    modules = parse_importtime(proc.stderr)
+    ready = None
+    for line in proc.stdout.splitlines():
+        if line.startswith('STARTUP_READY'):
+            ready = float(line.split()[1])
+    return dict(
+        returncode=proc.returncode,
+        stderr_tail='\n'.join(proc.stderr.splitlines()[-20:]),
+        total_import=sum(self_us for _, self_us, _ in modules),
+        packages=by_package(modules),
+        modules=sorted(modules, key=lambda m: m[2], reverse=True),
+        ready=ready,
+    )
@@ -0,0 +1,81 @@
+"""Compare SQLite storage profiles under a concurrent read and write workload.
+
+Each profile runs against its own scratch database file. Writers insert and update rows in short transactions
+and readers run aggregate queries at the same time, roughly like reward bursts during log views.
+"""
+import asyncio
+import random
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import db
+from benchmarks import summarize, remove_sqlite_files
+
+
+async def _writer(engine, ops, stats):
+    for _ in range(ops):
+        start = time.perf_counter()
+        try:
+            async with engine.begin() as conn:
+                k = random.randint(0, 99)
+                await conn.execute(text('INSERT INTO bench (k, v) VALUES (:k, :v)'), dict(k=k, v='x' * 64))
+                await conn.execute(text('UPDATE bench_total SET total = total + 1 WHERE k = :k'), dict(k=k))
+            stats['write'].append(time.perf_counter() - start)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            stats['locked'] += 1
+
+
+async def _reader(engine, ops, stats):
+    for _ in range(ops):
+        start = time.perf_counter()
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT k, count(*) FROM bench GROUP BY k'))
+                await conn.execute(text('SELECT sum(total) FROM bench_total'))
+            stats['read'].append(time.perf_counter() - start)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            stats['locked'] += 1
+
+
+async def run_profile(profile, path, readers=8, writers=4, ops=200):
+    remove_sqlite_files(path)
+    engine = db.create_db_engine(f'sqlite+aiosqlite:///{path}', profile=profile, echo=False)
+    async with engine.begin() as conn:
+        await conn.execute(text('CREATE TABLE bench (id INTEGER PRIMARY KEY, k INTEGER, v TEXT)'))
+        await conn.execute(text('CREATE TABLE bench_total (k INTEGER PRIMARY KEY, total INTEGER)'))
+        await conn.execute(text('INSERT INTO bench_total (k, total) VALUES ' + ', '.join(f'({k}, 0)' for k in range(100))))
+
+    stats = dict(read=[], write=[], locked=0)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[_writer(engine, ops, stats) for _ in range(writers)],
+        *[_reader(engine, ops, stats) for _ in range(readers)],
+    )
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    remove_sqlite_files(path)
+
+    return dict(
+        profile=profile,
+        elapsed=elapsed,
+        read=summarize(stats['read']),
+        write=summarize(stats['write']),
+        read_throughput=len(stats['read']) / elapsed,
+        write_throughput=len(stats['write']) / elapsed,
+        locked=stats['locked'],
+    )
+
+
+async def run(profiles, directory, readers=8, writers=4, ops=200):
+    results = []
+    for profile in profiles:
+        path = Path(directory) / f'bench_storage_{profile}.db'
+        results.append(await run_profile(profile, path, readers=readers, writers=writers, ops=ops))
+    return results
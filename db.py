@@ -1,15 +1,168 @@
-from sqlalchemy import Table, Column, Integer, ForeignKey, String, BigInteger
+import contextvars
+import importlib
+import importlib.util
+import logging
+import os
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from sqlalchemy import Table, Column, Integer, ForeignKey, String, BigInteger, JSON
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from sqlalchemy import create_engine
-from replit import db as replit_db
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.dialects import postgresql, sqlite
+
+import metrics, settings
+
+logger = logging.getLogger('db')
+
+
+# pragmas that need write access
+_WRITE_PRAGMAS = {'journal_mode', 'synchronous'}
+
+
+def apply_storage_profile(engine, profile=None, readonly=False):
+    """Set the SQLite pragmas in `settings.DB_STORAGE_PROFILES[profile]` on every new connection.
+
+    Read-only connections skip pragmas that need write access and set `query_only`.
+    No-op for other databases.
+    """
+    if engine.dialect.name != 'sqlite':
+        return engine
+    pragmas = settings.DB_STORAGE_PROFILES[profile or settings.DB_STORAGE_PROFILE]
+    if readonly:
+        pragmas = {name: value for name, value in pragmas.items() if name not in _WRITE_PRAGMAS}
+        pragmas['query_only'] = 'ON'
+    # async engines proxy a sync engine which emits the pool events
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    return engine
+
+
+#
+# Query stats per command
+
+@dataclass
+class QueryStats:
+    """Statements executed on behalf of one command invocation. Collected while set in `query_stats`."""
+    command: str
+    statements: int = 0
+    elapsed: float = 0.0
+    # rows changed by INSERT/UPDATE/DELETE -- the DBAPI has no row count for SELECT, fetched rows aren't counted
+    affected_rows: int = 0
+    # statement: executions -- the same SQL many times in one command is likely an N+1 loop
+    executions: Counter = field(default_factory=Counter)
+    # (elapsed, statement, parameters)
+    slow: list = field(default_factory=list)
+
+    def record(self, statement, elapsed, rowcount):
+        self.statements += 1
+        self.elapsed += elapsed
+        # -1 for SELECT and other statements without a row count
+        self.affected_rows += max(rowcount, 0)
+        self.executions[statement] += 1
+
+    @property
+    def repeated(self):
+        """Statements executed at least `settings.DB_N_PLUS_ONE_THRESHOLD` times, most first."""
+        return [(statement, n) for statement, n in self.executions.most_common() if n >= settings.DB_N_PLUS_ONE_THRESHOLD]
+
+    def __str__(self):
+        return f'{self.command}: {self.statements} statements, {self.affected_rows} affected rows in {self.elapsed * 1000:.1f}ms'
+
+
+# set by `BaseCog` for the duration of a command
+query_stats = contextvars.ContextVar('query_stats', default=None)
+# finished commands, newest last -- see the `debug queries` admin command
+recent_query_stats = deque(maxlen=settings.DB_QUERY_STATS_HISTORY)
+
+
+def start_query_stats(command):
+    """Attribute statements in the current context to `command`. Returns a token for `finish_query_stats`."""
+    return query_stats.set(QueryStats(command))
+
+
+def finish_query_stats(token):
+    """Stop collecting, keep the stats in `recent_query_stats` and warn about likely N+1 queries."""
+    stats = query_stats.get()
+    query_stats.reset(token)
+    if stats is None or not stats.statements:
+        return stats
+    recent_query_stats.append(stats)
+    for statement, n in stats.repeated:
+        logger.warning(f'Likely N+1 query in {stats.command}: executed {n} times: {shorten_sql(statement)}')
+    return stats
+
+
+def shorten_sql(value, limit=500):
+    """Statement or parameters on one line, cut at `limit` characters."""
+    value = ' '.join(str(value).split())
+    return value if len(value) <= limit else f'{value[:limit]}...'
+
+
+def instrument_engine(engine, name):
+    """Count and time every statement executed by the engine.
+
+    Statements go to `metrics.DB_QUERIES` and `metrics.DB_QUERY_DURATION`, and to the active command's `QueryStats`.
+    Statements slower than `settings.DB_SLOW_QUERY_SECONDS` are logged with their parameters.
+    """
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        # select, insert, pragma, ...
+        statement_type = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+        metrics.DB_QUERIES.inc(engine=name, statement=statement_type)
+        metrics.DB_QUERY_DURATION.observe(elapsed, engine=name, statement=statement_type)
+
+        stats = query_stats.get()
+        if stats is not None:
+            stats.record(statement, elapsed, cursor.rowcount)
+        if elapsed >= settings.DB_SLOW_QUERY_SECONDS:
+            command = stats.command if stats is not None else '-'
+            logger.warning(f'Slow query ({elapsed * 1000:.0f}ms, {name}) in {command}: {shorten_sql(statement)} {shorten_sql(parameters)}')
+            if stats is not None:
+                stats.slow.append((elapsed, statement, parameters))
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        # failed statements never reach after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+
+    return engine
+
+
+def create_db_engine(url, profile=None, readonly=False, **kwargs):
+    """Create an async engine with the project engine kwargs, storage profile and query metrics."""
+    engine_kwargs = dict(settings.DB_ENGINE_KWARGS, **kwargs)
+    engine = apply_storage_profile(create_async_engine(url, **engine_kwargs), profile, readonly=readonly)
+    return instrument_engine(engine, 'read' if readonly else 'write')
 
-import settings
 
 Base = declarative_base()
-engine = create_async_engine(settings.DB_URL, **settings.DB_ENGINE_KWARGS)
+engine = create_db_engine(settings.DB_URL)
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Read-only engine for reporting queries
+read_engine = create_db_engine(settings.DB_READ_URL, readonly=True, poolclass=AsyncAdaptedQueuePool, **settings.DB_READ_POOL_KWARGS)
+async_read_session = sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+
 
 class Guild(Base):
     __tablename__ = 'guild'
@@ -44,12 +197,108 @@ class Channel(Base):
         return f"Channel({self.name!r}, {self.discord_id!r})"
 
 
+class KeyValue(Base):
+    """Project level settings. Use through the cached `kv.store`."""
+    __tablename__ = 'kv'
+
+    key = Column(String, primary_key=True)
+    value = Column(JSON, nullable=True)
+
+    def __repr__(self):
+        return f"KeyValue({self.key!r}, {self.value!r})"
+
+
+def get_replit_db():
+    """Replit's key-value db. Only available on Replit -- imported on demand."""
+    from replit import db as replit_db
+    return replit_db
+
+
+def import_models(extensions=None):
+    """Import the `models` module of each enabled extension package so their tables are added to `Base.metadata`.
+
+    Only looks up module specs first so extensions without models (and their dependencies) are not imported.
+    """
+    if extensions is None:
+        extensions = settings.EXTENSIONS
+    for extension in extensions:
+        spec = importlib.util.find_spec(extension)
+        if spec is None or spec.submodule_search_locations is None:
+            # not a package
+            continue
+        if importlib.util.find_spec(f'{extension}.models') is None:
+            continue
+        importlib.import_module(f'{extension}.models')
+        logger.debug(f'Imported {extension}.models')
+
+
 def get_session():
     return sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
 
+# async driver -> sync driver
+SYNC_DRIVERS = {
+    'aiosqlite': 'pysqlite',
+    'asyncpg': 'psycopg2',
+}
+
+
 def get_sync_engine():
-    return create_engine(settings.DB_URL.replace('aiosqlite', 'pysqlite'), **settings.DB_ENGINE_KWARGS)
+    url = make_url(settings.DB_URL)
+    backend, _, driver = url.drivername.partition('+')
+    url = url.set(drivername=f'{backend}+{SYNC_DRIVERS.get(driver, driver)}')
+    # connect args are driver specific
+    engine_kwargs = {k: v for k, v in settings.DB_ENGINE_KWARGS.items() if k != 'connect_args'}
+    return apply_storage_profile(create_engine(url, **engine_kwargs))
+
+
+def supports_returning(bind):
+    """Whether `UPDATE ... RETURNING` can be used. (Not supported by sqlalchemy's sqlite dialect.)"""
+    return bind.dialect.name == 'postgresql'
+
+
+def upsert(dialect_name, table, values, index_elements, update_columns=None, set_=None):
+    """Dialect specific `INSERT ... ON CONFLICT` statement for sqlite and postgres.
+
+    Does nothing on conflict unless `update_columns` (set from the inserted values) or `set_` is given.
+    `set_` can also be a callable taking the `excluded` (i.e. inserted) columns e.g. to increment counters.
+
+    E.g.
+    ```
+    stmt = db.upsert(session.bind.dialect.name, User.__table__, dict(id=1, name='a'), ['id'], update_columns=['name'])
+    await session.execute(stmt)
+    ```
+    """
+    if dialect_name == 'postgresql':
+        insert = postgresql.insert
+    elif dialect_name == 'sqlite':
+        insert = sqlite.insert
+    else:
+        raise NotImplementedError(f'Upserts are not implemented for {dialect_name}')
+    stmt = insert(table).values(values)
+    if callable(set_):
+        set_ = set_(stmt.excluded)
+    if update_columns:
+        set_ = dict(set_ or {}, **{c: stmt.excluded[c] for c in update_columns})
+    if set_:
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    return stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+
+async def checkpoint_wal(mode='PASSIVE', engine=engine):
+    """Checkpoint the SQLite write-ahead log.
+
+    Returns a dict with the `PRAGMA wal_checkpoint` result and the size of the WAL file in bytes
+    or None if not using SQLite.
+    """
+    if engine.dialect.name != 'sqlite':
+        return None
+    async with engine.connect() as conn:
+        res = await conn.execute(text(f'PRAGMA wal_checkpoint({mode})'))
+        busy, log_frames, checkpointed_frames = res.one()
+    wal_path = f'{engine.url.database}-wal'
+    wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    return dict(busy=busy, log_frames=log_frames, checkpointed_frames=checkpointed_frames, wal_size=wal_size)
 
 
 def create_db():
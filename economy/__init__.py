@@ -1,8 +1,8 @@
 import asyncio
 
 from db import Base, engine
-from .cogs import Currency, Wallet, Gambling, Rewards, Exchange
-from .services import EconomyService
+# Cogs and services are imported on demand so importing `economy.models`
+# (e.g. from `run.py initdb`) doesn't load discord.py, numpy or the rewards DSL.
 
 
 async def _reflect():
@@ -12,6 +12,8 @@ async def _reflect():
 
 
 def setup(bot):
+    from .cogs import Currency, Wallet, Gambling, Rewards, Exchange
+
     # asyncio.run(_reflect())
     # Base.metadata.clear() # TODO
 
@@ -29,5 +31,6 @@ def setup(bot):
 
 
 def create_initial_currency():
+    from .services import EconomyService
     service = EconomyService()
     asyncio.run(service.create_initial_currencies())
\ No newline at end of file
@@ -0,0 +1,379 @@
+"""Ledger archival to compressed cold storage.
+
+Old rows of the ledger tables are moved out of the database into monthly gzip compressed JSON lines segment files:
+`<settings.LEDGER_ARCHIVE_PATH>/<table name>/<YYYY-MM>.jsonl.gz`
+
+Next to each segment a `<YYYY-MM>.index.json` file lists the user ids and currency symbols in it,
+so log queries for one user only open the months that user has archived rows in.
+
+Archived rows are summarized per user and currency in the `ledger_summary` table (see `models.LedgerSummary`)
+so balances stay verifiable. Log queries read the hot table first and top up with archived rows (see `with_archived`).
+
+Segment files are written before the DB transaction that deletes the rows is committed. If that transaction fails
+the rows are written again on the next run -- readers skip duplicate ids.
+"""
+import gzip
+import json
+import logging
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import delete
+from sqlalchemy.future import select
+
+import db, settings
+from economy import models
+
+
+logger = logging.getLogger('economy.archive')
+
+LEDGERS = {
+    'transaction': models.TransactionLog,
+    'reward_log': models.RewardLog,
+    'currency_exchange_transaction': models.CurrencyExchangeTransaction,
+}
+
+
+def parse_age(age_str):
+    """Parse ages like `90d` or `12w` into a timedelta."""
+    m = re.fullmatch(r'\s*(\d+)\s*([dw])\s*', age_str)
+    if m is None:
+        raise ValueError(f'Invalid age {age_str!r}. Use e.g. 90d or 12w.')
+    n, unit = int(m.group(1)), m.group(2)
+    return timedelta(days=n) if unit == 'd' else timedelta(weeks=n)
+
+
+#
+# Serialization
+
+def _name(user):
+    return user.name if user is not None else None
+
+
+def _symbol(currency):
+    return currency.symbol if currency is not None else None
+
+
+def _str(val):
+    return str(val) if val is not None else None
+
+
+def _decimal(val):
+    return Decimal(val) if val is not None else None
+
+
+def to_record(ledger, row):
+    """Serialize a ledger row to a JSON-able dict, denormalizing related user names and currency symbols."""
+    record = dict(
+        id=row.id,
+        user_id=row.user_id,
+        user_name=_name(row.user),
+        created=row.created.isoformat() if row.created else None,
+    )
+    if ledger == 'transaction':
+        record.update(
+            related_user_id=row.related_user_id,
+            related_user_name=_name(row.related_user),
+            currency_id=row.currency_id,
+            currency_symbol=_symbol(row.currency),
+            amount=_str(row.amount),
+            transaction_type=row.transaction_type,
+            note=row.note,
+        )
+    elif ledger == 'reward_log':
+        record.update(
+            currency_id=row.currency_id,
+            currency_symbol=_symbol(row.currency),
+            amount=_str(row.amount),
+            note=row.note,
+        )
+    else:
+        record.update(
+            bought_currency_id=row.bought_currency_id,
+            bought_currency_symbol=_symbol(row.bought_currency),
+            amount_bought=_str(row.amount_bought),
+            sold_currency_id=row.sold_currency_id,
+            sold_currency_symbol=_symbol(row.sold_currency),
+            amount_sold=_str(row.amount_sold),
+            exchange_rate=_str(row.exchange_rate),
+        )
+    return record
+
+
+def from_record(ledger, record):
+    """Deserialize a record into an object with the same attributes the log templates use on ORM rows."""
+    def user(user_id, name):
+        return SimpleNamespace(id=user_id, name=name) if user_id is not None else None
+
+    def currency(currency_id, symbol):
+        return SimpleNamespace(id=currency_id, symbol=symbol) if currency_id is not None else None
+
+    row = SimpleNamespace(
+        archived=True,
+        id=record['id'],
+        user_id=record['user_id'],
+        user=user(record['user_id'], record['user_name']),
+        created=datetime.fromisoformat(record['created']) if record['created'] else None,
+    )
+    if ledger == 'transaction':
+        row.related_user_id = record['related_user_id']
+        row.related_user = user(record['related_user_id'], record['related_user_name'])
+        row.currency_id = record['currency_id']
+        row.currency = currency(record['currency_id'], record['currency_symbol'])
+        row.amount = _decimal(record['amount'])
+        row.transaction_type = record['transaction_type']
+        row.note = record['note']
+    elif ledger == 'reward_log':
+        row.currency_id = record['currency_id']
+        row.currency = currency(record['currency_id'], record['currency_symbol'])
+        row.amount = _decimal(record['amount'])
+        row.note = record['note']
+    else:
+        row.bought_currency_id = record['bought_currency_id']
+        row.bought_currency = currency(record['bought_currency_id'], record['bought_currency_symbol'])
+        row.amount_bought = _decimal(record['amount_bought'])
+        row.sold_currency_id = record['sold_currency_id']
+        row.sold_currency = currency(record['sold_currency_id'], record['sold_currency_symbol'])
+        row.amount_sold = _decimal(record['amount_sold'])
+        row.exchange_rate = _decimal(record['exchange_rate'])
+    return row
+
+
+def balance_effects(ledger, row):
+    """Yields (user_id, currency_id, signed amount) tuples for a ledger row."""
+    if ledger == 'transaction':
+        amount = row.amount or Decimal(0)
+        if row.transaction_type == 'payment':
+            # payments are stored once with a positive amount
+            yield row.user_id, row.currency_id, -amount
+            yield row.related_user_id, row.currency_id, amount
+        else:
+            # withdrawals are already negative
+            yield row.user_id, row.currency_id, amount
+    elif ledger == 'reward_log':
+        yield row.user_id, row.currency_id, row.amount or Decimal(0)
+    else:
+        if row.bought_currency_id is not None:
+            yield row.user_id, row.bought_currency_id, row.amount_bought or Decimal(0)
+        if row.sold_currency_id is not None:
+            yield row.user_id, row.sold_currency_id, -(row.amount_sold or Decimal(0))
+
+
+#
+# Segment files
+
+def ledger_path(ledger):
+    return Path(settings.LEDGER_ARCHIVE_PATH) / ledger
+
+
+def segment_path(ledger, month):
+    return ledger_path(ledger) / f'{month}.jsonl.gz'
+
+
+def index_path(ledger, month):
+    return ledger_path(ledger) / f'{month}.index.json'
+
+
+def _record_symbols(ledger, record):
+    if ledger == 'currency_exchange_transaction':
+        return {record['bought_currency_symbol'], record['sold_currency_symbol']} - {None}
+    return {record['currency_symbol']} - {None}
+
+
+def _iter_records(segment):
+    """Stream the records of a segment file."""
+    with gzip.open(segment, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _write_index(ledger, month, user_ids, symbols):
+    index = dict(user_ids=sorted(user_ids), symbols=sorted(symbols))
+    index_path(ledger, month).write_text(json.dumps(index), encoding='utf-8')
+
+
+def segment_index(ledger, month):
+    """User ids and currency symbols in a segment as a dict of sets.
+
+    Rebuilt from the segment if the index file is missing or older than the segment,
+    e.g. if an archive run stopped between appending rows and updating the index.
+    """
+    segment, path = segment_path(ledger, month), index_path(ledger, month)
+    if path.exists() and path.stat().st_mtime >= segment.stat().st_mtime:
+        index = json.loads(path.read_text(encoding='utf-8'))
+        return dict(user_ids=set(index['user_ids']), symbols=set(index['symbols']))
+    user_ids, symbols = set(), set()
+    for record in _iter_records(segment):
+        user_ids.add(record['user_id'])
+        symbols |= _record_symbols(ledger, record)
+    _write_index(ledger, month, user_ids, symbols)
+    return dict(user_ids=user_ids, symbols=symbols)
+
+
+def write_segments(ledger, rows):
+    """Append rows to their monthly segment files and update the segment indexes."""
+    by_month = {}
+    for row in rows:
+        month = row.created.strftime('%Y-%m') if row.created else 'undated'
+        by_month.setdefault(month, []).append(row)
+    ledger_path(ledger).mkdir(parents=True, exist_ok=True)
+    for month, month_rows in by_month.items():
+        existing = segment_index(ledger, month) if segment_path(ledger, month).exists() else dict(user_ids=set(), symbols=set())
+        records = [to_record(ledger, row) for row in month_rows]
+        # appending adds a new gzip member -- readers see one stream
+        with gzip.open(segment_path(ledger, month), 'at', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        # written after the segment so it is never newer than rows it doesn't list
+        _write_index(
+            ledger, month,
+            existing['user_ids'] | {r['user_id'] for r in records},
+            existing['symbols'].union(*(_record_symbols(ledger, r) for r in records)),
+        )
+
+
+def _matches(ledger, record, user_ids=None, symbols=None):
+    if user_ids and record['user_id'] not in user_ids:
+        return False
+    if symbols and not _record_symbols(ledger, record).intersection(symbols):
+        return False
+    return True
+
+
+def _may_match(ledger, month, user_ids=None, symbols=None):
+    if not user_ids and not symbols:
+        return True
+    index = segment_index(ledger, month)
+    if user_ids and not index['user_ids'].intersection(user_ids):
+        return False
+    if symbols and not index['symbols'].intersection(symbols):
+        return False
+    return True
+
+
+def iter_archived(ledger, user_ids=None, symbols=None, newest_first=True):
+    """Yields archived rows (see `from_record`) in `created` order, optionally filtered by user ids and currency symbols.
+
+    Segments whose index has none of the users or symbols are not opened. Other segments are streamed
+    and only matching records are kept, so memory use is bounded by the matches of one month.
+    """
+    path = ledger_path(ledger)
+    if not path.is_dir():
+        return
+    seen = set()
+    for segment in sorted(path.glob('*.jsonl.gz'), reverse=newest_first):
+        month = segment.name[:-len('.jsonl.gz')]
+        if not _may_match(ledger, month, user_ids, symbols):
+            continue
+        records = [r for r in _iter_records(segment) if _matches(ledger, r, user_ids, symbols)]
+        records.sort(key=lambda r: (r['created'] or '', r['id']), reverse=newest_first)
+        for record in records:
+            if record['id'] in seen:
+                continue
+            seen.add(record['id'])
+            yield from_record(ledger, record)
+
+
+def with_archived(ledger, rows, user_ids=None, symbols=None, limit=None):
+    """Top up newest first hot table rows with archived rows until there are `limit` rows.
+
+    Archived rows are always older than rows still in the hot table.
+    """
+    rows = list(rows)
+    if limit is not None and len(rows) >= limit:
+        return rows
+    for row in iter_archived(ledger, user_ids, symbols):
+        rows.append(row)
+        if limit is not None and len(rows) >= limit:
+            break
+    return rows
+
+
+#
+# Jobs
+
+async def _update_summaries(session, ledger, rows):
+    totals = {}
+    for row in rows:
+        for user_id, currency_id, amount in balance_effects(ledger, row):
+            t = totals.setdefault((user_id, currency_id), dict(amount=Decimal(0), count=0, first=row.created, last=row.created))
+            t['amount'] += amount
+            t['count'] += 1
+            if row.created is not None:
+                t['first'] = min(t['first'], row.created) if t['first'] else row.created
+                t['last'] = max(t['last'], row.created) if t['last'] else row.created
+
+    user_ids = {user_id for user_id, _ in totals.keys()}
+    stmt = select(models.LedgerSummary).where(
+        models.LedgerSummary.ledger == ledger,
+        models.LedgerSummary.user_id.in_(user_ids)
+    )
+    res = await session.execute(stmt)
+    existing = {(s.user_id, s.currency_id): s for s in res.scalars().all()}
+
+    for key, t in totals.items():
+        summary = existing.get(key)
+        if summary is None:
+            user_id, currency_id = key
+            summary = models.LedgerSummary(ledger=ledger, user_id=user_id, currency_id=currency_id, amount=Decimal(0), count=0)
+            session.add(summary)
+        summary.amount += t['amount']
+        summary.count += t['count']
+        if t['first'] is not None and (summary.first_created is None or t['first'] < summary.first_created):
+            summary.first_created = t['first']
+        if t['last'] is not None and (summary.last_created is None or t['last'] > summary.last_created):
+            summary.last_created = t['last']
+
+
+async def archive_ledger(ledger, older_than: datetime, batch_size=1000, async_session=None):
+    """Move rows created before `older_than` from a ledger table to segment files. Returns the number of rows moved."""
+    if async_session is None:
+        async_session = db.async_session
+    model = LEDGERS[ledger]
+    total = 0
+    while True:
+        async with async_session() as session, session.begin():
+            stmt = select(model).where(model.created < older_than).order_by(model.id).limit(batch_size)
+            res = await session.execute(stmt)
+            rows = res.scalars().all()
+            if not rows:
+                break
+            write_segments(ledger, rows)
+            await _update_summaries(session, ledger, rows)
+            await session.execute(delete(model).where(model.id.in_([row.id for row in rows])))
+        total += len(rows)
+        logger.info(f'Archived {total} rows from {ledger}')
+    return total
+
+
+async def export_ledger(ledger, fp, batch_size=1000, async_session=None):
+    """Write all archived and hot rows of a ledger to a text file object as JSON lines, oldest first.
+
+    Returns the number of rows written.
+    """
+    if async_session is None:
+        async_session = db.async_session
+    model = LEDGERS[ledger]
+    count = 0
+    for row in iter_archived(ledger, newest_first=False):
+        record = to_record(ledger, row)
+        record['archived'] = True
+        fp.write(json.dumps(record) + '\n')
+        count += 1
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            stmt = select(model).where(model.id > last_id).order_by(model.id).limit(batch_size)
+            res = await session.execute(stmt)
+            rows = res.scalars().all()
+        if not rows:
+            break
+        for row in rows:
+            fp.write(json.dumps(to_record(ledger, row)) + '\n')
+        count += len(rows)
+        last_id = rows[-1].id
+    return count
@@ -1,3 +1,4 @@
+import db
 from base import BaseCog
 from economy.services import EconomyService
 
@@ -9,7 +10,13 @@ class BaseEconomyCog(BaseCog):
         if service_cls is None:
             service_cls = EconomyService
         self._service = service_cls()
+        # reporting queries go through the read-only engine
+        self._report_service = service_cls(async_session=db.async_read_session)
 
     @property
     def service(self):
         return self._service
+
+    @property
+    def report_service(self):
+        return self._report_service
@@ -1,3 +1,4 @@
+import logging
 import typing
 
 import discord
@@ -13,6 +14,9 @@ from util import render_template
 from economy.parsers import CURRENCY_SPEC_DESC
 
 
+logger = logging.getLogger('economy.currency')
+
+
 class Currency(BaseEconomyCog, name='Economy.Currency',
                description='Economy: Manage Virtual Currencies. Bot owner only.'):
     @commands.group(
@@ -32,8 +36,8 @@ class Currency(BaseEconomyCog, name='Economy.Currency',
     )
     async def list(self, ctx, brief: typing.Optional[bool] = False):
         # query currencies and denominations
-        find_all = self.service.get_all_currencies()
-        currencies = await self.service.await_with(find_all)
+        find_all = self.report_service.get_all_currencies()
+        currencies = await self.report_service.await_with(find_all)
 
         # if no currencies, send empty message and help on how to add one
         if len(currencies) == 0:
@@ -44,8 +48,7 @@ class Currency(BaseEconomyCog, name='Economy.Currency',
         if brief:
             # Brief list
             data = dict(title='Currencies:', object_list=currencies)
-            text = await render_template('currency_list.txt.jinja2', data)
-            await ctx.reply(text)
+            await self.reply_paginated(ctx, 'currency_list.txt.jinja2', data)
         else:
             # embed currency details
             embed = discord.Embed(title='Currencies:')
@@ -156,18 +159,18 @@ class Currency(BaseEconomyCog, name='Economy.Currency',
         if set_default == 'set_channel':
             # set for channels
             for c in channels:
-                util.set_default_channel_currency(c.id, symbol)
+                await util.set_default_channel_currency(c.id, symbol)
             chs = [f'#{c.name}' for c in channels]
             await ctx.reply(f'Set default channel currency to {currency.name} {symbol} for {chs}')
             return
         elif set_default == 'set_guild':
             # set for guild
-            util.set_default_guild_currency(symbol)
+            await util.set_default_guild_currency(symbol)
             await ctx.reply(f'Set default guild currency to {currency.name} {symbol}')
             return
         else:
             # display defaults
-            gd = util.get_default_guild_currency()
+            gd = await util.get_default_guild_currency()
             gd = gd if gd is not None else 'None'
             embed = {
                 'title': 'Default Currencies',
@@ -175,7 +178,7 @@ class Currency(BaseEconomyCog, name='Economy.Currency',
                 'fields': []
             }
             for c in channels:
-                s = util.get_default_channel_currency(c.id)
+                s = await util.get_default_channel_currency(c.id)
                 s = s if s is not None else 'None'
                 embed['fields'].append(dict(name=c.name, value=s))
             await ctx.reply(embed=discord.Embed.from_dict(embed))
@@ -190,10 +193,9 @@ class Currency(BaseEconomyCog, name='Economy.Currency',
         embed = discord.Embed(title='Economy Status')
 
         await ctx.reply('Generating...')
-        async with ctx.typing(), self.service:
-            summary = await self.service.currency_repo.get_economy_status()
-            
-            print(summary)
+        async with ctx.typing(), self.report_service:
+            summary = await self.report_service.currency_repo.get_economy_status()
+            logger.debug(f'Economy status: {summary}')
             for n, v in summary.items():
                 embed.add_field(name=n, value=v)
         
@@ -1,5 +1,5 @@
 import typing
-from decimal import Decimal
+from decimal import Decimal, ROUND_DOWN
 
 import discord
 from discord.ext import commands
@@ -10,10 +10,14 @@ from .base import BaseEconomyCog
 import settings
 
 
+# converted amounts are rounded down to what a balance can hold
+CENTS = Decimal('0.01')
+
 
 class Exchange(BaseEconomyCog, name="Economy.Exchange", description='Economy: Currency Exchange Markets.'):
 
     async def cog_before_invoke(self, ctx):
+        await super().cog_before_invoke(ctx)
         # make sure user has wallet
         await self.service.get_or_create_wallet(ctx.author.id, ctx.author)
 
@@ -150,7 +154,7 @@ class Exchange(BaseEconomyCog, name="Economy.Exchange", description='Economy: Cu
         # await self.debug(ctx, str(rate))
         # await self.debug(ctx, f'final rate {final_rate}')
 
-        intermediate_converted_amount = Decimal(final_rate) * currency_amount.amount
+        intermediate_converted_amount = (Decimal(final_rate) * currency_amount.amount).quantize(CENTS, rounding=ROUND_DOWN)
         # also get the base currency
         base_currency = await self.service.get_base_currency()
         intermediate_currency_amount = dataclasses.CurrencyAmount(
@@ -176,7 +180,7 @@ class Exchange(BaseEconomyCog, name="Economy.Exchange", description='Economy: Cu
             #         => A = x/y B
             final_rate = rate.exchange_rate / to_rate.exchange_rate
 
-            final_converted_amount = Decimal(final_rate) * currency_amount.amount
+            final_converted_amount = (Decimal(final_rate) * currency_amount.amount).quantize(CENTS, rounding=ROUND_DOWN)
             to_currency = to_rate.exchanged_currency
             final_currency_amount = dataclasses.CurrencyAmount(
                 amount=final_converted_amount, currency=to_currency,
@@ -1,9 +1,9 @@
-import random
 import typing
+import logging
 import numpy as np
 import asyncio
+from datetime import datetime, timedelta
 from decimal import Decimal
-from collections import defaultdict
 
 
 import discord
@@ -12,26 +12,37 @@ from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from sqlalchemy import exc
 
-import db
+import db, executors, settings
 from .base import BaseEconomyCog
 from util import render_template
-from economy import models, util, dataclasses
+from economy import models, util, dataclasses, games, game_sessions, simulation
+from economy import exc as econ_exc
+from economy.rng import game_rng, GAMES
+from economy.game_sessions import GameSessionManager, GameState
 from economy.parsers import CURRENCY_SPEC_DESC, CurrencySpecParser, CurrencyAmountParser
 
 
+logger = logging.getLogger('economy.gambling')
+
 
  # Util
 def cointoss():
-    return random.randint(0, 1)
+    return game_rng.draw('cointoss')
 
 def n_coinflips(n):
-    return np.random.randint(0, 2, n)
+    return game_rng.draw_n('cointoss', n)
 
 def dice():
-    return random.randint(1, 6)
+    return game_rng.draw('dice')
 
 def n_die(n):
-    return np.random.randint(1, 7, n)
+    return game_rng.draw_n('dice', n)
+
+def rng_note(game, position, n=1, epoch=None):
+    """Reference to the outcomes used by a game, for `GameRNG.replay`. `game@epoch#position+n`, current epoch by default."""
+    if epoch is None:
+        epoch = game_rng.epoch
+    return f'rng {game}@{epoch}#{position}' + (f'+{n}' if n > 1 else '')
 
 def get_msg_embed(correct, guess, answer, amount):
     t = 'Congratulations!' if correct else f'Sorry.'
@@ -42,12 +53,49 @@ def get_msg_embed(correct, guess, answer, amount):
     e.add_field(name='Actual Answer', value=str(answer))
     return e
 
+def parse_coin_guess(guess):
+    try:
+        return games.parse_coin_guess(guess)
+    except ValueError as e:
+        raise commands.BadArgument(str(e))
+
+def check_batch_count(count):
+    if not 1 <= count <= settings.GAMBLING_MAX_BATCH:
+        raise commands.BadArgument(f'Number of rounds must be between 1 and {settings.GAMBLING_MAX_BATCH}.')
+
+def get_batch_embed(title, count, wins, net_amount: dataclasses.CurrencyAmount):
+    t = f'{title}: {count} rounds'
+    if net_amount.amount > 0:
+        d = f'You won {net_amount} in total!'
+    elif net_amount.amount < 0:
+        d = f'You lost {dataclasses.CurrencyAmount.copy(net_amount, amount=-net_amount.amount)} in total.'
+    else:
+        d = 'You broke even.'
+    e = discord.Embed(title=t, description=d)
+    e.add_field(name='Won', value=str(wins))
+    e.add_field(name='Lost', value=str(count - wins))
+    return e
+
 async def timeout_after(after=120):
     await asyncio.sleep(after)
     raise asyncio.TimeoutError(f'Timeout after: {after}')
 
 
 class Gambling(BaseEconomyCog, name='Economy.Gambling'):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # interactive games waiting for replies
+        self.game_sessions = GameSessionManager()
+        # games left open by a restart are recovered once
+        self.recovered = False
+        self.resumed_games = set()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        if message.author.bot:
+            return
+        self.game_sessions.route(message)
+
     # helper
     async def tick(self, ctx=None, correct=False, message=None, check='\N{WHITE HEAVY CHECK MARK}', cross='\N{CROSS MARK}'):
         emoji = check if correct else cross
@@ -61,6 +109,9 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
         
     # everything here needs a wallet
     async def cog_before_invoke(self, ctx):
+        await super().cog_before_invoke(ctx)
+        # no-op once restored
+        await game_rng.restore()
         ctx.wallet = await self.service.get_or_create_wallet(ctx.author.id, ctx.author)
 
     @commands.command(
@@ -76,25 +127,90 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
         usage='<Heads or tails> <currency_amount>'
     )
     async def cointoss(self, ctx, guess: str, *, currency_str: str):
+        guess = parse_coin_guess(guess)
         currency_amount = await self.service.currency_amount_from_str(currency_str)
 
-        guess = guess.lower().strip()
-        if guess in ['head', 'heads', 'h']:
-            guess = 0
-        elif guess in ['tail', 'tails', 't']:
-            guess = 1
+        position = game_rng.position('cointoss')
         ans = cointoss()
         correct = guess == ans
 
-        await self.service.complete_gambling_transaction(user=ctx.author, currency_amount=currency_amount, won=correct, note='Game: Cointoss')
+        await self.service.complete_gambling_transaction(user=ctx.author, currency_amount=currency_amount, won=correct, note=f'Game: Cointoss ({rng_note("cointoss", position)})')
 
-        guess_str = 'heads' if guess == 0 else 'tails'
-        ans_str = 'heads' if ans == 0 else 'tails'
+        guess_str = 'heads' if guess == games.HEADS else 'tails'
+        ans_str = 'heads' if ans == games.HEADS else 'tails'
         await self.tick(ctx, correct)
         me = get_msg_embed(correct, guess_str, ans_str, currency_amount)
         await ctx.reply(embed=me)
 
     
+    @commands.command(
+        name='cointoss_n',
+        help='''Gamble on many coin flips at once.
+
+        Same odds as cointoss but all rounds are settled together as a single transaction for the net amount.
+        You need to be able to afford losing every round.
+
+        Arguments (ignores case):
+        Count: Number of flips
+        Guess: One of {head, heads, h} or {tail, tails, t}
+        Currency amount per flip e.g. 1BPY
+        ''',
+        usage='<count> <Heads or tails> <currency_amount>'
+    )
+    async def cointoss_n(self, ctx, count: int, guess: str, *, currency_str: str):
+        check_batch_count(count)
+        currency_amount = await self.service.currency_amount_from_str(currency_str)
+        guess = parse_coin_guess(guess)
+
+        position = game_rng.position('cointoss')
+        flips = n_coinflips(count)
+        payouts = games.cointoss_payouts(guess, flips)
+        wins = int(np.count_nonzero(payouts > 0))
+        net_amount = dataclasses.CurrencyAmount.copy(currency_amount, amount=currency_amount.amount * int(payouts.sum()))
+
+        await self.service.complete_gambling_batch(user=ctx.author, wager=currency_amount, rounds=count, net_amount=net_amount.amount, note=f'Game: Cointoss ({rng_note("cointoss", position, count)})')
+
+        heads = int(np.count_nonzero(flips == 0))
+        await self.tick(ctx, net_amount.amount >= 0)
+        me = get_batch_embed('Cointoss', count, wins, net_amount)
+        me.add_field(name='Heads / Tails', value=f'{heads} / {count - heads}')
+        await ctx.reply(embed=me)
+
+    @commands.command(
+        name='dice_n',
+        help='''Gamble on many dice rolls at once.
+
+        Guess the number a six-sided die lands on. Each correct guess wins 5 times the amount at 1:5 odds -- fair game.
+        All rounds are settled together as a single transaction for the net amount.
+        You need to be able to afford losing every round.
+
+        Arguments:
+        Count: Number of rolls
+        Guess: A number between 1-6
+        Currency amount per roll e.g. 1BPY
+        ''',
+        usage='<count> <guess> <currency_amount>'
+    )
+    async def dice_n(self, ctx, count: int, guess: int, *, currency_str: str):
+        check_batch_count(count)
+        if not 1 <= guess <= 6:
+            raise commands.BadArgument('Guess must be a number between 1 and 6.')
+        currency_amount = await self.service.currency_amount_from_str(currency_str)
+
+        position = game_rng.position('dice')
+        rolls = n_die(count)
+        payouts = games.dice_payouts(guess, rolls)
+        wins = int(np.count_nonzero(payouts > 0))
+        net_amount = dataclasses.CurrencyAmount.copy(currency_amount, amount=currency_amount.amount * int(payouts.sum()))
+
+        await self.service.complete_gambling_batch(user=ctx.author, wager=currency_amount, rounds=count, net_amount=net_amount.amount, note=f'Game: Dice ({rng_note("dice", position, count)})')
+
+        counts = np.bincount(rolls, minlength=7)[1:]
+        await self.tick(ctx, net_amount.amount >= 0)
+        me = get_batch_embed('Dice', count, wins, net_amount)
+        me.add_field(name='Rolls', value=' '.join(f'{face}: {n}' for face, n in enumerate(counts, start=1)), inline=False)
+        await ctx.reply(embed=me)
+
     @commands.command(
         help='''Single-player interactive game. Wager on a multiple attempt guessing game.
         
@@ -106,56 +222,71 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
     )
     async def guess_hilo(self, ctx, *, currency_str: str):
         currency_amount = await self.service.currency_amount_from_str(currency_str)
-        pot_amount = dataclasses.CurrencyAmount.copy(currency_amount,amount=currency_amount.amount*2)
+        pot_amount = dataclasses.CurrencyAmount.copy(currency_amount, amount=currency_amount.amount * Decimal(games.hilo_pot(0)))
 
         embed = discord.Embed(title='Guess a number between 1-99', description='Reply to this message with your guess.')
         embed.add_field(name='Your bet', value=currency_str)
-        embed.add_field(name='Attempts left', value=5)
+        embed.add_field(name='Attempts left', value=games.HILO_MAX_GUESSES)
         embed.add_field(name='Pot', value=pot_amount)
         
         reply_to_msg = await ctx.reply(embed=embed)
 
-        answer = random.randint(1, 99)
-        attempts = 0
+        position = game_rng.position('guess_hilo')
+        state = GameState(
+            id=reply_to_msg.id, game='guess_hilo', channel_id=ctx.channel.id, user_id=ctx.author.id, reply_to_id=reply_to_msg.id,
+            symbol=currency_amount.symbol, amount=currency_amount.amount, answer=game_rng.draw('guess_hilo'), rng_position=position, rng_epoch=game_rng.epoch,
+        )
+        await self.service.checkpoint_games(state)
+        await self.play_hilo(state, currency_amount, reply_to_msg)
+
+    async def play_hilo(self, state: GameState, currency_amount: dataclasses.CurrencyAmount, reply_to_msg):
+        """Take guesses until the game is over. Continues from `state.attempts` if the game is resumed."""
+        answer = state.answer
+        pot_amount = dataclasses.CurrencyAmount.copy(currency_amount, amount=currency_amount.amount * Decimal(games.hilo_pot(state.attempts)))
         guess = 0
         won = False
-        hilo = ''
-        
-        while guess != answer:
-
-            def is_correct(m):
-                return m.author == ctx.message.author and m.content.isdigit() and m.reference and m.reference.message_id == reply_to_msg.id  
-
-            try:
-                guess_msg = await self.bot.wait_for('message', check=is_correct, timeout=120.0)
-            except asyncio.TimeoutError:
-                return await self.reply_embed('Error', f'Sorry, you took too long. The answer is {answer}')
-                won = False
-                break
-            attempts += 1
-
-            # guess is a message
-            guess = int(guess_msg.content)
-            if guess == answer:
-                won = True
-                break
-            elif guess < answer:
-                hilo = 'too low'
-            else:
-                hilo = 'too high'
-            
-            if attempts > 4:
-                won = False
-                break
-
-            pot_amount.amount -=  Decimal(0.125) * currency_amount.amount
-
-            embed = discord.Embed(title=f'Your guess is {hilo}', description=f'**{hilo.upper()}**\nReply to this message with your new guess.')
-            embed.add_field(name='Your bet', value=currency_str)
-            embed.add_field(name='Attempts left', value=str(5 - attempts))
-            embed.add_field(name='New Pot', value=pot_amount)
         
-            reply_to_msg = await ctx.reply(embed=embed)
+        def is_correct(m):
+            return m.author.id == state.user_id and m.content.isdigit()
+
+        with self.game_sessions.open(reply_to_msg.id, check=is_correct) as session:
+            while guess != answer:
+                try:
+                    guess_msg = await session.next(timeout=120.0)
+                except asyncio.TimeoutError:
+                    state.status = game_sessions.CANCELLED
+                    await self.service.checkpoint_games(state)
+                    # a message works as the reply target too
+                    return await self.reply_embed(reply_to_msg, 'Error', f'Sorry, you took too long. The answer is {answer}')
+                state.attempts += 1
+
+                # guess is a message
+                guess = int(guess_msg.content)
+                if guess == answer:
+                    won = True
+                    break
+                hilo = games.hilo_hint(guess, answer)
+
+                if state.attempts >= games.HILO_MAX_GUESSES:
+                    won = False
+                    break
+
+                pot_amount.amount = currency_amount.amount * Decimal(games.hilo_pot(state.attempts))
+
+                embed = discord.Embed(title=f'Your guess is {hilo}', description=f'**{hilo.upper()}**\nReply to this message with your new guess.')
+                embed.add_field(name='Your bet', value=f'{currency_amount}')
+                embed.add_field(name='Attempts left', value=str(games.HILO_MAX_GUESSES - state.attempts))
+                embed.add_field(name='New Pot', value=pot_amount)
+
+                reply_to_msg = await guess_msg.reply(embed=embed)
+                # guesses reply to the latest message
+                session.move(reply_to_msg.id)
+                state.reply_to_id = reply_to_msg.id
+                await self.service.checkpoint_games(state)
+
+        # game over before settling so a restart never settles it twice
+        state.status = game_sessions.SETTLED
+        await self.service.checkpoint_games(state)
         
         # change balance
         if won:
@@ -167,11 +298,11 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
             # lose bet amount
             update_amount = currency_amount
             amount = currency_amount
-        await self.service.complete_gambling_transaction(user=ctx.author, currency_amount=update_amount, won=won, note='Game: Guess High-Low')
+        await self.service.complete_gambling_transaction(user=guess_msg.author, currency_amount=update_amount, won=won, note=f'Game: Guess High-Low ({rng_note("guess_hilo", state.rng_position, epoch=state.rng_epoch)})')
 
         # tick on last guess
         await self.tick(message=guess_msg, correct=won)
-        me = get_msg_embed(won, answer, amount)
+        me = get_msg_embed(won, guess, answer, amount)
         await guess_msg.reply(embed=me)
   
     @commands.command(
@@ -185,10 +316,11 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
     async def guess_1p(self, ctx, guess: int, *, currency_str: str):
         currency_amount = await self.service.currency_amount_from_str(currency_str)
 
-        ans = random.randint(1, 9)
+        position = game_rng.position('guess_1p')
+        ans = game_rng.draw('guess_1p')
         correct = guess == ans
 
-        await self.service.complete_gambling_transaction(user=ctx.author, currency_amount=currency_amount, won=correct, note='Game: Cointoss')
+        await self.service.complete_gambling_transaction(user=ctx.author, currency_amount=currency_amount, won=correct, note=f'Game: Guess ({rng_note("guess_1p", position)})')
 
         await self.tick(ctx, correct)
         me = get_msg_embed(correct, guess, ans, currency_amount)
@@ -213,43 +345,51 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
         embed = discord.Embed(title='Guess a number between 1-99', description='Reply to this message with your guess to join the game.')
         embed.add_field(name='Buy in amount', value=str(buy_in_amount), inline=False)
 
-        creator = ctx.author
-        
         reply_to_msg = await ctx.reply('Betting over in 30s after last reply.', embed=embed)
 
-        answer = random.randint(1, 99)
-        players = {
-            ctx.author.id: {
-                'user': ctx.author,
-                'guess': None
-            }
-        }
+        position = game_rng.position('guess_multi')
+        state = GameState(
+            id=reply_to_msg.id, game='guess_multi', channel_id=ctx.channel.id, user_id=ctx.author.id, reply_to_id=reply_to_msg.id,
+            symbol=buy_in_amount.symbol, amount=buy_in_amount.amount, answer=game_rng.draw('guess_multi'), rng_position=position, rng_epoch=game_rng.epoch,
+            players={ctx.author.id: None},
+        )
+        await self.service.checkpoint_games(state)
+        await self.play_multi(state, buy_in_amount, reply_to_msg, users={ctx.author.id: ctx.author})
+
+    async def play_multi(self, state: GameState, buy_in_amount: dataclasses.CurrencyAmount, reply_to_msg, users):
+        """Take guesses until betting closes, then settle the game.
+
+        `users` maps the ids of players who joined so far to discord users.
+        """
+        answer = state.answer
         winners = []
-        closest = defaultdict(list)
 
         def is_valid(m):
-            return m.content.isdigit() and m.reference and m.reference.message_id == reply_to_msg.id  
+            return m.content.isdigit()
 
         try:
             # take guesses
-            while True:
-                guess_msg = await self.bot.wait_for('message', check=is_valid, timeout=30.0)
-                # acknowledge guess
-                await self.tick(message=guess_msg, correct=True)
-                guess_num = int(guess_msg.content)
-
-                if guess_msg.author == creator:
-                    players[creator.id]['guess'] = guess_num
-                else:
-                    u = guess_msg.author
-                    players[u.id] = {
-                        'user': u,
-                        'guess': guess_num
-                    }
+            with self.game_sessions.open(reply_to_msg.id, check=is_valid) as session:
+                while True:
+                    guess_msg = await session.next(timeout=30.0)
+                    # acknowledge guess
+                    await self.tick(message=guess_msg, correct=True)
+                    users[guess_msg.author.id] = guess_msg.author
+                    state.players[guess_msg.author.id] = int(guess_msg.content)
+                    await self.service.checkpoint_games(state)
         except asyncio.TimeoutError as e:
             # print(f'timeout error {e}')
             await reply_to_msg.reply('Betting is now closed. Processing winners...')
 
+        players = {
+            player_id: {
+                'user': users[player_id],
+                'guess': guess
+            }
+            for player_id, guess in state.players.items()
+        }
+        creator = users[state.user_id]
+
         # DEBUG
         # simulate player guesses for testing with a single user
         # class FakeUser:
@@ -270,7 +410,9 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
 
         if len(players) == 1 and players[creator.id]['guess'] is not None:
             # only game creator played
-            await reply_to_msg.reply(f'{ctx.author.display_name} won by forfeit!')
+            state.status = game_sessions.CANCELLED
+            await self.service.checkpoint_games(state)
+            await reply_to_msg.reply(f'{creator.display_name} won by forfeit!')
             return
         
         embed_dict = {
@@ -279,43 +421,38 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
         desc = ''
         pot_amount = dataclasses.CurrencyAmount.copy(buy_in_amount, amount=Decimal(0))
         split_amount = dataclasses.CurrencyAmount.copy(buy_in_amount, amount=Decimal(0))
+        playing = []
 
-        for player_id, guess_dict in players.items():
+        # first check they can afford the bet
+        guessed = {player_id: guess_dict for player_id, guess_dict in players.items() if guess_dict['guess'] is not None}
+        affordable = await self.service.find_affordable(guessed.keys(), buy_in_amount)
+        for player_id, guess_dict in guessed.items():
             player = guess_dict['user']
             guess = guess_dict['guess']
-            if guess is None:
-                continue
-            # first check they can afford the bet
-            # Note: comment 4 lines if debugging with fake players
-            has_balance = self.service.has_balance(user=player, currency_amount=buy_in_amount)
-            if not has_balance:
+            if player_id not in affordable:
                 embed_dict['fields'].append(dict(name=player.display_name, value='Forfeited because they cannot afford the buy in.'))
                 continue
             pot_amount.amount += buy_in_amount.amount
             embed_dict['fields'].append(dict(name=player.display_name, value=f'Guessed: {guess}', inline=True))
-            if guess == answer:
-                winners.append(player)
-            elif guess:
-                closest[abs(guess - answer)].append(player)
+            playing.append((player, guess))
 
-        if len(winners) == 0:
+        if len(playing) == 0:
+            # noone guessed
+            state.status = game_sessions.CANCELLED
+            await self.service.checkpoint_games(state)
+            await self.reply_embed(reply_to_msg, 'Error', '**No one made a a guess.**\n The game has been cancelled.')
+            return
+        won = games.multi_winners([guess for _, guess in playing], answer)
+        winners = [player for (player, _), w in zip(playing, won) if w]
+        if answer not in [guess for _, guess in playing]:
             desc = 'No one guessed accurately. Closest guesses win!\n'
-            keys = closest.keys()
-            if len(keys) == 0:
-                # noone guessed
-                await self.reply_embed(ctx, 'Error', '**No one made a a guess.**\n The game has been cancelled.')
-                return
-            closest_dist = min(keys)
-            winners = closest[closest_dist]
-        
-        deposit_amount = pot_amount
+
+        shares = games.split_pot(pot_amount.amount, len(winners))
         if len(winners) > 1:
-            split_amount.amount = pot_amount.amount / Decimal(len(winners))
-            deposit_amount = split_amount
+            split_amount.amount = shares[-1]
             desc += f'\nThere are {len(winners)} winners.\n\nPot split **{len(winners)} ways**. Each gets {split_amount}'
             winners_str = ', '.join(u.display_name for u in winners)
         else:
-            deposit_amount = pot_amount
             desc += f'{winners[0].display_name} wins {pot_amount}!'
             winners_str = winners[0].display_name
         
@@ -323,21 +460,107 @@ class Gambling(BaseEconomyCog, name='Economy.Gambling'):
         embed_dict['fields'].append(dict(name='Total Pot', value=str(pot_amount), inline=False))
         embed_dict['fields'].append(dict(name='Winners:', value=winners_str,inline=False))
 
-        # Deposit winnings/withdra1 bet amount
-        # first subtract buy in amount from winnings
-        deposit_amount.amount = deposit_amount.amount - buy_in_amount.amount
-        # create winners set so membership check is O(1)
-        winners_set = set(w.id for w in winners)
-        for player_id, guess_dict in players.items():
-            player = guess_dict['user']
-            # sub buy in if lost
-            # add (pot / num_winners) - buy win if won
-            won = player_id in winners_set
-            amount = deposit_amount if won else buy_in_amount
-            # await ctx.reply(f'simulate amount tran {"+" if won else "-"} {amount} to {player}')
-            # Note: uncomment above and comment next line if debugging with fake players
-            await self.service.complete_gambling_transaction(user=player, currency_amount=amount, note='Game: Multiplayer Guess Game (Single Round)', won=won)
+        # Deposit winnings/withdraw bet amount for all players at once
+        # losers lose the buy in, winners get their share of the pot minus the buy in
+        outcomes = {player.id: -buy_in_amount.amount for player, _ in playing}
+        for winner, share in zip(winners, shares):
+            outcomes[winner.id] = share - buy_in_amount.amount
+        # the game is closed in the same transaction
+        state.status = game_sessions.SETTLED
+        try:
+            await self.service.settle_game(state.id, buy_in_amount, outcomes, note=f'Game: Multiplayer Guess Game (Single Round) ({rng_note("guess_multi", state.rng_position, epoch=state.rng_epoch)})', state=state)
+        except econ_exc.WalletOpFailedException:
+            state.status = game_sessions.CANCELLED
+            await self.service.checkpoint_games(state)
+            raise
         
         # finally done
         embed = discord.Embed.from_dict(embed_dict)
         await reply_to_msg.reply(embed=embed)
+
+    @commands.command(
+        help=f'''Estimate a game's expected payout per unit bet with a Monte Carlo simulation.
+
+        Games: {", ".join(GAMES)}
+        At most {settings.GAMBLING_SIMULATION_MAX_TRIALS:,} rounds.
+        ''',
+        usage='<game> [rounds]',
+    )
+    async def odds(self, ctx, game: str, trials: int = 100_000):
+        if game not in GAMES:
+            raise commands.BadArgument(f'Unknown game {game}. Use one of {", ".join(GAMES)}.')
+        trials = max(1, min(trials, settings.GAMBLING_SIMULATION_MAX_TRIALS))
+        # CPU-bound -- keep it off the event loop
+        async with ctx.typing():
+            r = await executors.run_in_process(simulation.run, game, trials)
+
+        embed = discord.Embed(title=f'Odds: {game}')
+        embed.add_field(name='Expected payout', value=f'{r["ev"]:+.4f} ± {1.96 * r["stderr"]:.4f} per unit bet')
+        embed.add_field(name='House edge', value=f'{r["house_edge"]:+.2%}')
+        embed.add_field(name='Win rate', value=f'{r["win_rate"]:.2%}')
+        embed.add_field(name='Payouts', value=f'{r["worst"]:+.3f} to {r["best"]:+.3f}')
+        embed.set_footer(text=f'{r["trials"]:,} simulated rounds')
+        await ctx.reply(embed=embed)
+
+    #
+    # Recovery after restarts
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready also fires after reconnects
+        if self.recovered:
+            return
+        self.recovered = True
+        await game_rng.restore()
+        await self.recover_games()
+
+    async def recover_games(self):
+        """Resume games left open by a restart. Games that are too old or whose messages are gone are refunded.
+
+        Bets are only taken when a game is settled so refunding a game just closes it.
+        """
+        states = await self.service.find_open_games()
+        if not states:
+            return
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.GAME_RESUME_MAX_AGE)
+        refunded = []
+        for state in states:
+            if state.created is not None and state.created < cutoff:
+                refunded.append(state.id)
+                continue
+            try:
+                await self.resume_game(state)
+            except (discord.HTTPException, LookupError) as e:
+                logger.info(f'Cannot resume {state}: {e}')
+                refunded.append(state.id)
+        await self.service.close_games(refunded, game_sessions.REFUNDED)
+        logger.info(f'Resumed {len(states) - len(refunded)} games, refunded {len(refunded)}')
+
+    async def resume_game(self, state: GameState):
+        channel = self.bot.get_channel(state.channel_id)
+        if channel is None:
+            raise LookupError(f'No channel {state.channel_id}')
+        reply_to_msg = await channel.fetch_message(state.reply_to_id)
+        amount = dataclasses.CurrencyAmount(amount=state.amount, symbol=state.symbol)
+        if state.game == 'guess_hilo':
+            await reply_to_msg.reply('The bot restarted but this game is still on. Reply to this message with your guess.')
+            coroutine = self.play_hilo(state, amount, reply_to_msg)
+        elif state.game == 'guess_multi':
+            guild = getattr(channel, 'guild', None)
+            users = {}
+            for user_id in state.players:
+                member = guild.get_member(user_id) if guild else None
+                users[user_id] = member or await self.bot.fetch_user(user_id)
+            await reply_to_msg.reply('The bot restarted but this game is still on. Betting is over in 30s after the last reply.')
+            coroutine = self.play_multi(state, amount, reply_to_msg, users)
+        else:
+            raise LookupError(f'Unknown game {state.game}')
+        task = asyncio.create_task(self._run_resumed(state, coroutine))
+        self.resumed_games.add(task)
+        task.add_done_callback(self.resumed_games.discard)
+
+    async def _run_resumed(self, state, coroutine):
+        try:
+            await coroutine
+        except Exception:
+            logger.exception(f'Resumed game {state} failed')
@@ -4,7 +4,7 @@ import discord
 from discord.ext import commands
 from sqlalchemy.exc import SQLAlchemyError
 
-import db
+import db, executors
 from util import render_template
 import settings
 from economy import rewards_policy
@@ -39,18 +39,18 @@ class Rewards(BaseEconomyCog, name='Economy.Rewards', description="Rewards in vi
         help='View rewards policy. Bot owner only. Stub.'
     )
     async def rewards_show_policy(self, ctx):
-        policy_text = rewards_policy.policy_file_content()
+        policy_text = await executors.run_in_thread(rewards_policy.policy_file_content)
         data = dict(title='Reward Policy', text=policy_text)
-        text = await render_template('reward_policy.jinja2', data)
-        await ctx.reply(text)
+        await self.reply_paginated(ctx, 'reward_policy.jinja2', data)
     
     @rewards.command(
         name='download_policy',
         help='Download policy config file. Bot owner only.'
     )
     async def rewards_download_policy(self, ctx):
-        file = rewards_policy.POLICY_FILE
-        await ctx.reply('Please download and edit the policy config file below.', file=discord.File(file))
+        # reads the file
+        file = await executors.run_in_thread(discord.File, str(rewards_policy.POLICY_FILE))
+        await ctx.reply('Please download and edit the policy config file below.', file=file)
 
     
     @rewards.command(
@@ -61,7 +61,6 @@ class Rewards(BaseEconomyCog, name='Economy.Rewards', description="Rewards in vi
         if not settings.ENABLE_REWARDS_POLICY_FILE_UPLOAD:
             await self.reply_embed(ctx, 'Error', 'Policy file upload not enabled')
             return
-        print(ctx.message.attachments)
         attachments = ctx.message.attachments
         if not attachments or len(attachments) != 1:
             await self.reply_embed(ctx, 'Error', 'Please upload the new policy file by itself.')
@@ -70,10 +69,12 @@ class Rewards(BaseEconomyCog, name='Economy.Rewards', description="Rewards in vi
         upload_path = rewards_policy.DSL_PATH / 'uploaded_policy_file.rew'
         try:
             await attachment.save(upload_path)
-            valid, e = rewards_policy.validate_policy_file(upload_path)
-            if not valid:
-                raise e
+            # compiling the policy is CPU-bound
+            error = await executors.run_in_process(rewards_policy.check_policy_file, str(upload_path))
+            if error is not None:
+                raise ValueError(error)
         except Exception as e:
+            fields = None
             if settings.DEBUG and ctx.author.id == self.bot.author_id:
                 fields = [dict(name='Error message', value=str(e), inline=False)]
             await self.reply_embed(ctx, 'Error', 'Uploaded policy file is not valid.', fields=fields)
@@ -100,16 +101,14 @@ class Rewards(BaseEconomyCog, name='Economy.Rewards', description="Rewards in vi
             currency_symbols = [
                 c.strip() for c in currency_str.split()
             ]
-        find_all = self.service.wallet_repo.find_rewards_by(member_ids, currency_symbols)
-        logs = await self.service(find_all)
+        logs = await self.report_service.find_rewards(member_ids, currency_symbols)
         
         if len(logs) < 1:
             await self.reply_embed(ctx, 'Error', 'No reward logs in database')
             return
 
         data = dict(title=f'Reward logs', object_list=logs, member_ids=member_ids, currency_symbols=currency_symbols)
-        text = await render_template('reward_logs.jinja2', data)
-        await ctx.reply(text)
+        await self.reply_paginated(ctx, 'reward_logs.jinja2', data)
     
     @commands.command(
         name='my_rewards',
@@ -122,8 +121,7 @@ class Rewards(BaseEconomyCog, name='Economy.Rewards', description="Rewards in vi
             currency_symbols = [
                 c.strip() for c in currency_str.split()
             ]
-        find_all = self.service.wallet_repo.find_user_rewards(ctx.author.id, currency_symbols)
-        logs = await self.service(find_all)
+        logs = await self.report_service.find_rewards([ctx.author.id], currency_symbols)
 
         
         if len(logs) < 1:
@@ -131,5 +129,4 @@ class Rewards(BaseEconomyCog, name='Economy.Rewards', description="Rewards in vi
             return
 
         data = dict(title=f'Reward logs', object_list=logs, currency_symbols=currency_symbols)
-        text = await render_template('reward_logs.jinja2', data)
-        await ctx.reply(text)
\ No newline at end of file
+        await self.reply_paginated(ctx, 'reward_logs.jinja2', data)
\ No newline at end of file
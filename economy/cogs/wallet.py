@@ -24,6 +24,7 @@ class Wallet(BaseEconomyCog, name="Economy.Wallet", description='Economy: Wallet
 
     # everything here needs a wallet
     async def cog_before_invoke(self, ctx):
+        await super().cog_before_invoke(ctx)
         ctx.wallet = await self.service.get_or_create_wallet(ctx.author.id, ctx.author)
 
     #
@@ -118,16 +119,14 @@ class Wallet(BaseEconomyCog, name="Economy.Wallet", description='Economy: Wallet
             currency_symbols = [
                 c.strip() for c in currency_str.split()
             ]
-        find_all = self.service.wallet_repo.find_transactions_by(member_ids, currency_symbols)
-        transactions = await self.service(find_all)
+        transactions = await self.report_service.find_transactions(member_ids, currency_symbols)
         
         if len(transactions) < 1:
             await self.reply_embed(ctx, 'Error', 'No transactions in database')
             return
 
         data = dict(title=f'Transactions', object_list=transactions, member_ids=member_ids, currency_symbols=currency_symbols)
-        text = await render_template('transactions.jinja2', data)
-        await ctx.reply(text)
+        await self.reply_paginated(ctx, 'transactions.jinja2', data)
 
     #
     # Normal users:
@@ -179,16 +178,14 @@ class Wallet(BaseEconomyCog, name="Economy.Wallet", description='Economy: Wallet
             currency_symbols = [
                 c.strip() for c in currency_str.split()
             ]
-        find_all = self.service.wallet_repo.find_user_transactions(ctx.author.id, currency_symbols)
-        transactions = await self.service(find_all)
+        transactions = await self.report_service.find_transactions([ctx.author.id], currency_symbols)
         
         if len(transactions) < 1:
             await self.reply_embed(ctx, 'Error', 'No transactions in database')
             return
 
         data = dict(title=f'Transactions', object_list=transactions, current_user_id=ctx.author.id, currency_symbols=currency_symbols)
-        text = await render_template('transactions.jinja2', data)
-        await ctx.reply(text)
+        await self.reply_paginated(ctx, 'transactions.jinja2', data)
     
     
     @commands.command(
@@ -0,0 +1,168 @@
+"""Interactive game sessions: routing replies to games and checkpointing game state.
+
+`bot.wait_for('message', check=...)` runs the check of every waiting game on every message.
+Instead, active games are indexed by the id of the message players reply to and a single `on_message`
+listener hands each reply to its game with one dict lookup (see `GameSessionManager.route`).
+
+E.g.
+```
+with self.game_sessions.open(reply_to_msg.id, check=lambda m: m.author == ctx.author) as session:
+    guess_msg = await session.next(timeout=120)
+    ...
+    # players reply to a new message from now on
+    session.move(new_msg.id)
+```
+
+Game state is kept in a `GameState` and checkpointed to the `game_session` table on every move, so open games
+can be resumed or refunded after a restart (see `Gambling.recover_games`).
+"""
+import asyncio
+import logging
+from decimal import Decimal
+
+
+logger = logging.getLogger('economy.game_sessions')
+
+# Game statuses
+OPEN = 'open'
+SETTLED = 'settled'
+CANCELLED = 'cancelled'
+# not resumed after a restart
+REFUNDED = 'refunded'
+
+
+class GameState:
+    """Everything needed to resume an interactive game, checkpointed to the `game_session` table.
+
+    Slotted because hundreds of games may be open at once.
+    """
+    __slots__ = (
+        'id', 'game', 'status', 'channel_id', 'user_id', 'reply_to_id',
+        'symbol', 'amount', 'answer', 'rng_position', 'rng_epoch', 'attempts', 'players', 'created',
+    )
+
+    def __init__(self, id, game, channel_id, user_id, reply_to_id, symbol, amount: Decimal, answer, rng_position,
+                 rng_epoch=None, status=OPEN, attempts=0, players=None, created=None):
+        self.id = id
+        self.game = game
+        self.status = status
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.reply_to_id = reply_to_id
+        self.symbol = symbol
+        self.amount = amount
+        self.answer = answer
+        self.rng_position = rng_position
+        # see `economy.rng` -- None for games checkpointed before epochs were recorded
+        self.rng_epoch = rng_epoch
+        self.attempts = attempts
+        # user id: guess or None
+        self.players = players if players is not None else {}
+        self.created = created
+
+    def to_row(self):
+        return dict(
+            id=self.id,
+            game=self.game,
+            status=self.status,
+            channel_id=self.channel_id,
+            user_id=self.user_id,
+            reply_to_id=self.reply_to_id,
+            symbol=self.symbol,
+            amount=self.amount,
+            answer=self.answer,
+            rng_position=self.rng_position,
+            rng_epoch=self.rng_epoch,
+            attempts=self.attempts,
+            # JSON object keys are strings
+            players={str(user_id): guess for user_id, guess in self.players.items()},
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row['id'],
+            game=row['game'],
+            status=row['status'],
+            channel_id=row['channel_id'],
+            user_id=row['user_id'],
+            reply_to_id=row['reply_to_id'],
+            symbol=row['symbol'],
+            amount=Decimal(row['amount']),
+            answer=row['answer'],
+            rng_position=row['rng_position'],
+            rng_epoch=row['rng_epoch'],
+            attempts=row['attempts'],
+            players={int(user_id): guess for user_id, guess in (row['players'] or {}).items()},
+            created=row['created'],
+        )
+
+    def __repr__(self):
+        return f'GameState({self.id}, {self.game!r}, {self.status!r})'
+
+
+class GameSession:
+    """Queue of replies to an active game's message."""
+    def __init__(self, manager, message_id, check=None):
+        self.manager = manager
+        self.message_id = message_id
+        self.check = check
+        self.queue = asyncio.Queue()
+
+    def accepts(self, message):
+        return self.check is None or self.check(message)
+
+    async def next(self, timeout=None):
+        """Wait for the next accepted reply.
+
+        Raises
+        ------
+        asyncio.TimeoutError
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def move(self, message_id):
+        """Route replies to another message to this game instead, e.g. the bot's latest prompt."""
+        self.manager.move(self, message_id)
+
+    def close(self):
+        self.manager.close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class GameSessionManager:
+    def __init__(self):
+        # reply to message id: session
+        self.sessions = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def open(self, message_id, check=None) -> GameSession:
+        session = GameSession(self, message_id, check=check)
+        self.sessions[message_id] = session
+        return session
+
+    def move(self, session, message_id):
+        self.sessions.pop(session.message_id, None)
+        session.message_id = message_id
+        self.sessions[message_id] = session
+
+    def close(self, session):
+        if self.sessions.get(session.message_id) is session:
+            del self.sessions[session.message_id]
+
+    def route(self, message):
+        """Queue a message for the game it replies to. Returns whether it was routed."""
+        if message.reference is None:
+            return False
+        session = self.sessions.get(message.reference.message_id)
+        if session is None or not session.accepts(message):
+            return False
+        session.queue.put_nowait(message)
+        return True
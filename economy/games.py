@@ -0,0 +1,89 @@
+"""Gambling game rules as pure functions.
+
+Payouts are the player's net result in units of the bet, e.g. +1 means they win their bet, -1 they lose it.
+All functions work on scalars and numpy arrays alike so the same rules are used by the gambling cog
+and by the Monte Carlo simulator in `economy.simulation`.
+"""
+from decimal import Decimal, ROUND_DOWN
+
+import numpy as np
+
+
+# Coin sides as drawn by `economy.rng`
+HEADS, TAILS = 0, 1
+COIN_GUESSES = dict(head=HEADS, heads=HEADS, h=HEADS, tail=TAILS, tails=TAILS, t=TAILS)
+
+# Dice pays 5:1 on the face guessed -- fair game
+DICE_PAYOUT = 5
+
+# Guess High-Low: the pot starts at twice the bet and each miss takes this fraction of the bet out of it
+HILO_MAX_GUESSES = 5
+HILO_PENALTY = 0.125
+
+
+def parse_coin_guess(guess):
+    """`HEADS` or `TAILS` for a guess like heads, Tails or h. Raises ValueError for anything else."""
+    try:
+        return COIN_GUESSES[guess.lower().strip()]
+    except KeyError:
+        raise ValueError(f'Invalid guess {guess!r}. Use heads or tails.') from None
+
+
+def cointoss_payouts(guesses, outcomes):
+    return np.where(guesses == outcomes, 1, -1)
+
+
+def dice_payouts(guesses, rolls):
+    return np.where(guesses == rolls, DICE_PAYOUT, -1)
+
+
+def guess_1p_payouts(guesses, answers):
+    # wins the bet at 1:9 odds -- unfair game
+    return np.where(guesses == answers, 1, -1)
+
+
+def hilo_pot(misses):
+    """Pot in units of the bet after a number of wrong guesses."""
+    return 2 - HILO_PENALTY * misses
+
+
+def hilo_hint(guess, answer):
+    return 'too low' if guess < answer else 'too high'
+
+
+def hilo_payouts(attempts):
+    """Payout given the attempt the answer was guessed on, 0 if it wasn't guessed.
+
+    The bet is not withdrawn while playing so a win pays the pot minus the bet.
+    """
+    attempts = np.asarray(attempts)
+    return np.where(attempts > 0, hilo_pot(attempts - 1) - 1, -1.0)
+
+
+def multi_winners(guesses, answers):
+    """Boolean mask of the winners of multiplayer guess games.
+
+    `guesses` has the players on the last axis, `answers` one answer per game. Exact guesses win,
+    otherwise all guesses closest to the answer win.
+    """
+    guesses = np.asarray(guesses)
+    distance = np.abs(guesses - np.expand_dims(answers, -1))
+    return distance == distance.min(axis=-1, keepdims=True)
+
+
+def multi_payouts(guesses, answers):
+    """Every player pays one buy in and the winners split the pot evenly."""
+    winners = multi_winners(guesses, answers)
+    players = winners.shape[-1]
+    n_winners = winners.sum(axis=-1, keepdims=True)
+    return np.where(winners, players / n_winners - 1, -1.0)
+
+
+def split_pot(pot: Decimal, n_winners, cents=Decimal('0.01')):
+    """Split a pot into `n_winners` shares of whole cents that add up to the pot.
+
+    Leftover cents go to the first winners.
+    """
+    share = (pot / n_winners).quantize(cents, rounding=ROUND_DOWN)
+    leftover = int((pot - share * n_winners) / cents)
+    return [share + cents if i < leftover else share for i in range(n_winners)]
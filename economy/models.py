@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, BigInteger, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, BigInteger, DateTime, func, Boolean, JSON
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.schema import UniqueConstraint, Index
 
 
 from db import Base
@@ -75,6 +75,7 @@ class CurrencyBalance(Base):
     # B/c of ext reloading - TODO
     __table_args__ = (
         UniqueConstraint('currency_id', 'wallet_id', name='uix_currency_wallet'),
+        Index('ix_wallet_currency_wallet_id', 'wallet_id'),
         {'extend_existing': True, }
     )
 
@@ -84,13 +85,16 @@ class Wallet(Base):
 
     id = Column(Integer, primary_key=True)
 
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(BigInteger, ForeignKey('user.id'))
     user = relationship('User', backref='wallet', lazy='selectin')
 
     currency_balances = relationship('CurrencyBalance', back_populates='wallet', lazy='selectin', cascade='save-update, merge, expunge, delete, delete-orphan')
 
     # B/c of ext reloading - TODO
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_wallet_user_id', 'user_id'),
+        {'extend_existing': True, }
+    )
 
     def __repr__(self):
         return f"Wallet(user={self.user.name})"
@@ -101,10 +105,10 @@ class TransactionLog(Base):
 
     id = Column(Integer, primary_key=True)
 
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(BigInteger, ForeignKey('user.id'))
     user = relationship('User', backref='transactions', lazy='selectin', foreign_keys=[user_id])
 
-    related_user_id = Column(Integer, ForeignKey('user.id'))
+    related_user_id = Column(BigInteger, ForeignKey('user.id'))
     related_user = relationship('User', backref='transactions_related', lazy='selectin', foreign_keys=[related_user_id])
 
     currency_id = Column(Integer, ForeignKey('currency.id'))
@@ -117,6 +121,12 @@ class TransactionLog(Base):
 
     created = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        Index('ix_transaction_user_id_created', 'user_id', 'created'),
+        Index('ix_transaction_related_user_id_created', 'related_user_id', 'created'),
+        Index('ix_transaction_currency_id', 'currency_id'),
+    )
+
     def __repr__(self):
         return f"TransactionLog(type={self.transaction_type}, amount={self.amount}, currency={self.currency}, user={self.user.name}, related={self.related_user.name})"
     
@@ -130,7 +140,7 @@ class RewardLog(Base):
 
     id = Column(Integer, primary_key=True)
 
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(BigInteger, ForeignKey('user.id'))
     user = relationship('User', backref='reward_logs', lazy='selectin')
 
     currency_id = Column(Integer, ForeignKey('currency.id'))
@@ -144,7 +154,11 @@ class RewardLog(Base):
 
     __mapper_args__ = {"eager_defaults": True}
     # B/c of ext reloading - TODO
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_reward_log_user_id_created', 'user_id', 'created'),
+        Index('ix_reward_log_currency_id', 'currency_id'),
+        {'extend_existing': True, }
+    )
 
 
     def __repr__(self):
@@ -159,7 +173,7 @@ class CurrencyExchangeTransaction(Base):
 
     id = Column(Integer, primary_key=True)
 
-    user_id = Column(Integer, ForeignKey('user.id'))
+    user_id = Column(BigInteger, ForeignKey('user.id'))
     user = relationship('User', backref='currency_exchange_transactions', lazy='selectin')
 
     bought_currency_id = Column(Integer, ForeignKey('currency.id'), nullable=True)
@@ -176,7 +190,10 @@ class CurrencyExchangeTransaction(Base):
 
     __mapper_args__ = {"eager_defaults": True}
     # B/c of ext reloading - TODO
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_currency_exchange_transaction_user_id_created', 'user_id', 'created'),
+        {'extend_existing': True, }
+    )
 
     def __repr__(self):
         return f"CurrencyExchangeTransaction(user={self.user.name}, amount_bought={self.amount_bought}, bought_currency={self.bought_currency}, amount_sold={self.amount_sold}, sold_currency={self.bought_currency}, exchange_rate={self.exchange_rate})"
@@ -203,10 +220,89 @@ class CurrencyExchangeRate(Base):
 
     __mapper_args__ = {"eager_defaults": True}
     # B/c of ext reloading - TODO
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_currency_exchange_rate_currency_id_created', 'exchanged_currency_id', 'created'),
+        {'extend_existing': True, }
+    )
 
     def __repr__(self):
         return f"CurrencyExchangeRate(created={self.user.name}, amount_currency={self.exchanged_currency}, amount_exchanged={self.amount_exchanged}, exchange_rate={self.exchange_rate})"
     
     def __str__(self):
-        return f'{self.created} {self.amount_exchanged} {self.exchanged_currency.symbol} to base currency at rate {self.exchange_rate}\n'
\ No newline at end of file
+        return f'{self.created} {self.amount_exchanged} {self.exchanged_currency.symbol} to base currency at rate {self.exchange_rate}\n'
+
+class LedgerSummary(Base):
+    """Per user and currency totals of ledger rows moved to the archive by `run.py archive-ledger`.
+
+    For the `transaction` ledger, `amount` is the signed effect on the user's balance so that
+    `balance == sum(summary amounts) + sum(hot transaction amounts)` still holds after archiving.
+    """
+    __tablename__ = 'ledger_summary'
+
+    id = Column(Integer, primary_key=True)
+
+    ledger = Column(String, nullable=False)
+
+    user_id = Column(BigInteger, ForeignKey('user.id'), nullable=True)
+    user = relationship('User', lazy='selectin')
+
+    currency_id = Column(Integer, ForeignKey('currency.id'), nullable=True)
+    currency = relationship('Currency', lazy='selectin')
+
+    amount = Column(Numeric(10, 2), default=0.0, nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+
+    first_created = Column(DateTime, nullable=True)
+    last_created = Column(DateTime, nullable=True)
+
+    # B/c of ext reloading - TODO
+    __table_args__ = (
+        UniqueConstraint('ledger', 'user_id', 'currency_id', name='uix_ledger_user_currency'),
+        {'extend_existing': True, }
+    )
+
+    def __repr__(self):
+        return f"LedgerSummary({self.ledger!r}, user_id={self.user_id}, currency_id={self.currency_id}, amount={self.amount}, count={self.count})"
+
+
+class GameSession(Base):
+    """Checkpoint of an interactive game in progress, see `economy.game_sessions.GameState`.
+
+    Rows are written with `GameSessionRepository.save` rather than through the ORM.
+    """
+    __tablename__ = 'game_session'
+
+    # id of the game's first message
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+
+    game = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+
+    channel_id = Column(BigInteger, nullable=False)
+    # game creator
+    user_id = Column(BigInteger, nullable=False)
+    # message players reply to
+    reply_to_id = Column(BigInteger, nullable=False)
+
+    symbol = Column(String(length=3), nullable=False)
+    # bet or buy in
+    amount = Column(Numeric(10, 2), nullable=False)
+
+    answer = Column(Integer, nullable=False)
+    rng_position = Column(Integer, nullable=False)
+    rng_epoch = Column(Integer, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    # user id: guess
+    players = Column(JSON, nullable=True)
+
+    created = Column(DateTime, server_default=func.now())
+    updated = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    # B/c of ext reloading - TODO
+    __table_args__ = (
+        Index('ix_game_session_status', 'status'),
+        {'extend_existing': True, }
+    )
+
+    def __repr__(self):
+        return f"GameSession({self.id}, {self.game!r}, {self.status!r})"
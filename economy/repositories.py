@@ -1,8 +1,10 @@
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload, joinedload, contains_eager, aliased
-from sqlalchemy import exc, or_, func, asc, desc
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import exc, or_, func, asc, desc, update, case
 
 
+import db
 from db import User
 from economy import models
 
@@ -14,6 +16,10 @@ class BaseRepository:
     def add(self, *args):
         self.session.add_all(*args)
 
+    @property
+    def dialect_name(self):
+        return self.session.bind.dialect.name
+
 
 class CurrencyRepository(BaseRepository):
     
@@ -206,10 +212,111 @@ class WalletRepository(BaseRepository):
 
         return balance
 
+    async def adjust_balance(self, balance, amount, min_balance=None):
+        """Atomically add amount to a currency balance with a single `UPDATE`.
+
+        Withdrawals (negative amounts) only go through if the balance stays non-negative.
+        Uses `RETURNING` where the dialect supports it.
+
+         Parameters
+        ----------
+        balance : CurrencyBalance
+            Balance loaded in this session. Its `balance` attribute is set to the new value.
+        amount : Decimal
+            Amount to add. Negative to withdraw.
+        min_balance : Decimal
+            Only update a balance of at least this much before the update, e.g. the most a game can lose.
+
+        Returns
+        -------
+        Decimal or None if the balance is too low
+        """
+        table = models.CurrencyBalance.__table__
+        stmt = update(table).where(table.c.id == balance.id).values(balance=table.c.balance + amount)
+        if amount < 0:
+            stmt = stmt.where(table.c.balance + amount >= 0)
+        if min_balance is not None:
+            stmt = stmt.where(table.c.balance >= min_balance)
+        if db.supports_returning(self.session.bind):
+            res = await self.session.execute(stmt.returning(table.c.balance))
+            new_balance = res.scalar_one_or_none()
+        else:
+            res = await self.session.execute(stmt)
+            if res.rowcount == 0:
+                return None
+            res = await self.session.execute(select(table.c.balance).where(table.c.id == balance.id))
+            new_balance = res.scalar_one()
+        if new_balance is not None:
+            # keep the loaded instance in sync without flushing it
+            set_committed_value(balance, 'balance', new_balance)
+        return new_balance
+
+    async def find_currency_balances(self, user_ids, currency_symbol):
+        """Get the balances of a currency for many users with one query.
+
+        Returns
+        -------
+        dict[int, CurrencyBalance] keyed by user id. Users without a wallet or balance are missing.
+        """
+        stmt = (
+            select(models.CurrencyBalance, models.Wallet.user_id).
+            join(models.CurrencyBalance.wallet).
+            join(models.CurrencyBalance.currency).
+            where(models.Wallet.user_id.in_(list(user_ids)), models.Currency.symbol == currency_symbol)
+        )
+        res = await self.session.execute(stmt)
+        return {user_id: balance for balance, user_id in res.all()}
+
+    async def adjust_balances(self, amounts, min_balance=None):
+        """Add a different amount to each of many currency balances with a single `UPDATE`.
+
+        Loaded `CurrencyBalance` instances are not updated -- refresh them if needed.
+
+         Parameters
+        ----------
+        amounts : dict[int, Decimal]
+            Amount to add keyed by currency balance id.
+        min_balance : Decimal
+            Only update balances of at least this much before the update, e.g. a buy in.
+
+        Returns
+        -------
+        int
+            Number of balances updated. The caller should roll back if it is less than `len(amounts)`.
+        """
+        if not amounts:
+            return 0
+        table = models.CurrencyBalance.__table__
+        stmt = (
+            update(table).
+            where(table.c.id.in_(list(amounts))).
+            values(balance=table.c.balance + case(amounts, value=table.c.id))
+        )
+        if min_balance is not None:
+            stmt = stmt.where(table.c.balance >= min_balance)
+        res = await self.session.execute(stmt)
+        return res.rowcount
+
+    async def ensure_user(self, user_id, name=None):
+        """Insert a user row if it does not exist yet. Updates the name if given."""
+        values = dict(id=user_id)
+        if name is not None:
+            values['name'] = name
+        stmt = db.upsert(self.dialect_name, User.__table__, values, ['id'], update_columns=['name'] if name is not None else None)
+        await self.session.execute(stmt)
+
+    async def ensure_balances(self, wallet_id, currency_ids):
+        """Insert zero balances for currencies missing from a wallet. Concurrent inserts are ignored."""
+        if not currency_ids:
+            return
+        values = [dict(wallet_id=wallet_id, currency_id=currency_id, balance=0) for currency_id in currency_ids]
+        stmt = db.upsert(self.dialect_name, models.CurrencyBalance.__table__, values, ['currency_id', 'wallet_id'])
+        await self.session.execute(stmt)
+
     #
     # TransactionLog:
     @staticmethod
-    def get_transactions_query(filters=None):
+    def get_transactions_query(filters=None, limit=10):
         related_user_alias = aliased(User)
         stmt = (
             select(models.TransactionLog).
@@ -224,32 +331,30 @@ class WalletRepository(BaseRepository):
                 contains_eager(models.TransactionLog.related_user),
                 contains_eager(models.TransactionLog.currency)
             ).
-            order_by(desc(models.TransactionLog.created)).
-            limit(10)
-            # can't send too many logs at once
-        # TODO - download all logs
-        # also rewards
+            order_by(desc(models.TransactionLog.created))
         )
+        if limit is not None:
+            stmt = stmt.limit(limit)
         return stmt
 
-    async def find_transactions_by(self, user_ids=None, symbols=None):
+    async def find_transactions_by(self, user_ids=None, symbols=None, limit=10):
         filters = []
         if user_ids:
             filters.append(User.id.in_(user_ids))
         if symbols:
             filters.append(models.Currency.symbol.in_(symbols))
-        stmt = self.get_transactions_query(filters)
+        stmt = self.get_transactions_query(filters, limit=limit)
         res = await self.session.execute(stmt)
         logs = res.scalars().all()
         return logs
     
-    async def find_user_transactions(self, user_id, symbols=None):
+    async def find_user_transactions(self, user_id, symbols=None, limit=10):
         condition = User.id == user_id
         if symbols:
             filters = (condition, models.Currency.symbol.in_(symbols))
         else:
             filters = (condition,)
-        stmt = self.get_transactions_query(filters)
+        stmt = self.get_transactions_query(filters, limit=limit)
         res = await self.session.execute(stmt)
         logs = res.scalars().all()
         return logs
@@ -257,7 +362,7 @@ class WalletRepository(BaseRepository):
     #
     # RewardLog:
     @staticmethod
-    def get_rewards_query(filters=None):
+    def get_rewards_query(filters=None, limit=10):
         stmt = (
             select(models.RewardLog).
             join(models.RewardLog.user).
@@ -269,33 +374,65 @@ class WalletRepository(BaseRepository):
                 contains_eager(models.RewardLog.user),
                 contains_eager(models.RewardLog.currency)
             ).
-            order_by(desc(models.RewardLog.created)).
-            limit(10)
+            order_by(desc(models.RewardLog.created))
             
         )
-        # can't send too many logs at once
-        # TODO - download all logs
-        # also transactions
+        if limit is not None:
+            stmt = stmt.limit(limit)
         return stmt
     
-    async def find_rewards_by(self, user_ids=None, symbols=None):
+    async def find_rewards_by(self, user_ids=None, symbols=None, limit=10):
         filters = []
         if user_ids:
             filters.append(User.id.in_(user_ids))
         if symbols:
             filters.append(models.Currency.symbol.in_(symbols))
-        stmt = self.get_rewards_query(filters)
+        stmt = self.get_rewards_query(filters, limit=limit)
         res = await self.session.execute(stmt)
         logs = res.scalars().all()
         return logs
     
-    async def find_user_rewards(self, user_id, symbols=None):
+    async def find_user_rewards(self, user_id, symbols=None, limit=10):
         condition = User.id == user_id
         if symbols:
             filters = (condition, models.Currency.symbol.in_(symbols))
         else:
             filters = (condition,)
-        stmt = self.get_rewards_query(filters)
+        stmt = self.get_rewards_query(filters, limit=limit)
         res = await self.session.execute(stmt)
         logs = res.scalars().all()
-        return logs
\ No newline at end of file
+        return logs
+
+
+class GameSessionRepository(BaseRepository):
+    # columns that change while a game is played
+    MUTABLE_COLUMNS = ['status', 'reply_to_id', 'attempts', 'players']
+
+    async def save(self, rows):
+        """Insert or update game session checkpoints.
+
+         Parameters
+        ----------
+        rows : list[dict]
+            `GameState.to_row()` dicts
+        """
+        if not rows:
+            return
+        table = models.GameSession.__table__
+        stmt = db.upsert(self.dialect_name, table, rows, ['id'], update_columns=self.MUTABLE_COLUMNS, set_=dict(updated=func.now()))
+        await self.session.execute(stmt)
+
+    async def find_by_status(self, status):
+        table = models.GameSession.__table__
+        res = await self.session.execute(select(table).where(table.c.status == status).order_by(table.c.id))
+        return res.mappings().all()
+
+    async def set_status(self, ids, status):
+        """Set the status of many game sessions with a single `UPDATE`."""
+        if not ids:
+            return 0
+        table = models.GameSession.__table__
+        res = await self.session.execute(
+            update(table).where(table.c.id.in_(list(ids))).values(status=status, updated=func.now())
+        )
+        return res.rowcount
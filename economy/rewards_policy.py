@@ -1,11 +1,14 @@
 from pathlib import Path
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 import logging
 
 import discord
 from textx import metamodel_from_file
 
+import metrics
+
 
 
 
@@ -16,19 +19,35 @@ POLICY_FILE = DSL_PATH / 'reward_policy.rew'
 
 logger = logging.getLogger('economy.rewards.reward_policy')
 
-# meta model
-rewards_policy_mm = metamodel_from_file(TX_FILE)
-# model
-rewards_policy_m = rewards_policy_mm.model_from_file(POLICY_FILE)
+@lru_cache(maxsize=None)
+def get_metamodel():
+    """Policy DSL meta model. Parsed on first use."""
+    return metamodel_from_file(TX_FILE)
+
+
+@lru_cache(maxsize=None)
+def get_policy_model():
+    """Current policy file model. Parsed on first use."""
+    return get_metamodel().model_from_file(POLICY_FILE)
 
 
 def validate_policy_file(fpath):
     try:
-        rewards_policy_mm.model_from_file(fpath)
+        get_metamodel().model_from_file(fpath)
         return True, None
     except Exception as e:
         return False, e
 
+
+def check_policy_file(fpath):
+    """Error message if the policy file is invalid, else None.
+
+    Compiling a policy is CPU-bound -- run it with `executors.run_in_process`. Returns a string because
+    textX exceptions don't survive pickling.
+    """
+    valid, e = validate_policy_file(fpath)
+    return None if valid else str(e)
+
 @dataclass
 class RewardRuleEvent:
     # event_name -> event_type -> discord.py event name
@@ -142,7 +161,7 @@ class EventContext:
 
 class RewardsPolicyEngine:
     def __init__(self, service, bot):
-        self.policy_model = rewards_policy_m
+        self.policy_model = get_policy_model()
         self.service = service
         self.bot = bot
     
@@ -176,9 +195,11 @@ class RewardsPolicyEngine:
             logger.debug(f'Executing reward_policy for rule {rule_event.rule_name}')
             for reward in rewards:
                 await self.service.grant_reward(rule_event, event_context, reward)
+                metrics.REWARD_GRANTS.inc(rule=rule_event.rule_name, currency=reward.currency_amount.code)
 
         async def evt_handler(*args, **kwargs):
             logger.debug(f'Triggered event handler for {rule_event}')
+            metrics.REWARD_EVENTS.inc(rule=rule_event.rule_name, event=rule_event.event_name)
             event_context = await EventContext.create(rule_event, *args, **kwargs)
             if rule_event.event_name == 'message' and event_context.message.content.startswith(self.bot.command_prefix):
                 # skip commands to this bot # TODO possible to recog other bots?
@@ -187,6 +208,7 @@ class RewardsPolicyEngine:
                 # skip msg from this bot
                 return
             if await eval_conditions(event_context):
+                metrics.REWARD_RULE_HITS.inc(rule=rule_event.rule_name)
                 await exec_rewards(event_context)
 
         return evt_handler
@@ -0,0 +1,279 @@
+"""Buffered random number generation for games.
+
+Every game type gets its own `PCG64` stream derived from one seed.
+Outcomes are drawn a block at a time into a ring buffer per game type, so playing a round pops values
+from a buffer instead of calling into the generator. Buffers are topped up from the event loop after
+the command that drained them, or right away when a draw needs more values than are buffered.
+
+Each outcome is made from exactly one raw 64 bit draw, so the n-th outcome of a game type only depends on
+the seed, and a stream skips to any position with `PCG64.advance` without drawing the values before it.
+
+A seed makes an *epoch*. Epochs and the draw positions of the current epoch are kept in the `kv` store,
+so after a restart `restore` continues the streams where they stopped instead of dealing the same outcomes
+again. Positions are saved a couple of blocks ahead of the draws, so a crash skips some outcomes rather than
+reusing them. A new epoch starts when there is no stored state, when `GAME_RNG_SEED` changed, or when a
+stream got past `GAME_RNG_EPOCH_MAX_POSITION`.
+Without `GAME_RNG_SEED` each epoch gets a random seed, otherwise one derived from it and the epoch id.
+
+Gambling commands record the game type, epoch and draw position in their ledger notes;
+`replay` reproduces those outcomes for disputes.
+
+E.g.
+```
+from economy.rng import game_rng
+
+await game_rng.restore()
+flip = game_rng.draw('cointoss')
+epoch, start = game_rng.epoch, game_rng.position('dice')
+rolls = game_rng.draw_n('dice', 100)
+# later
+assert (game_rng.replay('dice', start, 100, epoch=epoch) == rolls).all()
+```
+"""
+import asyncio
+import logging
+import zlib
+
+import numpy as np
+
+import settings
+
+
+logger = logging.getLogger('economy.rng')
+
+# {'epoch': id, 'epochs': {id: {'seed', 'master_seed'}}, 'positions': {game: saved position}}
+STATE_KEY = 'econ__rng_state'
+
+# game type: (low, high) -- high is exclusive
+GAMES = {
+    'cointoss': (0, 2),
+    'dice': (1, 7),
+    'guess_1p': (1, 10),
+    'guess_hilo': (1, 100),
+    'guess_multi': (1, 100),
+}
+
+
+class RingBuffer:
+    """Fixed capacity FIFO of integers backed by a numpy array."""
+    def __init__(self, capacity):
+        self.data = np.empty(capacity, dtype=np.int64)
+        self.start = 0
+        self.size = 0
+
+    @property
+    def free(self):
+        return len(self.data) - self.size
+
+    def push(self, values):
+        capacity = len(self.data)
+        if len(values) > self.free:
+            raise ValueError(f'Cannot push {len(values)} values into a buffer with {self.free} free slots')
+        end = (self.start + self.size) % capacity
+        first = min(len(values), capacity - end)
+        self.data[end:end + first] = values[:first]
+        self.data[:len(values) - first] = values[first:]
+        self.size += len(values)
+
+    def pop(self, n):
+        capacity = len(self.data)
+        if n > self.size:
+            raise ValueError(f'Cannot pop {n} values from a buffer of size {self.size}')
+        first = min(n, capacity - self.start)
+        values = np.concatenate((self.data[self.start:self.start + first], self.data[:n - first]))
+        self.start = (self.start + n) % capacity
+        self.size -= n
+        return values
+
+
+class GameStream:
+    """Buffered outcomes of a single game type."""
+    def __init__(self, game, seed, block_size):
+        self.game = game
+        self.low, self.high = GAMES[game]
+        self.block_size = block_size
+        # independent stream per game type -- derived from the game name so adding games doesn't shift others
+        seed_sequence = np.random.SeedSequence(seed, spawn_key=(zlib.crc32(game.encode()),))
+        self.bit_generator = np.random.PCG64(seed_sequence)
+        self.buffer = RingBuffer(2 * block_size)
+        # number of outcomes handed out so far
+        self.position = 0
+        self.refill_pending = False
+
+    def refill(self):
+        self.refill_pending = False
+        while self.buffer.free >= self.block_size:
+            self.buffer.push(self.draw_block())
+
+    def draw_block(self):
+        # the top 32 bits of one raw draw per outcome, scaled to the range -- a bias of at most
+        # (high - low) / 2**32, unlike rejection sampling it uses a fixed number of raw draws
+        raw = self.bit_generator.random_raw(self.block_size) >> np.uint64(32)
+        return self.low + (raw * np.uint64(self.high - self.low) >> np.uint64(32)).astype(np.int64)
+
+    def advance(self, n):
+        """Skip `n` outcomes without drawing them."""
+        buffered = min(n, self.buffer.size)
+        self.pop(buffered)
+        if n > buffered:
+            # the buffer is empty -- skip the raw draws of the remaining outcomes
+            self.bit_generator.advance(n - buffered)
+            self.position += n - buffered
+
+    def pop(self, n):
+        chunks = []
+        remaining = n
+        while remaining:
+            if self.buffer.size == 0:
+                self.refill()
+            take = min(remaining, self.buffer.size)
+            chunks.append(self.buffer.pop(take))
+            remaining -= take
+        self.position += n
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+
+class GameRNG:
+    def __init__(self, seed=None, block_size=settings.GAME_RNG_BLOCK_SIZE):
+        # configured seed that epoch seeds are derived from, if any
+        self.master_seed = seed
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.block_size = block_size
+        self.streams = {}
+        # None until restored
+        self.epoch = None
+        # epoch id: stored epoch dict
+        self.epochs = {}
+        # game: saved position -- streams are resumed from here
+        self.saved_positions = {}
+        self._kv_store = None
+        self._lock = None
+        self._checkpoint_task = None
+
+    async def restore(self, kv_store=None):
+        """Resume the stored epoch or start a new one. Call before the first draw -- later calls do nothing."""
+        if self.epoch is not None:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.epoch is not None:
+                return
+            if kv_store is None:
+                import kv
+                kv_store = kv.store
+            state = await kv_store.get(STATE_KEY) or {}
+            epochs = {int(epoch): record for epoch, record in state.get('epochs', {}).items()}
+            positions = state.get('positions', {})
+            epoch = state.get('epoch')
+            if epoch is not None and self._can_resume(epochs.get(epoch), positions):
+                logger.info(f'Resuming game RNG epoch {epoch}')
+            else:
+                epoch = max(epochs, default=0) + 1
+                epochs[epoch] = dict(
+                    seed=str(self._new_seed(epoch)),
+                    master_seed=str(self.master_seed) if self.master_seed is not None else None,
+                )
+                positions = {}
+                logger.info(f'Starting game RNG epoch {epoch}')
+            self._kv_store = kv_store
+            self.epochs = epochs
+            self.seed = int(epochs[epoch]['seed'])
+            # streams drawn from before restoring belong to no epoch
+            self.streams = {}
+            self.saved_positions = dict(positions)
+            self.epoch = epoch
+            await self.checkpoint()
+
+    def _can_resume(self, record, positions):
+        if record is None:
+            return False
+        if record['master_seed'] != (str(self.master_seed) if self.master_seed is not None else None):
+            return False
+        return max(positions.values(), default=0) < settings.GAME_RNG_EPOCH_MAX_POSITION
+
+    def _new_seed(self, epoch):
+        if self.master_seed is None:
+            return np.random.SeedSequence().entropy
+        # 128 bits from the configured seed and the epoch id
+        state = np.random.SeedSequence([self.master_seed, epoch]).generate_state(4)
+        return int.from_bytes(state.tobytes(), 'little')
+
+    async def checkpoint(self):
+        """Save the epochs and, for every stream, a position two blocks ahead of its draws."""
+        if self._kv_store is None:
+            return
+        for game, stream in self.streams.items():
+            self.saved_positions[game] = max(self.saved_positions.get(game, 0), stream.position + 2 * self.block_size)
+        state = dict(
+            epoch=self.epoch,
+            # JSON object keys are strings
+            epochs={str(epoch): record for epoch, record in self.epochs.items()},
+            positions=dict(self.saved_positions),
+        )
+        await self._kv_store.set(STATE_KEY, state)
+
+    def stream(self, game) -> GameStream:
+        stream = self.streams.get(game)
+        if stream is None:
+            stream = self.streams[game] = GameStream(game, self.seed, self.block_size)
+            stream.advance(self.saved_positions.get(game, 0))
+            stream.refill()
+        return stream
+
+    def position(self, game):
+        """Number of outcomes drawn so far for a game type i.e. the position of the next draw."""
+        return self.stream(game).position
+
+    def draw(self, game) -> int:
+        return int(self.draw_n(game, 1)[0])
+
+    def draw_n(self, game, n) -> np.ndarray:
+        stream = self.stream(game)
+        values = stream.pop(n)
+        if stream.buffer.free >= self.block_size:
+            self._schedule_refill(stream)
+        if stream.position + self.block_size > self.saved_positions.get(game, 0):
+            self._schedule_checkpoint()
+        return values
+
+    def _schedule_refill(self, stream):
+        if stream.refill_pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop e.g. scripts -- next draw refills when it runs out
+            return
+        stream.refill_pending = True
+        loop.call_soon(stream.refill)
+
+    def _schedule_checkpoint(self):
+        if self._kv_store is None or (self._checkpoint_task is not None and not self._checkpoint_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._checkpoint_task = loop.create_task(self._checkpoint_logged())
+
+    async def _checkpoint_logged(self):
+        try:
+            await self.checkpoint()
+        except Exception:
+            logger.exception('Failed to save game RNG positions')
+
+    def replay(self, game, start, n, epoch=None) -> np.ndarray:
+        """Reproduce `n` outcomes of a game type starting at draw position `start` of an epoch (current by default)."""
+        if epoch is None or epoch == self.epoch:
+            seed = self.seed
+        elif epoch in self.epochs:
+            seed = int(self.epochs[epoch]['seed'])
+        else:
+            raise ValueError(f'Unknown game RNG epoch {epoch}')
+        stream = GameStream(game, seed, self.block_size)
+        stream.advance(start)
+        return stream.pop(n)
+
+
+game_rng = GameRNG(seed=settings.GAME_RNG_SEED)
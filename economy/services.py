@@ -1,15 +1,16 @@
+import contextvars
 import functools
 import logging
 from contextlib import AsyncExitStack
 from functools import wraps
 from decimal import Decimal
 
-from sqlalchemy import exc
+from sqlalchemy import exc, insert
 from sqlalchemy.orm.session import make_transient
 
-import db, settings
+import db, executors, metrics, settings
 
-from economy import models, repositories, parsers, util, dataclasses
+from economy import models, repositories, parsers, util, dataclasses, archive, game_sessions
 from economy.rewards_policy import RewardRuleEvent, EventContext
 from economy import exc as econ_exc
 
@@ -27,11 +28,19 @@ def async_with_session(begin=False):
     return decorator
 
 
+async def with_archived(ledger, rows, user_ids=None, symbols=None, limit=None):
+    """`archive.with_archived` -- reading archive segments is file I/O, so it runs in a thread when needed."""
+    if limit is not None and len(rows) >= limit:
+        return rows
+    return await executors.run_in_thread(archive.with_archived, ledger, rows, user_ids, symbols, limit)
+
+
 class RepositoryDescriptor:
     """Repository descriptor to instantiate a new repository class on get.
 
      - Adds a list of repository attribute names to owner class' '_repositories' attr for later access by instances looking for all repos.
-     - Instantiated repos are also added to instance's '_instantiated_repositories' attr dict keyed by descriptor name.
+     - Repos instantiated outside a service context are bound to the session of the next one entered by the same task,
+       see `EconomyService._update_repo_sessions`.
      """
     def __init__(self, repository_class, *args, **kwargs):
         self.repository_class = repository_class
@@ -46,9 +55,8 @@ class RepositoryDescriptor:
 
     def __get__(self, instance, owner):
         repo = self.repository_class(instance.session, *self.args, **self.kwargs)
-        repo_instances = getattr(instance, '_instantiated_repositories', {})
-        repo_instances[self.name] = repo
-        setattr(instance, '_instantiated_repositories', repo_instances)
+        if repo.session is None:
+            instance._unbound_repositories.set(instance._unbound_repositories.get() + (repo,))
         return repo
 
 
@@ -65,10 +73,28 @@ class EconomyService:
          with service(begin=True):
            ...
         ```
+
+        Every task -- i.e. every command -- entering the service gets a session of its own,
+        so concurrent commands of a cog sharing one service don't share a session.
     """
     def __init__(self, async_session=db.async_session):
         self.async_session = async_session
-        self.session = None
+        name = type(self).__name__
+        # sessions of the service contexts entered by the current task, innermost last
+        self._sessions = contextvars.ContextVar(f'{name}_sessions', default=())
+        # repos got by the current task while it had no session
+        self._unbound_repositories = contextvars.ContextVar(f'{name}_unbound_repositories', default=())
+
+    @property
+    def session(self):
+        """The session of the innermost service context of the current task, None outside of one."""
+        sessions = self._sessions.get()
+        return sessions[-1] if sessions else None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # services of other extensions get metrics too
+        instrument(cls)
 
     def _update_repo_sessions(self):
         """Update any pre-existing repository instances with session.
@@ -76,23 +102,25 @@ class EconomyService:
         Allows calling repo coroutine methods without calling them in order to run later with
         service await_with method.
         """
-        for repo_name, repo in getattr(self, '_instantiated_repositories', {}).items():
-            if repo is not None:
-                repo.session = self.session
+        for repo in self._unbound_repositories.get():
+            repo.session = self.session
+        self._unbound_repositories.set(())
 
     async def __aenter__(self):
         # sessionmaker creates async session.
-        self.session = self.async_session()
+        session = self.async_session()
         # then we enter its context
-        await self.async_session().__aenter__()
+        await session.__aenter__()
+        self._sessions.set(self._sessions.get() + (session,))
 
         self._update_repo_sessions()
 
-        return self.session
+        return session
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        self._instantiated_repositories = {}
-        await self.session.__aexit__(exc_type, exc_val, exc_tb)
+        sessions = self._sessions.get()
+        self._sessions.set(sessions[:-1])
+        await sessions[-1].__aexit__(exc_type, exc_val, exc_tb)
 
     async def await_with(self, coroutine, *args, begin=True, **kwargs):
         """Await coroutine methods with service context manager
@@ -128,6 +156,7 @@ class EconomyService:
 
     currency_repo = RepositoryDescriptor(repositories.CurrencyRepository)
     wallet_repo = RepositoryDescriptor(repositories.WalletRepository)
+    game_session_repo = RepositoryDescriptor(repositories.GameSessionRepository)
 
     # @property
     # def currency_repo(self):
@@ -137,6 +166,16 @@ class EconomyService:
     # def wallet_repo(self):
     #     return repositories.WalletRepository(service=self)
 
+    async def find_transactions(self, user_ids=None, symbols=None, limit=settings.LOG_ROW_LIMIT):
+        """Latest transactions from the hot table, topped up with archived transactions."""
+        logs = await self(self.wallet_repo.find_transactions_by(user_ids, symbols, limit=limit))
+        return await with_archived('transaction', logs, user_ids, symbols, limit)
+
+    async def find_rewards(self, user_ids=None, symbols=None, limit=settings.LOG_ROW_LIMIT):
+        """Latest reward logs from the hot table, topped up with archived reward logs."""
+        logs = await self(self.wallet_repo.find_rewards_by(user_ids, symbols, limit=limit))
+        return await with_archived('reward_log', logs, user_ids, symbols, limit)
+
     async def get_all_currencies(self):
         return await self.currency_repo.find_by()
 
@@ -215,9 +254,8 @@ class EconomyService:
                 repo = repositories.WalletRepository(session)
                 balance = await repo.get_currency_balance(user_id, currency_amount.symbol)
                 amount = currency_amount.amount
-                if amount < 0 and balance.balance + amount < 0:
+                if await repo.adjust_balance(balance, amount) is None:
                     raise econ_exc.WalletOpFailedException(f'Trying to withdraw {amount} but the balance is only {balance.balance}')
-                balance.balance += amount
 
                 # store transaction log
                 note =  f'{note}: {currency_amount}'
@@ -235,9 +273,8 @@ class EconomyService:
         try:
             balance = await self.wallet_repo.get_currency_balance(user_id, currency_amount.symbol)
             amount = currency_amount.amount
-            if amount < 0 and balance.balance + amount < 0:
+            if await self.wallet_repo.adjust_balance(balance, amount) is None:
                 raise econ_exc.WalletOpFailedException(f'Trying to withdraw {amount} but the balance is only {balance.balance}')
-            balance.balance += amount
 
             # store transaction log
             note = f'{note}: {currency_amount}'
@@ -269,10 +306,9 @@ class EconomyService:
                 sender_balance = await repo.get_currency_balance(sender_id, currency_amount.symbol)
                 receiver_balance = await repo.get_currency_balance(receiver_id, currency_amount.symbol)
                 amount = currency_amount.amount
-                if sender_balance.balance < amount:
+                if await repo.adjust_balance(sender_balance, -amount) is None:
                     raise econ_exc.WalletOpFailedException(f'Trying to withdraw {amount} but the balance is only {sender_balance.balance}')
-                sender_balance.balance -= amount
-                receiver_balance.balance += amount
+                await repo.adjust_balance(receiver_balance, amount)
 
                 # store transaction log
                 note =  f'Payment from {sender_id} to {receiver_id} of amount {currency_amount}'
@@ -301,11 +337,9 @@ class EconomyService:
                 # create a wallet for user
                 # TODO assuming user without wallet does not have a user model either
                 logger.debug(f'Creating wallet for {user_id}')
-                u = db.User(id=user_id)
-                if user:
-                    u.name = user.display_name
-                wallet = models.Wallet(user=u)
-                self.session.add(u)
+                # user rows may already exist e.g. from another extension
+                await self.wallet_repo.ensure_user(user_id, user.display_name if user else None)
+                wallet = models.Wallet(user_id=user_id)
                 self.session.add(wallet)
                 await self.session.flush()
                 new = True
@@ -315,16 +349,15 @@ class EconomyService:
 
             # get all currencies to ensure any newly added currencies
             # are also added to the user's wallet
-            wallet_currencies = set(b.currency for b in wallet.currency_balances)
+            wallet_currencies = set(b.currency_id for b in wallet.currency_balances)
 
-            all_currencies = set(await self.currency_repo.find_by())
+            all_currencies = set(c.id for c in await self.currency_repo.find_by(load_denoms=False))
             diff = all_currencies - wallet_currencies
             # create balances for all currencies not in wallet
-            for c in diff:
-                b = models.CurrencyBalance(wallet=wallet, currency=c)
-                self.session.add(b)
-            
-            await self.session.flush()
+            # ignores balances created concurrently by another command
+            if diff:
+                await self.wallet_repo.ensure_balances(wallet.id, diff)
+                await self.session.refresh(wallet)
         
             return wallet, new
 
@@ -359,7 +392,48 @@ class EconomyService:
             balance = await self.wallet_repo.get_currency_balance(user.id, currency_amount.symbol)
             amount = currency_amount.amount
             return amount <= balance.balance
-            
+
+    async def find_affordable(self, user_ids, currency_amount: dataclasses.CurrencyAmount):
+        """Ids of the users that can afford an amount, checked with one query."""
+        async with self.async_session() as session:
+            balances = await repositories.WalletRepository(session).find_currency_balances(user_ids, currency_amount.symbol)
+            return {user_id for user_id, balance in balances.items() if currency_amount.amount <= balance.balance}
+
+    async def settle_game(self, game_id, buy_in: dataclasses.CurrencyAmount, outcomes, note='', state=None):
+        """Settle every player of a game in one DB transaction.
+
+        `outcomes` maps user ids to the net amount they won, negative if they lost.
+        Every player must still afford the buy in when the outcomes are applied, otherwise no one is settled.
+        The game's `GameState` is checkpointed in the same transaction if given.
+        """
+        async with self.async_session() as session, session.begin():
+            wallet_repo = repositories.WalletRepository(session)
+            balances = await wallet_repo.find_currency_balances(outcomes.keys(), buy_in.symbol)
+            missing = set(outcomes) - set(balances)
+            if missing:
+                raise econ_exc.WalletOpFailedException(f'Players {", ".join(map(str, missing))} have no {buy_in.symbol} balance')
+
+            amounts = {balances[user_id].id: amount for user_id, amount in outcomes.items()}
+            if await wallet_repo.adjust_balances(amounts, min_balance=buy_in.amount) < len(amounts):
+                raise econ_exc.WalletOpFailedException(f'Not every player can afford the buy in of {buy_in}')
+
+            # store transaction logs
+            transactions = []
+            for user_id, amount in outcomes.items():
+                won = amount >= 0
+                kind = 'Winnings' if won else 'Losses'
+                currency_amount = dataclasses.CurrencyAmount.copy(buy_in, amount=abs(amount))
+                transactions.append(dict(
+                    user_id=user_id,
+                    currency_id=balances[user_id].currency_id,
+                    amount=amount,
+                    note=f'{kind} from gambling: {note} #{game_id}: {currency_amount}',
+                    transaction_type='deposit' if won else 'withdrawal',
+                ))
+            await session.execute(insert(models.TransactionLog.__table__), transactions)
+            if state is not None:
+                await repositories.GameSessionRepository(session).save([state.to_row()])
+
 
     async def complete_gambling_transaction(self, user, currency_amount: dataclasses.CurrencyAmount, won: bool, note=''):
         # first check they could've afforded the wager amount
@@ -375,6 +449,45 @@ class EconomyService:
         else:
             await self.withdraw_from_wallet(user.id, currency_amount, note=f'Losses from gambling: {note}')
 
+    async def complete_gambling_batch(self, user, wager: dataclasses.CurrencyAmount, rounds: int, net_amount: Decimal, note=''):
+        """Settle many rounds of a game with a single ledger entry for the net amount won (or lost if negative).
+
+        The player must be able to afford losing every round. The check and the ledger entry are one transaction.
+        """
+        worst_case = wager.amount * rounds
+        try:
+            async with self.async_session() as session, session.begin():
+                repo = repositories.WalletRepository(session)
+                balance = await repo.get_currency_balance(user.id, wager.symbol)
+                # checked by the UPDATE applying the net amount, so concurrent games can't overdraw
+                if await repo.adjust_balance(balance, net_amount, min_balance=worst_case) is None:
+                    raise econ_exc.WalletOpFailedException(f'{rounds} rounds of {wager} need a balance of at least {worst_case:.2f}')
+
+                won = net_amount >= 0
+                kind = 'Winnings' if won else 'Losses'
+                net = dataclasses.CurrencyAmount.copy(wager, amount=net_amount)
+                session.add(models.TransactionLog(
+                    user_id=user.id, currency_id=balance.currency_id, amount=net_amount,
+                    note=f'{kind} from gambling: {note} ({rounds} rounds of {wager}): {net}',
+                    transaction_type='deposit' if won else 'withdrawal',
+                ))
+        except exc.NoResultFound as e:
+            raise econ_exc.WalletOpFailedException(f'{e}: Currency {wager.symbol} not found')
+
+    async def checkpoint_games(self, *states):
+        """Store the current state of interactive games."""
+        async with self.async_session() as session, session.begin():
+            await repositories.GameSessionRepository(session).save([state.to_row() for state in states])
+
+    async def find_open_games(self):
+        async with self.async_session() as session:
+            rows = await repositories.GameSessionRepository(session).find_by_status(game_sessions.OPEN)
+            return [game_sessions.GameState.from_row(row) for row in rows]
+
+    async def close_games(self, game_ids, status):
+        async with self.async_session() as session, session.begin():
+            return await repositories.GameSessionRepository(session).set_status(game_ids, status)
+
     async def get_updated_exchange_rate(self, currency_symbol):
         """Enforces the exchange rate policy"""
         try:
@@ -417,11 +530,12 @@ class EconomyService:
             # exchange rate always in terms of base
             # e.g. A = x BPY then x is the rate
         )
+        # by id -- `currency` was loaded by another session and merging it would also merge its stale balances
         if bought:
-            transaction.bought_currency = currency
+            transaction.bought_currency_id = currency.id
             transaction.amount_bought = amount
         else:
-            transaction.sold_currency = currency
+            transaction.sold_currency_id = currency.id
             transaction.amount_sold = amount
 
         # update rate obj
@@ -429,9 +543,20 @@ class EconomyService:
         rate.amount_exchanged = amount
         rate.bought = bought
 
-        await self.session.merge(transaction)
+        self.session.add(transaction)
 
-        await self.session.merge(rate) # also store updated rate which is not in db yet
+        # also store updated rate which is not in db yet
+        self.session.add(models.CurrencyExchangeRate(
+            exchanged_currency_id=currency.id, exchange_rate=rate.exchange_rate, amount_exchanged=amount, bought=bought))
 
     async def get_base_currency(self):
-        return await self(self.currency_repo.get(settings.BASE_CURRENCY))
\ No newline at end of file
+        return await self(self.currency_repo.get(settings.BASE_CURRENCY))
+
+
+def instrument(service_cls):
+    """Count and time the public coroutine methods of a service class, see `metrics.instrument_methods`."""
+    # await_with only runs other methods
+    return metrics.instrument_methods(service_cls, metrics.SERVICE_CALLS, metrics.SERVICE_DURATION, exclude={'await_with'})
+
+
+instrument(EconomyService)
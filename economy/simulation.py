@@ -0,0 +1,85 @@
+"""Monte Carlo simulation of the gambling games in `economy.games`.
+
+Plays millions of vectorized rounds per game without touching any wallets and reports the player's
+expected value, variance and the house edge per unit bet. Used by `run.py simulate-games`.
+"""
+import numpy as np
+
+from economy import games
+from economy.rng import GAMES
+
+
+def _integers(generator, game, size):
+    low, high = GAMES[game]
+    return generator.integers(low, high, size=size)
+
+
+def hilo_attempts(answers, strategy='binary', generator=None):
+    """Attempt each answer is guessed on by a player using the hints, 0 if it isn't guessed.
+
+    Strategies:
+    - binary: guess the middle of the remaining range
+    - random: guess anywhere in the remaining range
+    """
+    low, high = GAMES['guess_hilo']
+    lo = np.full_like(answers, low)
+    hi = np.full_like(answers, high - 1)
+    attempts = np.zeros_like(answers)
+    for attempt in range(1, games.HILO_MAX_GUESSES + 1):
+        if strategy == 'binary':
+            guesses = (lo + hi) // 2
+        else:
+            guesses = generator.integers(lo, hi + 1)
+        attempts[(guesses == answers) & (attempts == 0)] = attempt
+        lo = np.where(guesses < answers, np.maximum(lo, guesses + 1), lo)
+        hi = np.where(guesses > answers, np.minimum(hi, guesses - 1), hi)
+    return attempts
+
+
+def simulate(game, trials, generator, players=4, strategy='binary'):
+    """Returns payouts of `trials` rounds of a game, from the point of view of one player."""
+    if game == 'cointoss':
+        return games.cointoss_payouts(_integers(generator, game, trials), _integers(generator, game, trials))
+    elif game == 'dice':
+        return games.dice_payouts(_integers(generator, game, trials), _integers(generator, game, trials))
+    elif game == 'guess_1p':
+        return games.guess_1p_payouts(_integers(generator, game, trials), _integers(generator, game, trials))
+    elif game == 'guess_hilo':
+        return games.hilo_payouts(hilo_attempts(_integers(generator, game, trials), strategy, generator))
+    elif game == 'guess_multi':
+        guesses = _integers(generator, game, (trials, players))
+        return games.multi_payouts(guesses, _integers(generator, game, trials))[:, 0]
+    raise ValueError(f'Unknown game: {game}')
+
+
+def run(game, trials, seed=None, chunk_size=1_000_000, **kwargs):
+    """Simulate `trials` rounds in chunks of at most `chunk_size` to bound memory use.
+
+    Returns a dict of trials, ev, variance, std, stderr (of ev), house_edge, win_rate and worst/best payouts.
+    """
+    generator = np.random.Generator(np.random.PCG64(seed))
+    n = 0
+    total = 0.0
+    total_sq = 0.0
+    wins = 0
+    worst, best = np.inf, -np.inf
+    while n < trials:
+        payouts = simulate(game, min(chunk_size, trials - n), generator, **kwargs).astype(np.float64)
+        n += len(payouts)
+        total += payouts.sum()
+        total_sq += np.square(payouts).sum()
+        wins += int(np.count_nonzero(payouts > 0))
+        worst, best = min(worst, payouts.min()), max(best, payouts.max())
+    ev = total / n
+    variance = total_sq / n - ev ** 2
+    return dict(
+        trials=n,
+        ev=ev,
+        variance=variance,
+        std=np.sqrt(variance),
+        stderr=np.sqrt(variance / n),
+        house_edge=-ev,
+        win_rate=wins / n,
+        worst=worst,
+        best=best,
+    )
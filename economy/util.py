@@ -1,29 +1,28 @@
-import db
+import kv
 
 
 # Helpers
 def check_mentions_members(ctx):
     return ctx.message.mentions is not None and len(ctx.message.mentions) > 0
 
-# replit db - default currency helpers
+# kv store - default currency helpers
+GUILD_CURRENCY_KEY = 'econ__guild_dc'
+
 def _channel_currency_key(channel_id):
     return f'econ__channel_{channel_id}_dc'
 
-def set_default_guild_currency(symbol):
-    db.replit_db['econ__guild_dc'] = symbol
+async def set_default_guild_currency(symbol):
+    await kv.store.set(GUILD_CURRENCY_KEY, symbol)
 
-def set_default_channel_currency(channel_id, symbol):
+async def set_default_channel_currency(channel_id, symbol):
     k = _channel_currency_key(channel_id)
-    db.replit_db[k] = symbol
+    await kv.store.set(k, symbol)
 
-def get_default_guild_currency():
-    if 'econ__guild_dc' in db.replit_db.keys():
-        return db.replit_db['econ__guild_dc']
+async def get_default_guild_currency():
+    return await kv.store.get(GUILD_CURRENCY_KEY)
 
-def get_default_channel_currency(channel_id=None):
+async def get_default_channel_currency(channel_id=None):
     if channel_id is None:
-        return get_default_guild_currency()
+        return await get_default_guild_currency()
     k = _channel_currency_key(channel_id)
-    if k in db.replit_db.keys():
-        return db.replit_db[k]
-    return None
+    return await kv.store.get(k)
@@ -0,0 +1,146 @@
+"""Shared thread and process pools for work that would otherwise block the event loop.
+
+- `run_in_thread` for blocking I/O: replit db calls, file reads, rendering big templates.
+  Contextvars are copied into the thread so e.g. `db.query_stats` still attribute work to the command.
+- `run_in_process` for CPU-bound work like policy compilation, Monte Carlo runs and term counting --
+  threads would still hold the GIL and stall message handling. Functions and arguments must be picklable.
+
+Both pools are bounded: at most `max_workers * settings.EXECUTOR_QUEUE_FACTOR` calls are submitted at once,
+further callers wait their turn on the event loop (counted in `metrics.EXECUTOR_WAITING`).
+A timed out call raises `asyncio.TimeoutError`. Work that already started keeps running in the background --
+threads can't be killed -- but its result is dropped. It keeps its slot until it finishes, so stuck work
+can't pile up beyond the bound.
+
+Worker processes are started by a forkserver (spawn where there is none) rather than forked from the bot:
+a fork would copy the running event loop, open sockets and locks held by other threads.
+
+E.g.
+```
+import executors
+
+valid = await executors.run_in_process(rewards_policy.check_policy_file, path, timeout=30)
+```
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import metrics, settings
+
+
+logger = logging.getLogger('executors')
+
+
+class BoundedExecutor:
+    def __init__(self, name, executor_cls, max_workers, **executor_kwargs):
+        self.name = name
+        self.executor_cls = executor_cls
+        self.max_workers = max_workers
+        self.executor_kwargs = executor_kwargs
+        self._executor = None
+        self._slots = None
+
+    @property
+    def executor(self):
+        # started on first use -- most commands never need a process pool
+        if self._executor is None:
+            self._executor = self.executor_cls(max_workers=self.max_workers, **self.executor_kwargs)
+            logger.debug(f'Started {self.name} pool with {self.max_workers} workers')
+        return self._executor
+
+    @property
+    def slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers * settings.EXECUTOR_QUEUE_FACTOR)
+        return self._slots
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        task = getattr(func, '__qualname__', None) or repr(func)
+        if timeout is None:
+            timeout = settings.EXECUTOR_TIMEOUT
+
+        slots = self.slots
+        metrics.EXECUTOR_WAITING.inc(pool=self.name)
+        try:
+            await slots.acquire()
+        finally:
+            metrics.EXECUTOR_WAITING.dec(pool=self.name)
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            try:
+                future = self._submit(func, *args, **kwargs)
+            except BaseException:
+                slots.release()
+                raise
+            # the slot is freed when the work is done, not when we stop waiting for it
+            future.add_done_callback(functools.partial(_release_threadsafe, asyncio.get_running_loop(), slots))
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            status = 'ok'
+            return result
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            logger.warning(f'{task} timed out after {timeout}s in the {self.name} pool')
+            raise
+        finally:
+            metrics.EXECUTOR_TASKS.inc(pool=self.name, task=task, status=status)
+            metrics.EXECUTOR_DURATION.observe(time.perf_counter() - start, pool=self.name, task=task)
+
+    def _submit(self, func, *args, **kwargs):
+        if self.executor_cls is ThreadPoolExecutor:
+            context = contextvars.copy_context()
+            return self.executor.submit(context.run, functools.partial(func, *args, **kwargs))
+        return self.executor.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._slots = None
+
+
+def _release_threadsafe(loop, slots, future):
+    # called from the worker (or pool management) thread
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        # the loop is closed, nobody is waiting for a slot anymore
+        pass
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+thread_pool = BoundedExecutor('thread', ThreadPoolExecutor, settings.EXECUTOR_THREADS)
+process_pool = BoundedExecutor('process', ProcessPoolExecutor, settings.EXECUTOR_PROCESSES, mp_context=_mp_context())
+
+
+async def run_in_thread(func, *args, timeout=None, **kwargs):
+    """Run a blocking function in the shared thread pool.
+
+    Raises
+    ------
+    asyncio.TimeoutError
+    """
+    return await thread_pool.run(func, *args, timeout=timeout, **kwargs)
+
+
+async def run_in_process(func, *args, timeout=None, **kwargs):
+    """Run a CPU-bound, picklable function in the shared process pool.
+
+    Raises
+    ------
+    asyncio.TimeoutError
+    """
+    return await process_pool.run(func, *args, timeout=timeout, **kwargs)
+
+
+def shutdown(wait=True):
+    thread_pool.shutdown(wait=wait)
+    process_pool.shutdown(wait=wait)
@@ -1,8 +1,14 @@
 from discord.ext import commands
+import discord
+import asyncio
+import io
 import typing
 import logging
+from datetime import datetime
 
+import db
 import settings
+from profiling import StackSampler
 from base import BaseCog
 
 
@@ -10,6 +16,17 @@ logger = logging.getLogger('extensions.admin')
 
 
 class AdminCommands(BaseCog, name='Admin', description='Bot Admin Commands'):
+    def __init__(self, bot, *args, **kwargs):
+        super().__init__(bot, *args, **kwargs)
+        self.sampler = None
+        # stops the sampler after the requested seconds
+        self.profile_timer = None
+
+    def cog_unload(self):
+        if self.sampler is not None and self.sampler.running:
+            self.sampler.stop()
+        if self.profile_timer is not None:
+            self.profile_timer.cancel()
 
     async def ext_check(self, ctx):
         return ctx.author.id == self.bot.author_id
@@ -107,6 +124,108 @@ class AdminCommands(BaseCog, name='Admin', description='Bot Admin Commands'):
         self.bot.unload_extension(ext)
         await ctx.reply(f"Extension {ext} unloaded.")
 
+    @commands.group(
+        name='debug',
+        help="Inspect the bot's performance. Bot owner only.",
+        brief="Performance debugging",
+    )
+    @commands.is_owner()
+    # `debug` is taken by `BaseCog.debug`
+    async def debug_group(self, ctx):
+        if ctx.invoked_subcommand is None:
+            await ctx.send_help(self.debug_group)
+
+    @debug_group.command(
+        name='queries',
+        help="""Commands that spent the most time in the database recently, with likely N+1 queries and slow statements.
+
+        Sort by `time` (default), statement `count` or `affected` rows. Affected rows are those changed by
+        INSERT, UPDATE and DELETE statements -- rows returned by SELECT aren't counted.
+        """,
+        usage='[time | count | affected] [limit]',
+    )
+    async def queries(self, ctx, sort_by: typing.Optional[str] = 'time', limit: int = 5):
+        keys = dict(time=lambda s: s.elapsed, count=lambda s: s.statements, affected=lambda s: s.affected_rows)
+        if sort_by not in keys:
+            await ctx.reply(f'Invalid sort: {sort_by}. Use one of {", ".join(keys)}.')
+            return
+        recent = list(db.recent_query_stats)
+        worst = sorted(recent, key=keys[sort_by], reverse=True)[:limit]
+
+        embed = discord.Embed(
+            title='Database queries per command',
+            description='' if worst else 'No queries recorded yet.',
+        )
+        for stats in worst:
+            lines = [f'{stats.statements} statements, {stats.affected_rows} rows affected, {stats.elapsed * 1000:.1f}ms']
+            for statement, n in stats.repeated[:2]:
+                lines.append(f'N+1? {n}x `{db.shorten_sql(statement, 80)}`')
+            for elapsed, statement, _ in sorted(stats.slow, reverse=True, key=lambda slow: slow[0])[:2]:
+                lines.append(f'Slow {elapsed * 1000:.0f}ms `{db.shorten_sql(statement, 80)}`')
+            embed.add_field(name=stats.command, value='\n'.join(lines)[:1024], inline=False)
+        embed.set_footer(text=f'{len(recent)} recent commands. Slow: >{settings.DB_SLOW_QUERY_SECONDS * 1000:.0f}ms, N+1: >={settings.DB_N_PLUS_ONE_THRESHOLD} repeats. Affected rows exclude SELECT')
+        await ctx.reply(embed=embed)
+
+    @commands.group(
+        help="Sample the stacks of the running bot and get a collapsed stack file for flamegraph tools. Bot owner only.",
+        brief="Profile the bot",
+    )
+    @commands.is_owner()
+    async def profile(self, ctx):
+        if ctx.invoked_subcommand is None:
+            await ctx.send_help(self.profile)
+
+    @profile.command(
+        name='start',
+        help=f"""Start sampling stacks of all threads every {settings.PROFILE_SAMPLE_INTERVAL * 1000:g}ms.
+
+        Stops after the given seconds (at most {settings.PROFILE_MAX_SECONDS}) or on `profile stop`.
+        """,
+        usage='[seconds]',
+    )
+    async def profile_start(self, ctx, seconds: typing.Optional[float] = None):
+        if self.sampler is not None and self.sampler.running:
+            await ctx.reply(f'Already profiling for {self.sampler.elapsed:.0f}s. Use `profile stop`.')
+            return
+        # `not >` also rejects nan
+        if seconds is not None and not seconds > 0:
+            await ctx.reply(f'Seconds must be more than 0. Usage: `profile start [seconds]`, at most {settings.PROFILE_MAX_SECONDS}s.')
+            return
+        seconds = min(seconds or settings.PROFILE_MAX_SECONDS, settings.PROFILE_MAX_SECONDS)
+        self.sampler = StackSampler()
+        self.sampler.start()
+        logger.info(f'Started profiling for up to {seconds}s')
+        self.profile_timer = asyncio.create_task(self._stop_profile_later(ctx, seconds))
+        await ctx.reply(f'Profiling for up to {seconds:g}s.')
+
+    @profile.command(
+        name='stop',
+        help="Stop sampling and attach the collapsed stacks.",
+    )
+    async def profile_stop(self, ctx):
+        if self.sampler is None or not self.sampler.running:
+            await ctx.reply('Not profiling. Use `profile start [seconds]`.')
+            return
+        self.profile_timer.cancel()
+        await self._reply_profile(ctx)
+
+    async def _stop_profile_later(self, ctx, seconds):
+        await asyncio.sleep(seconds)
+        await self._reply_profile(ctx)
+
+    async def _reply_profile(self, ctx):
+        sampler = self.sampler
+        sampler.stop()
+        logger.info(f'Stopped profiling: {sampler}')
+        top = '\n'.join(f'{share:6.1%} `{label}`' for label, share in sampler.top_functions())
+        filename = f'profile-{datetime.utcnow():%Y%m%d-%H%M%S}.collapsed'
+        file = discord.File(io.BytesIO(sampler.collapsed().encode()), filename=filename)
+        await ctx.reply(
+            f'Profiled {sampler}. Most sampled functions:\n{top}\n'
+            'Open the file with speedscope.app or `flamegraph.pl`.',
+            file=file,
+        )
+
 
 def setup(bot):
     bot.add_cog(AdminCommands(bot))
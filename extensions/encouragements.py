@@ -4,6 +4,7 @@ import aiohttp
 import json
 import random
 
+import executors
 from base import BaseCog
 
 sad_words = ['sad', 'depressed', 'unhappy', 'angry', 'miserable']
@@ -27,6 +28,25 @@ def delete_encouragements(index):
     db['encouragements'] = encouragements
 
 
+# replit db calls are blocking http requests -- run these with `executors.run_in_thread`
+
+def get_encouragements():
+    if 'encouragements' in db.keys():
+        return list(db['encouragements'])
+    return []
+
+
+def set_responding(val):
+    db['responding'] = val
+
+
+def get_responses():
+    """Messages to respond with or None if responding is off."""
+    if not db['responding']:
+        return None
+    return starter_encouragements + get_encouragements()
+
+
 quotes_url = 'https://zenquotes.io/api/random'
 
 
@@ -56,39 +76,36 @@ class Encouragements(BaseCog, name='Encouragements'):
 
     @encourage.command(name='active', help='Enable/Disable')
     async def responding(self, ctx, val: bool):
-        db['responding'] = val
+        await executors.run_in_thread(set_responding, val)
         status = 'on' if val else 'off'
         await ctx.send(f'Responding: {status}')
 
     @encourage.command(help='List all messages.')
     async def list(self, ctx):
-        encouragements = []
-        if 'encouragements' in db.keys():
-            encouragements = db['encouragements']
+        encouragements = await executors.run_in_thread(get_encouragements)
         await ctx.send(encouragements)
 
     @encourage.command(help='Add a message to DB.')
     async def add(self, ctx, new_msg: str):
-        update_encouragements(new_msg)
+        await executors.run_in_thread(update_encouragements, new_msg)
         await ctx.send('New message added.')
 
     @encourage.command(help='Delete from DB.')
     async def delete(self, ctx, index: int):
-        encouragements = []
-        if 'encouragements' in db.keys():
-            delete_encouragements(index)
-            encouragements = db['encouragements']
+        encouragements = await executors.run_in_thread(get_encouragements)
+        if encouragements:
+            await executors.run_in_thread(delete_encouragements, index)
+            encouragements = await executors.run_in_thread(get_encouragements)
         await ctx.send(encouragements)
 
     @commands.Cog.listener()
     async def on_message(self, message):
-        if db['responding']:
-            options = starter_encouragements
-            if 'encouragements' in db.keys():
-                options = options + list(db['encouragements'])
-
-            if any(word in message.content for word in sad_words):
-                await message.channel.send(random.choice(options))
+        # only ask replit db when there is something to respond to
+        if not any(word in message.content for word in sad_words):
+            return
+        options = await executors.run_in_thread(get_responses)
+        if options:
+            await message.channel.send(random.choice(options))
 
 
 def setup(bot):
@@ -8,7 +8,7 @@ from base import BaseCog
 
 class Greetings(BaseCog):
     def __init__(self, bot):
-        self.bot = bot
+        super().__init__(bot)
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
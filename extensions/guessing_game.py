@@ -11,7 +11,7 @@ from base import BaseCog
 # https://github.com/Rapptz/discord.py/blob/v1.7.2/examples/guessing_game.py
 class GuessingGame(BaseCog, name="Free guessing game -- with nothing at stake."):
     def __init__(self, bot):
-        self.bot = bot
+        super().__init__(bot)
     
     async def tick(self, ctx, correct):
         emoji = '\N{WHITE HEAVY CHECK MARK}' if correct else '\N{CROSS MARK}'
@@ -0,0 +1,60 @@
+from discord.ext import commands, tasks
+import discord
+import logging
+
+import db
+import settings
+from base import BaseCog
+
+
+logger = logging.getLogger('extensions.storage')
+
+
+class Storage(BaseCog, name='Storage', description='Database storage maintenance. Bot owner only.'):
+    def __init__(self, bot, *args, **kwargs):
+        super().__init__(bot, *args, **kwargs)
+        self.last_checkpoint = None
+        self.checkpoint.start()
+
+    def cog_unload(self):
+        self.checkpoint.cancel()
+
+    async def cog_check(self, ctx):
+        return await self.bot.is_owner(ctx.author)
+
+    @tasks.loop(seconds=settings.DB_WAL_CHECKPOINT_INTERVAL)
+    async def checkpoint(self):
+        """Periodically checkpoint the WAL so it does not grow without bound while readers are active."""
+        stats = await db.checkpoint_wal()
+        if stats is None:
+            # not sqlite
+            self.checkpoint.cancel()
+            return
+        self.last_checkpoint = stats
+        logger.info(f'WAL checkpoint: {stats}')
+        if stats['busy']:
+            logger.warning('WAL checkpoint could not complete because of active readers or writers')
+
+    @checkpoint.before_loop
+    async def before_checkpoint(self):
+        await self.bot.wait_until_ready()
+
+    @commands.command(
+        name='db_status',
+        help='View database storage profile and write-ahead log status. Bot owner only.',
+    )
+    async def db_status(self, ctx, checkpoint: bool = False):
+        if checkpoint:
+            self.last_checkpoint = await db.checkpoint_wal()
+        embed = discord.Embed(title='Database Storage')
+        embed.add_field(name='Profile', value=settings.DB_STORAGE_PROFILE, inline=False)
+        for name, value in settings.DB_STORAGE_PROFILES[settings.DB_STORAGE_PROFILE].items():
+            embed.add_field(name=name, value=str(value))
+        if self.last_checkpoint:
+            for name, value in self.last_checkpoint.items():
+                embed.add_field(name=f'Last checkpoint: {name}', value=str(value))
+        await ctx.reply(embed=embed)
+
+
+def setup(bot):
+    bot.add_cog(Storage(bot))
@@ -1,6 +1,8 @@
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread
 
+import metrics
+
 app = Flask('')
 
 
@@ -9,6 +11,11 @@ def home():
     return 'Alive'
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 def run():
     app.run(host='0.0.0.0', port=8000)
 
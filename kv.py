@@ -0,0 +1,100 @@
+"""Key-value settings store backed by the `kv` table.
+
+All keys are read into an in-memory cache on first access so lookups are dict lookups.
+Writes go to the database first and then update the cache.
+
+E.g.
+```
+import kv
+
+await kv.store.set('econ__guild_dc', 'BPY')
+symbol = await kv.store.get('econ__guild_dc')
+```
+"""
+import asyncio
+import json
+import logging
+
+from sqlalchemy import delete
+from sqlalchemy.future import select
+
+import db, executors, metrics
+
+
+logger = logging.getLogger('kv')
+
+_MISSING = object()
+
+
+class KeyValueStore:
+    def __init__(self, async_session=None):
+        self._async_session = async_session
+        self._cache = {}
+        self._loaded = False
+        self._lock = None
+
+    @property
+    def async_session(self):
+        return self._async_session or db.async_session
+
+    async def load(self):
+        """(Re)load all keys into the cache."""
+        async with self.async_session() as session:
+            res = await session.execute(select(db.KeyValue.key, db.KeyValue.value))
+            self._cache = dict(res.all())
+        self._loaded = True
+        logger.debug(f'Loaded {len(self._cache)} keys')
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._loaded:
+                await self.load()
+
+    async def get(self, key, default=None):
+        await self._ensure_loaded()
+        value = self._cache.get(key, _MISSING)
+        metrics.record_cache('kv', value is not _MISSING)
+        return default if value is _MISSING else value
+
+    async def keys(self):
+        await self._ensure_loaded()
+        return list(self._cache.keys())
+
+    async def set(self, key, value):
+        async with self.async_session() as session, session.begin():
+            stmt = db.upsert(session.bind.dialect.name, db.KeyValue.__table__, dict(key=key, value=value), ['key'], update_columns=['value'])
+            await session.execute(stmt)
+        self._cache[key] = value
+
+    async def delete(self, key):
+        async with self.async_session() as session, session.begin():
+            await session.execute(delete(db.KeyValue).where(db.KeyValue.key == key))
+        self._cache.pop(key, None)
+
+    def clear_cache(self):
+        self._cache = {}
+        self._loaded = False
+
+
+store = KeyValueStore()
+
+
+async def import_from_replit(prefix='', overwrite=False, kv_store=store):
+    """Copy keys starting with prefix from replit db. Returns the list of imported keys."""
+    replit_db = db.get_replit_db()
+    existing = set(await kv_store.keys())
+    imported = []
+    # replit db calls are blocking http requests
+    for key in await executors.run_in_thread(replit_db.prefix, prefix):
+        if key in existing and not overwrite:
+            logger.info(f'Skipping existing key {key}')
+            continue
+        # raw values are JSON -- avoids replit's observed list/dict wrappers
+        value = json.loads(await executors.run_in_thread(replit_db.get_raw, key))
+        await kv_store.set(key, value)
+        imported.append(key)
+    return imported
@@ -0,0 +1,104 @@
+"""Event loop watchdog: measures loop lag and finds the code blocking the loop.
+
+A heartbeat task sleeps `interval` seconds in a loop and measures how late it wakes up. That lag is the time
+other callbacks held the loop -- every guild waits while e.g. a synchronous DB call or a file read runs.
+Lag is exported as `metrics.EVENT_LOOP_LAG`, and stalls longer than `threshold` are counted and logged.
+
+With `capture_stacks` (on in debug mode), a thread also watches the heartbeat. When it is late by more than
+`threshold`, the loop is still blocked, so the thread logs the loop thread's current stack -- the culprit.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import metrics, settings
+
+
+logger = logging.getLogger('watchdog')
+
+PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopWatchdog:
+    def __init__(self, interval=None, threshold=None, capture_stacks=None):
+        self.interval = interval if interval is not None else settings.WATCHDOG_INTERVAL
+        self.threshold = threshold if threshold is not None else settings.WATCHDOG_STALL_SECONDS
+        self.capture_stacks = capture_stacks if capture_stacks is not None else settings.WATCHDOG_CAPTURE_STACKS
+        self.last_beat = None
+        self.loop_thread_id = None
+        # innermost project frame of the current stall, set by the monitor thread
+        self.stalled_in = None
+        self.task = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        monitor = None
+        if self.capture_stacks:
+            self._stop.clear()
+            monitor = threading.Thread(target=self._monitor, name='loop-watchdog', daemon=True)
+            monitor.start()
+        logger.info(f'Watching the event loop for stalls over {self.threshold * 1000:.0f}ms')
+        try:
+            while True:
+                started = loop.time()
+                self.last_beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = max(loop.time() - started - self.interval, 0.0)
+                metrics.EVENT_LOOP_LAG.set(lag)
+                if lag >= self.threshold:
+                    metrics.EVENT_LOOP_STALLS.inc()
+                    metrics.EVENT_LOOP_STALL_DURATION.observe(lag)
+                    where = f' in {self.stalled_in}' if self.stalled_in else ''
+                    logger.warning(f'Event loop was blocked for {lag * 1000:.0f}ms{where}')
+                self.stalled_in = None
+        finally:
+            self._stop.set()
+            if monitor is not None:
+                # the thread notices within `threshold / 2` -- wait without blocking the loop, a daemon thread
+                # still stuck after that doesn't keep the process alive
+                deadline = time.monotonic() + self.threshold
+                while monitor.is_alive() and time.monotonic() < deadline:
+                    await asyncio.sleep(self.threshold / 10)
+
+    def _monitor(self):
+        captured_beat = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self.last_beat
+            late = time.monotonic() - beat - self.interval
+            # one stack per stall
+            if late < self.threshold or beat == captured_beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            captured_beat = beat
+            stack = traceback.extract_stack(frame)
+            self.stalled_in = self._culprit(stack)
+            logger.warning(
+                f'Event loop blocked for {late * 1000:.0f}ms so far in {self.stalled_in}:\n'
+                + ''.join(traceback.format_list(stack))
+            )
+
+    @staticmethod
+    def _culprit(stack):
+        """Innermost frame in project code, else the innermost frame."""
+        for frame in reversed(stack):
+            if frame.filename.startswith(PROJECT_PATH) and 'site-packages' not in frame.filename:
+                return f'{frame.name} ({os.path.relpath(frame.filename, PROJECT_PATH)}:{frame.lineno})'
+        frame = stack[-1]
+        return f'{frame.name} ({frame.filename}:{frame.lineno})'
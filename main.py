@@ -1,17 +1,38 @@
+import time
+
+# for startup time reporting
+started = time.perf_counter()
+
 from discord.ext import commands
 import logging, logging.config
-import importlib
 import settings
+import db
+import util
+from loop_watchdog import LoopWatchdog
 
 logging.config.dictConfig(settings.LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
 bot = commands.Bot(command_prefix=settings.COMMAND_PREFIX, case_insensitive=True)
 
+# set by `run.py profile-startup --until-ready`
+close_on_ready = False
+# on_ready fires again after reconnects
+watchdog = None
+
 
 @bot.event
 async def on_ready():
+    global watchdog
     logging.info(f'We have logged in as {bot.user}')
+    if watchdog is None:
+        watchdog = LoopWatchdog()
+        watchdog.start()
+    elapsed = time.perf_counter() - started
+    logger.info(f'Ready {elapsed:.3f}s after startup')
+    if close_on_ready:
+        print(f'STARTUP_READY {elapsed}')
+        await bot.close()
 
 
 @bot.event
@@ -22,21 +43,10 @@ async def on_message(message):
     await bot.process_commands(message)
 
 
-def _import_models(package):
-    try:
-        importlib.import_module(f"{package}.models")
-        logger.debug(f'Imported {package}.models')
-    except ModuleNotFoundError:
-        pass
-    except ImportError:
-        logger.error(f'ImportError: import `{package}.models`')
-        return
-
-
 def init_extensions():
+    db.import_models()
     for extension in settings.EXTENSIONS:
         logger.debug(f'Init extension {extension}')
-        _import_models(extension)
         bot.load_extension(extension)
 
 
@@ -47,6 +57,7 @@ def main():
         logger.info(f'Setting bot author id to {settings.BOT_OWNER_ID}')
 
     init_extensions()
+    util.preload_templates()
 
     bot.run(settings.TOKEN)
 
@@ -0,0 +1,265 @@
+"""In-process Prometheus style metrics, served in the text exposition format at `/metrics` by `keep_alive`.
+
+Metrics are updated on the bot's event loop and read by the flask thread, so every metric has its own lock.
+All metrics of the bot are declared at the bottom of this module.
+
+E.g.
+```
+import metrics
+
+metrics.COMMANDS.inc(cog='Economy.Wallet', command='pay', status='ok')
+with metrics.DB_QUERY_DURATION.time(engine='write', statement='select'):
+    ...
+```
+"""
+import contextvars
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# seconds -- from a dict lookup to a slow discord API call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # label values tuple: value
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', self._labels(key), value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [bucket counts, sum, count]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        """Number of observations."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', labels + [('le', _format_value(float(bound)))], cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+def render():
+    return REGISTRY.render()
+
+
+#
+# Helpers
+
+def record_cache(cache, hit):
+    """Count a cache lookup and update the cache's hit ratio."""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+    hits = CACHE_REQUESTS.get(cache=cache, result='hit')
+    misses = CACHE_REQUESTS.get(cache=cache, result='miss')
+    CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+def instrument_methods(cls, calls, duration, exclude=()):
+    """Count and time every public coroutine method defined on `cls`, labelled with the method name.
+
+    Wraps plain and static methods in place. Exceptions are counted with `status='error'` and re-raised.
+    Subclasses can be instrumented too: an override calling the instrumented base method with `super()`
+    is only counted once, by the outermost call.
+    """
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or name in exclude:
+            continue
+        is_static = isinstance(attr, staticmethod)
+        func = attr.__func__ if is_static else attr
+        if not inspect.iscoroutinefunction(func):
+            continue
+        wrapper = _instrumented(func, name, calls, duration)
+        setattr(cls, name, staticmethod(wrapper) if is_static else wrapper)
+    return cls
+
+
+# (counter, method name) of the instrumented calls running in this task
+_active_calls = contextvars.ContextVar('metrics_active_calls', default=frozenset())
+
+
+def _instrumented(func, name, calls, duration):
+    key = (id(calls), name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        active = _active_calls.get()
+        if key in active:
+            # e.g. `super().method()` from an instrumented override
+            return await func(*args, **kwargs)
+        token = _active_calls.set(active | {key})
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = await func(*args, **kwargs)
+            status = 'ok'
+            return result
+        finally:
+            _active_calls.reset(token)
+            duration.observe(time.perf_counter() - start, method=name)
+            calls.inc(method=name, status=status)
+    return wrapper
+
+
+#
+# Metrics
+
+COMMANDS = Counter('bot_commands_total', 'Commands invoked.', ['cog', 'command', 'status'])
+COMMAND_DURATION = Histogram('bot_command_duration_seconds', 'Command latency.', ['cog', 'command'])
+
+SERVICE_CALLS = Counter('economy_service_calls_total', 'EconomyService method calls.', ['method', 'status'])
+SERVICE_DURATION = Histogram('economy_service_duration_seconds', 'EconomyService method latency.', ['method'])
+
+DB_QUERIES = Counter('db_queries_total', 'Executed SQL statements.', ['engine', 'statement'])
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'SQL statement latency.', ['engine', 'statement'])
+
+REWARD_EVENTS = Counter('reward_events_total', 'Discord events handled by reward policy rules.', ['rule', 'event'])
+REWARD_RULE_HITS = Counter('reward_rule_hits_total', 'Reward policy rules whose conditions matched.', ['rule'])
+REWARD_GRANTS = Counter('reward_grants_total', 'Rewards granted.', ['rule', 'currency'])
+
+# see `loop_watchdog.LoopWatchdog`
+EVENT_LOOP_LAG = Gauge('event_loop_lag_seconds', 'How late the event loop last woke up from a sleep.')
+EVENT_LOOP_STALLS = Counter('event_loop_stalls_total', 'Times the event loop was blocked longer than the watchdog threshold.')
+EVENT_LOOP_STALL_DURATION = Histogram(
+    'event_loop_stall_duration_seconds', 'How long the event loop was blocked per stall.',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# see `executors`
+EXECUTOR_TASKS = Counter('executor_tasks_total', 'Calls run in the shared thread and process pools.', ['pool', 'task', 'status'])
+EXECUTOR_DURATION = Histogram('executor_task_duration_seconds', 'Time from submitting a call to its result.', ['pool', 'task'])
+EXECUTOR_WAITING = Gauge('executor_waiting', 'Calls waiting for a free pool slot.', ['pool'])
+
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups.', ['cache', 'result'])
+CACHE_HIT_RATIO = Gauge('cache_hit_ratio', 'Cache hits over lookups since startup.', ['cache'])
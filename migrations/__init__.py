@@ -0,0 +1,174 @@
+"""Small versioned schema migration runner.
+
+Migrations live in `migrations/versions` as modules named `<version>_<name>.py`, e.g. `0001_ledger_indexes.py`.
+Each module defines `upgrade(conn)` and `downgrade(conn)` which receive a *sync* sqlalchemy connection
+(they are run with `AsyncConnection.run_sync`). The module docstring is used as the migration description.
+
+Applied versions are tracked in the `schema_migration` table.
+
+E.g.
+```
+./run.py migrate             # apply all pending migrations
+./run.py migrate --to 0001   # upgrade or downgrade to a specific version
+./run.py migrations          # list migrations and whether they are applied
+```
+"""
+import importlib
+import logging
+import pkgutil
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+
+from sqlalchemy import Column, String, DateTime, func, inspect, select, delete, insert, Index, Table, MetaData
+
+from db import Base
+
+
+logger = logging.getLogger('migrations')
+
+VERSIONS_PATH = Path(__file__).parent / 'versions'
+
+
+class SchemaMigration(Base):
+    __tablename__ = 'schema_migration'
+
+    version = Column(String, primary_key=True)
+    name = Column(String)
+    applied = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"SchemaMigration({self.version!r}, {self.name!r})"
+
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    module: ModuleType
+
+    @property
+    def description(self):
+        return (self.module.__doc__ or '').strip()
+
+    def upgrade(self, conn):
+        self.module.upgrade(conn)
+
+    def downgrade(self, conn):
+        self.module.downgrade(conn)
+
+    def __str__(self):
+        return f'{self.version} {self.name}'
+
+
+def load_migrations():
+    """Import all migration modules, sorted by version."""
+    found = []
+    for module_info in pkgutil.iter_modules([str(VERSIONS_PATH)]):
+        version, _, name = module_info.name.partition('_')
+        module = importlib.import_module(f'migrations.versions.{module_info.name}')
+        found.append(Migration(version=version, name=name, module=module))
+    return sorted(found, key=lambda m: m.version)
+
+
+#
+# Sync helpers -- run with `AsyncConnection.run_sync`
+
+def applied_versions(conn):
+    SchemaMigration.__table__.create(conn, checkfirst=True)
+    res = conn.execute(select(SchemaMigration.version))
+    return set(res.scalars().all())
+
+
+def _mark_applied(conn, migration):
+    conn.execute(insert(SchemaMigration.__table__).values(version=migration.version, name=migration.name))
+
+
+def _mark_unapplied(conn, migration):
+    conn.execute(delete(SchemaMigration.__table__).where(SchemaMigration.version == migration.version))
+
+
+def stamp(conn, migrations=None):
+    """Mark migrations as applied without running them.
+
+    Used after `create_all` since freshly created tables already match the current models.
+    """
+    if migrations is None:
+        migrations = load_migrations()
+    applied = applied_versions(conn)
+    for migration in migrations:
+        if migration.version not in applied:
+            _mark_applied(conn, migration)
+
+
+def plan(conn, target=None):
+    """Returns a list of (migration, upgrade?) tuples needed to reach target version (latest by default)."""
+    migrations = load_migrations()
+    applied = applied_versions(conn)
+    if target is None:
+        return [(m, True) for m in migrations if m.version not in applied]
+    if target not in {m.version for m in migrations} and target != '0000':
+        raise ValueError(f'Unknown migration version: {target}')
+    steps = [(m, True) for m in migrations if m.version <= target and m.version not in applied]
+    steps += [(m, False) for m in reversed(migrations) if m.version > target and m.version in applied]
+    return steps
+
+
+def run_step(conn, migration, upgrade=True):
+    if upgrade:
+        logger.info(f'Applying migration {migration}')
+        migration.upgrade(conn)
+        _mark_applied(conn, migration)
+    else:
+        logger.info(f'Reverting migration {migration}')
+        migration.downgrade(conn)
+        _mark_unapplied(conn, migration)
+
+
+#
+# Async entry points
+
+async def migrate(engine, target=None):
+    """Apply (or revert) migrations to reach target. Each migration runs in its own DB transaction.
+
+    Returns the list of (migration, upgrade?) steps that were run.
+    """
+    async with engine.begin() as conn:
+        steps = await conn.run_sync(plan, target)
+    for migration, upgrade in steps:
+        async with engine.begin() as conn:
+            await conn.run_sync(run_step, migration, upgrade)
+    return steps
+
+
+async def status(engine):
+    """Returns a list of (migration, applied?) tuples."""
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(applied_versions)
+    return [(m, m.version in applied) for m in load_migrations()]
+
+
+#
+# Operations for use in migration modules
+
+def has_table(conn, table_name):
+    return inspect(conn).has_table(table_name)
+
+
+def reflect_table(conn, table_name):
+    return Table(table_name, MetaData(), autoload_with=conn)
+
+
+def create_index(conn, name, table_name, *columns, unique=False):
+    if not has_table(conn, table_name):
+        logger.info(f'Skipping index {name}: no table {table_name}')
+        return
+    table = reflect_table(conn, table_name)
+    Index(name, *[table.c[c] for c in columns], unique=unique).create(conn, checkfirst=True)
+
+
+def drop_index(conn, name, table_name, *columns):
+    if not has_table(conn, table_name):
+        return
+    table = reflect_table(conn, table_name)
+    Index(name, *[table.c[c] for c in columns]).drop(conn, checkfirst=True)
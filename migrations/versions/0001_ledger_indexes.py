@@ -0,0 +1,26 @@
+"""Add indexes on the ledger, exchange rate and balance tables."""
+from migrations import create_index, drop_index
+
+
+# (index name, table name, columns)
+INDEXES = [
+    ('ix_transaction_user_id_created', 'transaction', ('user_id', 'created')),
+    ('ix_transaction_related_user_id_created', 'transaction', ('related_user_id', 'created')),
+    ('ix_transaction_currency_id', 'transaction', ('currency_id',)),
+    ('ix_reward_log_user_id_created', 'reward_log', ('user_id', 'created')),
+    ('ix_reward_log_currency_id', 'reward_log', ('currency_id',)),
+    ('ix_currency_exchange_transaction_user_id_created', 'currency_exchange_transaction', ('user_id', 'created')),
+    ('ix_currency_exchange_rate_currency_id_created', 'currency_exchange_rate', ('exchanged_currency_id', 'created')),
+    ('ix_wallet_currency_wallet_id', 'wallet_currency', ('wallet_id',)),
+    ('ix_wallet_user_id', 'wallet', ('user_id',)),
+]
+
+
+def upgrade(conn):
+    for name, table_name, columns in INDEXES:
+        create_index(conn, name, table_name, *columns)
+
+
+def downgrade(conn):
+    for name, table_name, columns in reversed(INDEXES):
+        drop_index(conn, name, table_name, *columns)
@@ -0,0 +1,28 @@
+"""Add the ledger_summary table for archived ledger rows."""
+from sqlalchemy import Table, MetaData, Column, Integer, String, Numeric, ForeignKey, DateTime, UniqueConstraint
+
+
+metadata = MetaData()
+
+ledger_summary = Table(
+    'ledger_summary', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('ledger', String, nullable=False),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=True),
+    Column('currency_id', Integer, ForeignKey('currency.id'), nullable=True),
+    Column('amount', Numeric(10, 2), default=0.0, nullable=False),
+    Column('count', Integer, default=0, nullable=False),
+    Column('first_created', DateTime, nullable=True),
+    Column('last_created', DateTime, nullable=True),
+    UniqueConstraint('ledger', 'user_id', 'currency_id', name='uix_ledger_user_currency'),
+)
+
+
+def upgrade(conn):
+    # referenced tables are needed to render the foreign keys
+    metadata.reflect(conn, only=['user', 'currency'])
+    ledger_summary.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    ledger_summary.drop(conn, checkfirst=True)
@@ -0,0 +1,19 @@
+"""Add the kv table for project settings previously stored in replit db."""
+from sqlalchemy import Table, MetaData, Column, String, JSON
+
+
+metadata = MetaData()
+
+kv = Table(
+    'kv', metadata,
+    Column('key', String, primary_key=True),
+    Column('value', JSON, nullable=True),
+)
+
+
+def upgrade(conn):
+    kv.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    kv.drop(conn, checkfirst=True)
@@ -0,0 +1,32 @@
+"""Add the game_session table to checkpoint interactive games."""
+from sqlalchemy import Table, MetaData, Column, Integer, BigInteger, String, Numeric, DateTime, JSON, Index, func
+
+
+metadata = MetaData()
+
+game_session = Table(
+    'game_session', metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=False),
+    Column('game', String, nullable=False),
+    Column('status', String, nullable=False),
+    Column('channel_id', BigInteger, nullable=False),
+    Column('user_id', BigInteger, nullable=False),
+    Column('reply_to_id', BigInteger, nullable=False),
+    Column('symbol', String(length=3), nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+    Column('answer', Integer, nullable=False),
+    Column('rng_position', Integer, nullable=False),
+    Column('attempts', Integer, default=0, nullable=False),
+    Column('players', JSON, nullable=True),
+    Column('created', DateTime, server_default=func.now()),
+    Column('updated', DateTime, server_default=func.now()),
+    Index('ix_game_session_status', 'status'),
+)
+
+
+def upgrade(conn):
+    game_session.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    game_session.drop(conn, checkfirst=True)
@@ -0,0 +1,47 @@
+"""Add message.channel_id and the channel_ingest_state table for nlp read_history."""
+from sqlalchemy import Table, MetaData, Column, Integer, BigInteger, String, DateTime, ForeignKey, Index, func, text
+
+from migrations import has_table, reflect_table
+
+
+metadata = MetaData()
+
+message = Table(
+    'message', metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=False),
+    Column('channel_id', BigInteger, nullable=True),
+    Column('content', String),
+    Column('created_at', DateTime),
+    Column('mentions', String, nullable=True),
+    Column('channel_mentions', String, nullable=True),
+    Column('jump_url', String, nullable=True),
+    Column('author_id', BigInteger, ForeignKey('user.id'), nullable=False),
+    Column('reference_id', BigInteger, ForeignKey('message.id'), nullable=True),
+)
+
+message_channel_index = Index('ix_message_channel_id_id', message.c.channel_id, message.c.id)
+
+channel_ingest_state = Table(
+    'channel_ingest_state', metadata,
+    Column('channel_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('last_message_id', BigInteger, nullable=True),
+    Column('message_count', Integer, default=0, nullable=False),
+    Column('updated', DateTime, server_default=func.now()),
+)
+
+
+def upgrade(conn):
+    if not has_table(conn, 'message'):
+        # referenced tables are needed to render the foreign keys
+        metadata.reflect(conn, only=['user'])
+        message.create(conn)
+    elif 'channel_id' not in reflect_table(conn, 'message').c:
+        conn.execute(text('ALTER TABLE message ADD COLUMN channel_id BIGINT'))
+    message_channel_index.create(conn, checkfirst=True)
+    channel_ingest_state.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    channel_ingest_state.drop(conn, checkfirst=True)
+    message_channel_index.drop(conn, checkfirst=True)
+    # keeps message.channel_id -- older sqlite versions cannot drop columns
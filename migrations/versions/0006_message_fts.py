@@ -0,0 +1,47 @@
+"""Add a full-text search index over message content (FTS5 on sqlite, GIN on postgres)."""
+from sqlalchemy import text
+
+
+CREATE = {
+    'sqlite': [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts
+        USING fts5(content, content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+        """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        # index messages stored before this migration
+        "INSERT INTO message_fts(message_fts) VALUES ('rebuild')",
+    ],
+    'postgresql': [
+        "CREATE INDEX IF NOT EXISTS ix_message_content_fts ON message USING gin (to_tsvector('simple', coalesce(content, '')))",
+    ],
+}
+
+DROP = {
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS message_fts_ai',
+        'DROP TRIGGER IF EXISTS message_fts_ad',
+        'DROP TRIGGER IF EXISTS message_fts_au',
+        'DROP TABLE IF EXISTS message_fts',
+    ],
+    'postgresql': [
+        'DROP INDEX IF EXISTS ix_message_content_fts',
+    ],
+}
+
+
+def upgrade(conn):
+    for statement in CREATE.get(conn.dialect.name, []):
+        conn.execute(text(statement))
+
+
+def downgrade(conn):
+    for statement in DROP.get(conn.dialect.name, []):
+        conn.execute(text(statement))
@@ -0,0 +1,27 @@
+"""Add the term_count table and channel_ingest_state.terms_message_id for nlp analytics."""
+from sqlalchemy import Table, MetaData, Column, Integer, BigInteger, String, Date, Index, text
+
+from migrations import reflect_table
+
+
+metadata = MetaData()
+
+term_count = Table(
+    'term_count', metadata,
+    Column('channel_id', BigInteger, primary_key=True, autoincrement=False),
+    Column('day', Date, primary_key=True),
+    Column('term', String, primary_key=True),
+    Column('count', Integer, default=0, nullable=False),
+    Index('ix_term_count_day', 'day'),
+)
+
+
+def upgrade(conn):
+    if 'terms_message_id' not in reflect_table(conn, 'channel_ingest_state').c:
+        conn.execute(text('ALTER TABLE channel_ingest_state ADD COLUMN terms_message_id BIGINT'))
+    term_count.create(conn, checkfirst=True)
+
+
+def downgrade(conn):
+    term_count.drop(conn, checkfirst=True)
+    # keeps channel_ingest_state.terms_message_id -- older sqlite versions cannot drop columns
@@ -0,0 +1,40 @@
+"""Add the message_thread table and fill it from message.reference_id."""
+from sqlalchemy import Table, MetaData, Column, Integer, BigInteger, ForeignKey, Index, text
+
+from migrations import has_table
+
+
+metadata = MetaData()
+
+message_thread = Table(
+    'message_thread', metadata,
+    Column('message_id', BigInteger, ForeignKey('message.id'), primary_key=True, autoincrement=False),
+    Column('root_id', BigInteger, nullable=False),
+    Column('depth', Integer, default=0, nullable=False),
+    Index('ix_message_thread_root_id', 'root_id', 'message_id'),
+)
+
+# replies always reference older messages, so the recursion ends
+BACKFILL = text("""
+INSERT INTO message_thread (message_id, root_id, depth)
+WITH RECURSIVE thread(message_id, root_id, depth) AS (
+    SELECT id, id, 0 FROM message WHERE reference_id IS NULL
+    UNION ALL
+    SELECT message.id, thread.root_id, thread.depth + 1
+    FROM message JOIN thread ON message.reference_id = thread.message_id
+)
+SELECT message_id, root_id, depth FROM thread
+""")
+
+
+def upgrade(conn):
+    if has_table(conn, 'message_thread'):
+        return
+    # referenced tables are needed to render the foreign keys
+    metadata.reflect(conn, only=['message'])
+    message_thread.create(conn)
+    conn.execute(BACKFILL)
+
+
+def downgrade(conn):
+    message_thread.drop(conn, checkfirst=True)
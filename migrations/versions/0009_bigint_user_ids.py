@@ -0,0 +1,34 @@
+"""Widen economy user id columns to BIGINT so Discord ids fit on Postgres. (SQLite integers are already 64 bit.)"""
+from sqlalchemy import text
+
+from migrations import has_table
+
+
+# table: user id columns
+COLUMNS = {
+    'wallet': ['user_id'],
+    'transaction': ['user_id', 'related_user_id'],
+    'reward_log': ['user_id'],
+    'currency_exchange_transaction': ['user_id'],
+    'ledger_summary': ['user_id'],
+}
+
+
+def _alter(conn, column_type):
+    if conn.dialect.name != 'postgresql':
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    for table_name, columns in COLUMNS.items():
+        if not has_table(conn, table_name):
+            continue
+        alter = ', '.join(f'ALTER COLUMN {quote(c)} TYPE {column_type}' for c in columns)
+        # "transaction" is a reserved word
+        conn.execute(text(f'ALTER TABLE {quote(table_name)} {alter}'))
+
+
+def upgrade(conn):
+    _alter(conn, 'BIGINT')
+
+
+def downgrade(conn):
+    _alter(conn, 'INTEGER')
@@ -0,0 +1,14 @@
+"""Add game_session.rng_epoch so resumed games reference the right game RNG epoch."""
+from sqlalchemy import text
+
+from migrations import has_table, reflect_table
+
+
+def upgrade(conn):
+    if has_table(conn, 'game_session') and 'rng_epoch' not in reflect_table(conn, 'game_session').c:
+        conn.execute(text('ALTER TABLE game_session ADD COLUMN rng_epoch INTEGER'))
+
+
+def downgrade(conn):
+    # keeps game_session.rng_epoch -- older sqlite versions cannot drop columns
+    pass
@@ -0,0 +1,191 @@
+"""Term frequency analytics over stored messages.
+
+Term counts per channel and day are kept in the `term_count` table. They are updated incrementally:
+`catch_up` only tokenizes messages newer than each channel's `ChannelIngestState.terms_message_id`,
+so queries never re-tokenize the whole history. Tokenizing runs in the shared process pool.
+
+A batch of messages is tokenized into one flat array of terms. `np.unique` maps terms and days to
+indices, and `np.bincount` over the combined (day, term) index gives the sparse day x term count matrix
+in one vectorized pass. Bursts are z-scores of recent daily counts against a baseline window.
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, or_, desc, update
+from sqlalchemy.future import select
+
+import db, executors, settings
+from nlp.models import Message, ChannelIngestState, TermCount
+
+
+logger = logging.getLogger('nlp.analytics')
+
+STOPWORDS = frozenset('''
+a about after again all also am an and any are as at be because been before being but by can could
+did do does doing don dont for from had has have having he her here hers him his how i if im in into is
+it its ive just like me more most my no not now of off on once only or other our out over own same she
+should so some such than that thats the their them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+'''.split())
+
+# mentions, channels, custom emoji and urls
+IGNORED_RE = re.compile(r'<[@#:!&a-z0-9_]+>|https?://\S+', re.IGNORECASE)
+TOKEN_RE = re.compile(r'[a-z][a-z0-9+#]+')
+
+
+def tokenize(text):
+    text = IGNORED_RE.sub(' ', (text or '').lower())
+    return [t for t in TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+def count_terms(messages):
+    """Count terms per day in a batch of (created_at, content) tuples.
+
+    Returns a list of (day, term, count) tuples.
+    """
+    days, tokens = [], []
+    for created_at, content in messages:
+        terms = tokenize(content)
+        tokens.extend(terms)
+        days.extend([created_at.date()] * len(terms))
+    if not tokens:
+        return []
+    day_values, day_idx = np.unique(np.array(days, dtype='datetime64[D]'), return_inverse=True)
+    term_values, term_idx = np.unique(np.array(tokens), return_inverse=True)
+    # flattened sparse (day, term) matrix
+    counts = np.bincount(day_idx * len(term_values) + term_idx)
+    nonzero = np.flatnonzero(counts)
+    return [
+        (day_values[i // len(term_values)].item(), str(term_values[i % len(term_values)]), int(counts[i]))
+        for i in nonzero
+    ]
+
+
+async def _count_batch(async_session, channel_id, after_id, batch_size):
+    """Count terms of the next batch of messages. Returns the id of the last message counted or None if there were none."""
+    stmt = select(Message.id, Message.created_at, Message.content).where(Message.channel_id == channel_id)
+    if after_id is not None:
+        stmt = stmt.where(Message.id > after_id)
+    async with async_session() as session:
+        res = await session.execute(stmt.order_by(Message.id).limit(batch_size))
+        messages = res.all()
+    if not messages:
+        return None
+
+    # tokenizing is CPU-bound -- done in a process without holding a transaction open
+    counts = await executors.run_in_process(
+        count_terms, [(m.created_at, m.content) for m in messages if m.created_at is not None]
+    )
+    rows = [dict(channel_id=channel_id, day=day, term=term, count=count) for day, term, count in counts]
+    last_id = messages[-1].id
+
+    # counts and the mark are updated together
+    async with async_session() as session, session.begin():
+        state_table = ChannelIngestState.__table__
+        res = await session.execute(
+            update(state_table).
+            where(
+                state_table.c.channel_id == channel_id,
+                state_table.c.terms_message_id.is_(None) if after_id is None else state_table.c.terms_message_id == after_id,
+            ).
+            values(terms_message_id=last_id)
+        )
+        if res.rowcount == 0:
+            # another catch up counted this batch already
+            return None
+        table = TermCount.__table__
+        # chunked to stay under bind parameter limits
+        for i in range(0, len(rows), 1000):
+            await session.execute(db.upsert(
+                session.bind.dialect.name, table, rows[i:i + 1000], ['channel_id', 'day', 'term'],
+                set_=lambda excluded: dict(count=table.c.count + excluded.count),
+            ))
+    return last_id
+
+
+async def catch_up(channel_id=None, batch_size=None, async_session=None):
+    """Count terms of messages stored since the last update, for one or all channels. Returns the number of batches."""
+    if batch_size is None:
+        batch_size = settings.NLP_TERMS_BATCH_SIZE
+    if async_session is None:
+        async_session = db.async_session
+    async with async_session() as session:
+        stmt = select(ChannelIngestState.channel_id, ChannelIngestState.terms_message_id).where(
+            or_(ChannelIngestState.terms_message_id.is_(None), ChannelIngestState.terms_message_id < ChannelIngestState.last_message_id)
+        )
+        if channel_id is not None:
+            stmt = stmt.where(ChannelIngestState.channel_id == channel_id)
+        res = await session.execute(stmt)
+        pending = res.all()
+
+    batches = 0
+    for channel_id, after_id in pending:
+        while True:
+            after_id = await _count_batch(async_session, channel_id, after_id, batch_size)
+            if after_id is None:
+                break
+            batches += 1
+    if batches:
+        logger.info(f'Counted terms of {batches} message batches')
+    return batches
+
+
+def _today():
+    # message timestamps are utc
+    return datetime.utcnow().date()
+
+
+def _since(days):
+    return _today() - timedelta(days=days - 1)
+
+
+async def top_terms(session, channel_id=None, days=7, limit=20):
+    """Most used terms of the last `days` days as (term, count) tuples."""
+    total = func.sum(TermCount.count).label('total')
+    stmt = select(TermCount.term, total).where(TermCount.day >= _since(days))
+    if channel_id is not None:
+        stmt = stmt.where(TermCount.channel_id == channel_id)
+    res = await session.execute(stmt.group_by(TermCount.term).order_by(desc(total)).limit(limit))
+    return res.all()
+
+
+def burst_scores(rows, recent_days, baseline_days, today=None, min_count=3):
+    """Z-scores of each term's mean daily count in the recent window against the baseline window before it.
+
+    `rows` are (day, term, count) tuples. Returns (term, recent count, baseline mean per day, z) tuples, highest z first.
+    """
+    if recent_days < 1 or baseline_days < 1:
+        raise ValueError('recent_days and baseline_days must be at least 1')
+    if not rows:
+        return []
+    today = today or _today()
+    days = np.array([(today - day).days for day, _, _ in rows])
+    term_values, term_idx = np.unique(np.array([term for _, term, _ in rows]), return_inverse=True)
+    counts = np.array([count for _, _, count in rows], dtype=np.float64)
+
+    # day x term matrix, row 0 is today
+    matrix = np.zeros((recent_days + baseline_days, len(term_values)))
+    in_window = (days >= 0) & (days < len(matrix))
+    np.add.at(matrix, (days[in_window], term_idx[in_window]), counts[in_window])
+
+    recent_total = matrix[:recent_days].sum(axis=0)
+    baseline = matrix[recent_days:]
+    mean = baseline.mean(axis=0)
+    # +1 smoothing so new terms don't divide by zero
+    z = (recent_total / recent_days - mean) / (baseline.std(axis=0) + 1)
+
+    candidates = np.flatnonzero(recent_total >= min_count)
+    order = candidates[np.argsort(-z[candidates], kind='stable')]
+    return [(str(term_values[i]), int(recent_total[i]), float(mean[i]), float(z[i])) for i in order]
+
+
+async def trends(session, channel_id=None, recent_days=1, baseline_days=14, limit=10):
+    """Terms used unusually often in the last `recent_days` days compared to the `baseline_days` before."""
+    stmt = select(TermCount.day, TermCount.term, TermCount.count).where(TermCount.day >= _since(recent_days + baseline_days))
+    if channel_id is not None:
+        stmt = stmt.where(TermCount.channel_id == channel_id)
+    res = await session.execute(stmt)
+    scores = burst_scores(res.all(), recent_days, baseline_days)
+    return [s for s in scores if s[3] > 0][:limit]
@@ -1,11 +1,23 @@
 from discord.ext import commands
+import discord
+import time
 import typing
+from datetime import datetime, timedelta
 
+import db, settings
+from base import BaseCog
+from nlp import ingest, analytics
+from nlp.repositories import MessageRepository
 
-class NLP(commands.Cog, name="NLP"):
-    def __init__(self, bot):
-        self.bot = bot
 
+def check_days(**days):
+    """Raise `BadArgument` unless every number of days is at least 1."""
+    for name, value in days.items():
+        if value < 1:
+            raise commands.BadArgument(f'{name} must be at least 1.')
+
+
+class NLP(BaseCog, name="NLP"):
     @commands.group(
         help="NLP"
     )
@@ -14,29 +26,134 @@ class NLP(commands.Cog, name="NLP"):
             await ctx.send_help()
 
     @nlp.group(
-        help="Read current or mentioned channel's message history"
+        help=f"""Store current channel's message history. Resumes after the last stored message.
+
+        Reads at most limit messages, {settings.NLP_READ_HISTORY_LIMIT} by default. Needs the manage messages permission.
+        """
     )
-    async def read_history(self, ctx, limit: typing.Optional[int] = 100):
-        await ctx.send('[+] Started scan')
+    @commands.has_permissions(manage_messages=True)
+    async def read_history(self, ctx, limit: typing.Optional[int] = None):
+        if limit is None:
+            limit = settings.NLP_READ_HISTORY_LIMIT
+        if limit < 1:
+            raise commands.BadArgument('limit must be at least 1.')
+        status_msg = await ctx.send('[+] Started scan')
+        last_update = time.perf_counter()
+
+        async def progress(stats):
+            nonlocal last_update
+            # edits are rate limited
+            if time.perf_counter() - last_update >= 5:
+                last_update = time.perf_counter()
+                await status_msg.edit(content=f'[+] Scanning.. {stats}')
 
         async with ctx.channel.typing():
+            stats = await ingest.ingest_channel(ctx.channel, limit=limit, progress=progress)
+
+        await status_msg.edit(content=f'[+] Done.. Stored {stats}')
+
+    @nlp.command(
+        help="""Full-text search of stored messages, best matches first.
+
+        Optionally filter by channel, author and only search the last number of days.
+        All words must match. End a word with * to match words starting with it.
+
+        E.g.
+        `nlp search #general @someone 30 python async*`
+        """,
+        usage='[#channel] [@author] [days] <query>',
+    )
+    async def search(self, ctx, channel: typing.Optional[discord.TextChannel] = None, author: typing.Optional[discord.Member] = None, days: typing.Optional[int] = None, *, query: str):
+        after = datetime.utcnow() - timedelta(days=days) if days else None
+        start = time.perf_counter()
+        async with db.async_read_session() as session:
+            repo = MessageRepository(session)
+            results = await repo.search(
+                query,
+                channel_id=channel.id if channel else None,
+                author_id=author.id if author else None,
+                after=after,
+            )
+        elapsed = time.perf_counter() - start
+
+        embed = discord.Embed(title=f'Search: {query}', description='' if results else 'No matching messages.')
+        for r in results:
+            embed.add_field(
+                name=f'{r.created_at:%Y-%m-%d %H:%M}',
+                value=f'<@{r.author_id}> in <#{r.channel_id}>: {r.snippet}\n[Jump]({r.jump_url})'[:1024],
+                inline=False,
+            )
+        embed.set_footer(text=f'{len(results)} results in {elapsed * 1000:.0f}ms')
+        await ctx.reply(embed=embed)
+
+    @nlp.command(
+        help="Most used terms in stored messages of the last number of days (7 by default), optionally for one channel.",
+        usage='[#channel] [days]',
+    )
+    async def top_terms(self, ctx, channel: typing.Optional[discord.TextChannel] = None, days: int = 7):
+        check_days(days=days)
+        channel_id = channel.id if channel else None
+        await analytics.catch_up(channel_id)
+        async with db.async_read_session() as session:
+            terms = await analytics.top_terms(session, channel_id, days=days)
+
+        where = f' in #{channel}' if channel else ''
+        desc = '\n'.join(f'`{term}` {count}' for term, count in terms) or 'No terms found. Read some history first.'
+        embed = discord.Embed(title=f'Top terms{where} in the last {days} days', description=desc)
+        await ctx.reply(embed=embed)
+
+    @nlp.command(
+        help="Terms used unusually often in the last number of days (1 by default) compared to the baseline days before (14 by default).",
+        usage='[#channel] [days] [baseline_days]',
+    )
+    async def trends(self, ctx, channel: typing.Optional[discord.TextChannel] = None, days: int = 1, baseline_days: int = 14):
+        check_days(days=days, baseline_days=baseline_days)
+        channel_id = channel.id if channel else None
+        await analytics.catch_up(channel_id)
+        async with db.async_read_session() as session:
+            bursts = await analytics.trends(session, channel_id, recent_days=days, baseline_days=baseline_days)
+
+        where = f' in #{channel}' if channel else ''
+        embed = discord.Embed(title=f'Trending terms{where}', description='' if bursts else 'Nothing unusual.')
+        for term, count, baseline, z in bursts:
+            embed.add_field(name=term, value=f'{count} uses vs {baseline:.1f}/day (z={z:.1f})')
+        embed.set_footer(text=f'Last {days} days vs the {baseline_days} days before')
+        await ctx.reply(embed=embed)
+
+    @nlp.command(
+        help="Show the stored reply thread a message belongs to.",
+        usage='<message_id>',
+    )
+    async def thread(self, ctx, message_id: int):
+        async with db.async_read_session() as session:
+            messages = await MessageRepository(session).thread(message_id, limit=26)
+
+        if not messages:
+            await ctx.reply('Message not found. Read some history first.')
+            return
+
+        embed = discord.Embed(title=f'Thread of {len(messages) if len(messages) <= 25 else "25+"} messages')
+        for m in messages[:25]:
+            embed.add_field(
+                name=f'{"↳ " * min(m.depth, 5)}{m.created_at:%Y-%m-%d %H:%M}',
+                value=f'<@{m.author_id}>: {m.content or "-"}\n[Jump]({m.jump_url})'[:1024],
+                inline=False,
+            )
+        await ctx.reply(embed=embed)
+
+    @nlp.command(
+        help="Who replies to whom the most in stored messages, optionally for one channel, one member and only the last number of days.",
+        usage='[#channel] [@member] [days]',
+    )
+    async def interactions(self, ctx, channel: typing.Optional[discord.TextChannel] = None, member: typing.Optional[discord.Member] = None, days: typing.Optional[int] = None):
+        after = datetime.utcnow() - timedelta(days=days) if days else None
+        async with db.async_read_session() as session:
+            pairs = await MessageRepository(session).interactions(
+                channel_id=channel.id if channel else None,
+                author_id=member.id if member else None,
+                after=after,
+            )
 
-            # TODO
-            # get lasst msg in db
-            # after=msg
-
-            async for msg in ctx.channel.history(limit=limit): #, oldest_first=True):
-                m = dict(
-                    author=msg.author.id,
-                    content=msg.content,
-                    created_at=msg.created_at,
-                    mentions=msg.raw_mentions,
-                    channel_mentions=msg.raw_channel_mentions,
-                    jump_url=msg.jump_url,
-                    reference=msg.reference.message_id if msg.reference is not None else None
-                )
-                if m['reference'] is not None:
-                    print(m['reference'])
-                print(m)
-
-        await ctx.send('[+] Done..')
+        desc = '\n'.join(f'<@{p.author_id}> → <@{p.replied_to_id}> {p.count} replies' for p in pairs) or 'No replies found.'
+        embed = discord.Embed(title='Interactions', description=desc)
+        await ctx.reply(embed=embed)
@@ -0,0 +1,210 @@
+"""Streaming ingestion of channel history into the `message` table.
+
+A producer reads `channel.history` oldest first and hands batches of rows to a writer through a bounded
+queue, so the Discord API iterator pauses whenever the DB falls behind (backpressure) instead of buffering
+the whole channel in memory.
+
+Each batch is stored in one transaction with bulk upserts, together with the channel's high-water mark
+(`ChannelIngestState.last_message_id`). The next scan of the channel starts `after` that message, so
+re-scanning only costs the new messages and an interrupted scan resumes from the last stored batch.
+
+Every stored message also gets a `MessageThread` row with the root and depth of its reply chain, computed
+from the parent's row so threads never have to be rebuilt by walking references.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+import discord
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+import db, settings
+from nlp.models import Message, ChannelIngestState, MessageThread
+
+
+logger = logging.getLogger('nlp.ingest')
+
+
+@dataclass
+class IngestStats:
+    messages: int = 0
+    batches: int = 0
+    # most batches waiting for the writer at once
+    max_queued: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self):
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return f'{self.messages} messages in {self.batches} batches, {self.elapsed:.1f}s ({self.rate:.0f} messages/s)'
+
+
+def to_row(msg):
+    return dict(
+        id=msg.id,
+        channel_id=msg.channel.id,
+        author_id=msg.author.id,
+        content=msg.content,
+        created_at=msg.created_at,
+        mentions=' '.join(map(str, msg.raw_mentions)) or None,
+        channel_mentions=' '.join(map(str, msg.raw_channel_mentions)) or None,
+        jump_url=msg.jump_url,
+        reference_id=msg.reference.message_id if msg.reference is not None else None,
+    )
+
+
+async def get_high_water_mark(channel_id, async_session=None):
+    """Id of the newest stored message of a channel, or None if it was never scanned."""
+    if async_session is None:
+        async_session = db.async_session
+    async with async_session() as session:
+        res = await session.execute(select(ChannelIngestState.last_message_id).where(ChannelIngestState.channel_id == channel_id))
+        return res.scalar_one_or_none()
+
+
+def thread_rows(rows, parents):
+    """`MessageThread` rows of a batch of message rows.
+
+    `parents` maps ids of already stored referenced messages to their (root_id, depth).
+    Parents within the batch are resolved as long as they come first, which they do since ids grow over time.
+    """
+    threads = dict(parents)
+    result = []
+    for row in sorted(rows, key=lambda row: row['id']):
+        parent_id = row['reference_id']
+        if parent_id is None:
+            root_id, depth = row['id'], 0
+        else:
+            # stored before threads were tracked -- treat the parent as the root
+            root_id, parent_depth = threads.get(parent_id, (parent_id, 0))
+            depth = parent_depth + 1
+        threads[row['id']] = (root_id, depth)
+        result.append(dict(message_id=row['id'], root_id=root_id, depth=depth))
+    return result
+
+
+async def write_batch(session, channel_id, rows, authors):
+    """Store a batch of message rows and advance the channel's high-water mark. Run inside a transaction.
+
+    Returns the number of messages that weren't stored before.
+    """
+    dialect_name = session.bind.dialect.name
+    await session.execute(db.upsert(
+        dialect_name, db.User.__table__,
+        [dict(id=author_id, name=name) for author_id, name in authors.items()],
+        ['id'], update_columns=['name'],
+    ))
+
+    # replies to messages that were never stored would break the foreign key
+    ids = {row['id'] for row in rows}
+    references = {row['reference_id'] for row in rows if row['reference_id'] is not None} - ids
+    parents = {}
+    if references:
+        res = await session.execute(
+            select(Message.id, MessageThread.root_id, MessageThread.depth).
+            outerjoin(MessageThread, MessageThread.message_id == Message.id).
+            where(Message.id.in_(references))
+        )
+        for message_id, root_id, depth in res.all():
+            if root_id is not None:
+                parents[message_id] = (root_id, depth)
+            references.discard(message_id)
+        # whatever is left was never stored
+        for row in rows:
+            if row['reference_id'] in references:
+                row['reference_id'] = None
+
+    res = await session.execute(db.upsert(dialect_name, Message.__table__, rows, ['id']))
+    # messages stored by an earlier or overlapping scan are skipped
+    inserted = max(res.rowcount, 0)
+    await session.execute(db.upsert(
+        dialect_name, MessageThread.__table__, thread_rows(rows, parents), ['message_id'],
+        update_columns=['root_id', 'depth'],
+    ))
+
+    state_table = ChannelIngestState.__table__
+    await session.execute(db.upsert(
+        dialect_name, state_table,
+        dict(channel_id=channel_id, last_message_id=max(ids), message_count=inserted),
+        ['channel_id'],
+        set_=lambda excluded: dict(
+            last_message_id=func.max(state_table.c.last_message_id, excluded.last_message_id) if dialect_name == 'sqlite'
+            else func.greatest(state_table.c.last_message_id, excluded.last_message_id),
+            message_count=state_table.c.message_count + excluded.message_count,
+            updated=func.now(),
+        ),
+    ))
+    return inserted
+
+
+async def ingest_channel(channel, limit=None, batch_size=None, queue_size=None, progress=None, async_session=None):
+    """Store new messages of a channel. Returns `IngestStats`.
+
+    `progress` is an optional coroutine function called with the stats after every stored batch.
+    """
+    if batch_size is None:
+        batch_size = settings.NLP_INGEST_BATCH_SIZE
+    if queue_size is None:
+        queue_size = settings.NLP_INGEST_QUEUE_SIZE
+    if async_session is None:
+        async_session = db.async_session
+
+    last_message_id = await get_high_water_mark(channel.id, async_session)
+    after = discord.Object(id=last_message_id) if last_message_id is not None else None
+
+    stats = IngestStats()
+    # bounded -- the producer waits while `queue_size` batches are pending
+    queue = asyncio.Queue(maxsize=queue_size)
+
+    async def produce():
+        rows, authors = [], {}
+        try:
+            async for msg in channel.history(limit=limit, after=after, oldest_first=True):
+                rows.append(to_row(msg))
+                authors[msg.author.id] = msg.author.display_name
+                if len(rows) >= batch_size:
+                    await queue.put((rows, authors))
+                    stats.max_queued = max(stats.max_queued, queue.qsize())
+                    rows, authors = [], {}
+            if rows:
+                await queue.put((rows, authors))
+        except Exception:
+            # let the writer store what was read so far
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            rows, authors = item
+            async with async_session() as session, session.begin():
+                await write_batch(session, channel.id, rows, authors)
+            stats.messages += len(rows)
+            stats.batches += 1
+            stats.elapsed = time.perf_counter() - stats.started
+            if progress is not None:
+                await progress(stats)
+
+    producer = asyncio.create_task(produce())
+    try:
+        await consume()
+    finally:
+        if not producer.done():
+            # writer failed
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+    # surface API errors
+    if not producer.cancelled() and producer.exception() is not None:
+        raise producer.exception()
+
+    stats.elapsed = time.perf_counter() - stats.started
+    logger.info(f'Ingested #{channel}: {stats}')
+    return stats
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, DateTime, Integer, String, Numeric, ForeignKey, BigInteger
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Date, DateTime, Integer, String, Numeric, ForeignKey, BigInteger, func, event
+from sqlalchemy.orm import relationship, backref
+from sqlalchemy.schema import Index, DDL
 from db import Base
 
 
@@ -7,8 +8,10 @@ class Message(Base):
     __tablename__ = 'message'
 
     id = Column(BigInteger, primary_key=True, autoincrement=False)
+    channel_id = Column(BigInteger, nullable=True)
     content = Column(String)
     created_at = Column(DateTime)
+    # space separated ids
     mentions = Column(String, nullable=True)
     channel_mentions = Column(String, nullable=True)
     jump_url = Column(String, nullable=True)
@@ -17,4 +20,101 @@ class Message(Base):
     author = relationship('User', backref='messages', lazy='selectin')
 
     reference_id = Column(BigInteger, ForeignKey(id), nullable=True)
-    reference = relationship('Message', backref='replies', lazy='selectin', remote_side=id)
+    # loading these recursively loads whole reply chains -- query threads through `MessageThread` instead
+    reference = relationship('Message', backref=backref('replies', lazy='raise'), lazy='raise', remote_side=id)
+
+    __table_args__ = (
+        Index('ix_message_channel_id_id', 'channel_id', 'id'),
+        {'extend_existing': True, }
+    )
+
+
+# Full-text search index over message content, see `nlp.repositories.MessageRepository.search`.
+# sqlite: FTS5 table kept in sync with `message` by triggers. postgres: GIN expression index.
+MESSAGE_FTS_DDL = {
+    'sqlite': [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts
+        USING fts5(content, content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+        """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+    ],
+    'postgresql': [
+        """CREATE INDEX IF NOT EXISTS ix_message_content_fts ON message USING gin (to_tsvector('simple', coalesce(content, '')))""",
+    ],
+}
+MESSAGE_FTS_DROP_DDL = {
+    # triggers are dropped with the message table
+    'sqlite': ['DROP TABLE IF EXISTS message_fts'],
+    'postgresql': [],
+}
+
+for dialect, statements in MESSAGE_FTS_DDL.items():
+    for statement in statements:
+        event.listen(Message.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+for dialect, statements in MESSAGE_FTS_DROP_DDL.items():
+    for statement in statements:
+        event.listen(Message.__table__, 'after_drop', DDL(statement).execute_if(dialect=dialect))
+
+
+class MessageThread(Base):
+    """Root and depth of every message in its reply chain, maintained by `nlp.ingest.write_batch`.
+
+    A whole thread is then one indexed lookup on `root_id` instead of following `Message.reference` message by message.
+    """
+    __tablename__ = 'message_thread'
+
+    message_id = Column(BigInteger, ForeignKey('message.id'), primary_key=True, autoincrement=False)
+    # the message that started the thread, itself for messages that aren't replies
+    root_id = Column(BigInteger, nullable=False)
+    depth = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index('ix_message_thread_root_id', 'root_id', 'message_id'),
+        {'extend_existing': True, }
+    )
+
+    def __repr__(self):
+        return f"MessageThread({self.message_id}, root_id={self.root_id}, depth={self.depth})"
+
+
+class ChannelIngestState(Base):
+    """High-water mark of `nlp read_history` per channel -- scans resume after `last_message_id`."""
+    __tablename__ = 'channel_ingest_state'
+
+    channel_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    last_message_id = Column(BigInteger, nullable=True)
+    message_count = Column(Integer, default=0, nullable=False)
+    # newest message counted in `term_count`, see `nlp.analytics`
+    terms_message_id = Column(BigInteger, nullable=True)
+    updated = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = {'extend_existing': True}
+
+    def __repr__(self):
+        return f"ChannelIngestState({self.channel_id}, last_message_id={self.last_message_id}, message_count={self.message_count})"
+
+
+class TermCount(Base):
+    """Number of times a term was used in a channel per day. Maintained incrementally by `nlp.analytics`."""
+    __tablename__ = 'term_count'
+
+    channel_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True)
+    term = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index('ix_term_count_day', 'day'),
+        {'extend_existing': True, }
+    )
+
+    def __repr__(self):
+        return f"TermCount({self.channel_id}, {self.day}, {self.term!r}, {self.count})"
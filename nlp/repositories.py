@@ -0,0 +1,123 @@
+import re
+
+from sqlalchemy import func, literal_column, desc, table, column, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.future import select
+
+from nlp.models import Message, MessageThread
+
+
+# FTS5 table -- see `nlp.models.MESSAGE_FTS_DDL`
+message_fts = table('message_fts', column('rowid'))
+MESSAGE_FTS = literal_column('message_fts')
+
+
+def fts_query(query):
+    """Turn user input into an FTS5 query of quoted terms so punctuation can't cause syntax errors.
+
+    All terms must match. A trailing `*` makes a term a prefix search, e.g. `pyth*`.
+    """
+    terms = re.findall(r'(\w+)(\*?)', query)
+    return ' '.join(f'"{term}"{star}' for term, star in terms)
+
+
+class MessageRepository:
+    def __init__(self, session=None):
+        self.session = session
+
+    @property
+    def dialect_name(self):
+        return self.session.bind.dialect.name
+
+    @staticmethod
+    def get_filters(channel_id=None, author_id=None, after=None, before=None):
+        filters = []
+        if channel_id is not None:
+            filters.append(Message.channel_id == channel_id)
+        if author_id is not None:
+            filters.append(Message.author_id == author_id)
+        if after is not None:
+            filters.append(Message.created_at >= after)
+        if before is not None:
+            filters.append(Message.created_at < before)
+        return filters
+
+    async def search(self, query, channel_id=None, author_id=None, after=None, before=None, limit=10):
+        """Full-text search of message content, best matches first.
+
+        Uses the FTS5 index ranked with bm25 on sqlite, and the `to_tsvector` GIN index ranked with ts_rank on postgres.
+
+        Returns
+        -------
+        list of rows with id, channel_id, author_id, created_at, jump_url, snippet and rank
+        """
+        filters = self.get_filters(channel_id, author_id, after, before)
+        columns = (Message.id, Message.channel_id, Message.author_id, Message.created_at, Message.jump_url)
+        if self.dialect_name == 'sqlite':
+            match = fts_query(query)
+            if not match:
+                return []
+            rank = func.bm25(MESSAGE_FTS)
+            stmt = (
+                select(*columns, func.snippet(MESSAGE_FTS, 0, '**', '**', '…', 16).label('snippet'), rank.label('rank')).
+                select_from(message_fts.join(Message.__table__, Message.id == message_fts.c.rowid)).
+                where(MESSAGE_FTS.op('MATCH')(match), *filters).
+                # lower bm25 is better
+                order_by(rank)
+            )
+        else:
+            tsvector = func.to_tsvector('simple', func.coalesce(Message.content, ''))
+            tsquery = func.websearch_to_tsquery('simple', query)
+            rank = func.ts_rank(tsvector, tsquery)
+            stmt = (
+                select(*columns, func.ts_headline('simple', Message.content, tsquery, 'StartSel=**, StopSel=**, MaxWords=24').label('snippet'), rank.label('rank')).
+                where(tsvector.op('@@')(tsquery), *filters).
+                order_by(desc(rank))
+            )
+        res = await self.session.execute(stmt.limit(limit))
+        return res.all()
+
+    async def thread(self, message_id, limit=None):
+        """The whole reply thread containing a message, oldest first, in one query on `ix_message_thread_root_id`.
+
+        Returns
+        -------
+        list of rows with id, author_id, reference_id, created_at, content, jump_url and depth
+        """
+        root_id = select(MessageThread.root_id).where(MessageThread.message_id == message_id).scalar_subquery()
+        stmt = (
+            select(
+                Message.id, Message.author_id, Message.reference_id, Message.created_at, Message.content, Message.jump_url,
+                MessageThread.depth,
+            ).
+            join(MessageThread, MessageThread.message_id == Message.id).
+            where(MessageThread.root_id == root_id).
+            order_by(MessageThread.message_id)
+        )
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        res = await self.session.execute(stmt)
+        return res.all()
+
+    async def interactions(self, channel_id=None, author_id=None, after=None, limit=10):
+        """Number of replies between pairs of authors, most first. Self replies are ignored.
+
+        `author_id` limits it to replies from or to that author.
+
+        Returns
+        -------
+        list of rows with author_id, replied_to_id and count
+        """
+        parent = aliased(Message)
+        count = func.count().label('count')
+        stmt = (
+            select(Message.author_id, parent.author_id.label('replied_to_id'), count).
+            join(parent, Message.reference_id == parent.id).
+            where(Message.author_id != parent.author_id, *self.get_filters(channel_id, after=after))
+        )
+        if author_id is not None:
+            stmt = stmt.where(or_(Message.author_id == author_id, parent.author_id == author_id))
+        res = await self.session.execute(
+            stmt.group_by(Message.author_id, parent.author_id).order_by(desc(count)).limit(limit)
+        )
+        return res.all()
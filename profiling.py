@@ -0,0 +1,114 @@
+"""Statistical stack sampler for profiling the running bot.
+
+A daemon thread wakes up every `interval` seconds and records the stack of every other thread from
+`sys._current_frames()`. Nothing is hooked into the interpreter (no `sys.setprofile`/`sys.settrace`),
+so the profiled code runs at full speed and the cost is one stack walk per thread per sample.
+
+The result is in the collapsed stack format (`root;caller;callee count` per line) read by
+flamegraph.pl, speedscope and friends.
+
+E.g.
+```
+sampler = StackSampler()
+sampler.start()
+...
+sampler.stop()
+open('bot.collapsed', 'w').write(sampler.collapsed())
+```
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import settings
+
+
+PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class StackSampler:
+    def __init__(self, interval=None):
+        self.interval = interval if interval is not None else settings.PROFILE_SAMPLE_INTERVAL
+        # collapsed stack: samples
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        self._thread = None
+        self._stop = threading.Event()
+        # code object: frame label
+        self._labels = {}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.stopped or time.perf_counter()) - self.started
+
+    def start(self):
+        if self.running:
+            raise RuntimeError('Sampler is already running')
+        self._stop.clear()
+        self.started, self.stopped = time.perf_counter(), None
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(skip=own_id)
+
+    def sample(self, skip=None):
+        """Record the current stack of every thread but `skip`."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(PROJECT_PATH):
+                filename = os.path.relpath(filename, PROJECT_PATH)
+            else:
+                # site-packages/discord/client.py -> discord/client.py
+                filename = os.path.join(*filename.split(os.sep)[-2:])
+            # ; separates frames
+            label = f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def collapsed(self):
+        """Stacks in the collapsed format, most sampled first."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top_functions(self, n=5):
+        """Functions most often on top of a stack as (frame label, share of samples) tuples."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [(label, count / total) for label, count in leaves.most_common(n)]
+
+    def __str__(self):
+        return f'{self.samples} samples of {len(self.stacks)} distinct stacks in {self.elapsed:.1f}s'
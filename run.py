@@ -1,42 +1,69 @@
 #!/usr/bin/env python3
 import asyncio
 import os
-import logging
+import sys
+import logging, logging.config
 
-from keep_alive import keep_alive as flask_keep_alive
-import main, db, economy
 import settings
 import click
 
+# Other project modules are imported by the commands that need them
+# so e.g. `initdb` does not load discord.py, flask or numpy.
+
 
 logger = logging.getLogger('run')
 
 @click.group()
 def cli():
-    pass
+    logging.config.dictConfig(settings.LOGGING_CONFIG)
 
 
 @cli.command()
 @click.option('--keep-alive', is_flag=True, help='Run flask thread to keep Repl alive.')
 def run(keep_alive):
     """Run the Discord bot."""
+    import main
     if keep_alive:
+        from keep_alive import keep_alive as flask_keep_alive
         flask_keep_alive()
 
     main.main()
 
 
 async def _run_db(init=True, drop=False):
-    main.init_extensions()
+    import db, migrations
+    db.import_models()
     async with db.engine.begin() as conn:
         if drop:
             click.echo('[*] Dropping db...')
             logger.info('Dropping db')
             await conn.run_sync(db.Base.metadata.drop_all)
-        if init:
-            click.echo('[*] Creating db...')
-            logger.info('Creating db')
-            await conn.run_sync(db.Base.metadata.create_all)
+        existing = await conn.run_sync(migrations.has_table, 'currency')
+    if not init:
+        return
+    if existing:
+        # create_all doesn't alter existing tables -- bring them up to date first
+        click.echo('[*] Migrating db...')
+        logger.info('Migrating db')
+        await migrations.migrate(db.engine)
+    async with db.engine.begin() as conn:
+        click.echo('[*] Creating db...')
+        logger.info('Creating db')
+        await conn.run_sync(db.Base.metadata.create_all)
+        if not existing:
+            # new tables already match the models
+            await conn.run_sync(migrations.stamp)
+
+
+async def _has_tables():
+    """Whether the database was initialized, for either backend."""
+    import db, migrations
+    db.import_models()
+    try:
+        async with db.engine.connect() as conn:
+            return await conn.run_sync(migrations.has_table, 'currency')
+    finally:
+        await db.engine.dispose()
 
 
 @cli.command('initdb')
@@ -56,12 +83,196 @@ def resetdb():
     """Reset all tables."""
     asyncio.run(_run_db(init=True, drop=True))
 
+@cli.command('migrate')
+@click.option('--to', 'target', default=None, help='Upgrade or downgrade to this version. Use 0000 to revert all.')
+def migrate(target):
+    """Apply pending schema migrations."""
+    import db, migrations
+    try:
+        steps = asyncio.run(migrations.migrate(db.engine, target))
+    except ValueError as e:
+        click.echo(f'[-] Error: {e}')
+        return
+    if not steps:
+        click.echo('[+] Nothing to do.')
+    for migration, upgrade in steps:
+        click.echo(f'[+] {"Applied" if upgrade else "Reverted"} {migration}')
+
+
+@cli.command('migrations')
+def list_migrations():
+    """List schema migrations."""
+    import db, migrations
+    for migration, applied in asyncio.run(migrations.status(db.engine)):
+        click.echo(f'[{"x" if applied else " "}] {migration} - {migration.description}')
+
+
+@cli.command('archive-ledger')
+@click.option('--older-than', default='90d', show_default=True, help='Archive rows older than this e.g. 90d or 12w.')
+@click.option('--ledger', 'ledgers', multiple=True, help='Ledger table(s) to archive. Defaults to all.')
+@click.option('--batch-size', default=1000, show_default=True)
+def archive_ledger(older_than, ledgers, batch_size):
+    """Move old ledger rows to compressed archive files."""
+    from datetime import datetime
+    from economy import archive
+    try:
+        cutoff = datetime.utcnow() - archive.parse_age(older_than)
+    except ValueError as e:
+        click.echo(f'[-] Error: {e}')
+        return
+    for ledger in ledgers or archive.LEDGERS.keys():
+        click.echo(f'[*] Archiving {ledger} rows created before {cutoff:%Y-%m-%d %H:%M}...')
+        count = asyncio.run(archive.archive_ledger(ledger, cutoff, batch_size=batch_size))
+        click.echo(f'[+] Archived {count} rows.')
+
+
+@cli.command('export-ledger')
+@click.argument('ledger', type=click.Choice(['transaction', 'reward_log', 'currency_exchange_transaction']))
+@click.option('--out', type=click.File('w'), default='-', help='Output file. Defaults to stdout.')
+def export_ledger(ledger, out):
+    """Export archived and current ledger rows as JSON lines."""
+    from economy import archive
+    count = asyncio.run(archive.export_ledger(ledger, out))
+    click.echo(f'[+] Exported {count} rows.', err=True)
+
+
+@cli.command('bench-storage')
+@click.option('--profile', 'profiles', multiple=True, help='Storage profile(s) to compare. Defaults to all.')
+@click.option('--readers', default=8, show_default=True, help='Concurrent readers.')
+@click.option('--writers', default=4, show_default=True, help='Concurrent writers.')
+@click.option('--ops', default=200, show_default=True, help='Operations per reader/writer.')
+@click.option('--dir', 'directory', default='.', show_default=True, help='Directory for scratch databases.')
+def bench_storage(profiles, readers, writers, ops, directory):
+    """Benchmark SQLite storage profiles with concurrent reads and writes."""
+    from benchmarks import storage
+    results = asyncio.run(storage.run(profiles or settings.DB_STORAGE_PROFILES.keys(), directory, readers=readers, writers=writers, ops=ops))
+    for r in results:
+        click.echo(f'[+] {r["profile"]}: {r["elapsed"]:.2f}s, {r["locked"]} lock errors')
+        for kind in ('read', 'write'):
+            s = r[kind]
+            click.echo(f'    {kind:5} {r[f"{kind}_throughput"]:8.1f} ops/s  p50 {s["p50"]:.2f}ms  p95 {s["p95"]:.2f}ms  p99 {s["p99"]:.2f}ms')
+
+
+@cli.command('bench-settlement')
+@click.option('--players', 'player_counts', multiple=True, type=int, help='Players per game. Defaults to 10, 100 and 500.')
+@click.option('--games', 'games_per_run', default=10, show_default=True, help='Games settled per player count and method.')
+@click.option('--dir', 'directory', default='.', show_default=True, help='Directory for the scratch database.')
+def bench_settlement(player_counts, games_per_run, directory):
+    """Benchmark settling multiplayer games per player vs in one transaction."""
+    from pathlib import Path
+    from benchmarks import remove_sqlite_files
+    path = Path(directory) / 'bench_settlement.db'
+    # must be set before db is imported
+    settings.DB_URL = f'sqlite+aiosqlite:///{path}'
+    settings.DB_READ_URL = settings.DB_URL
+    settings.DB_ENGINE_KWARGS = dict(future=True)
+    from benchmarks import settlement
+    try:
+        results = asyncio.run(settlement.run(player_counts or (10, 100, 500), games_per_run=games_per_run))
+    finally:
+        remove_sqlite_files(path)
+    for r in results:
+        click.echo(f'[+] {r["players"]} players, money conserved: {r["conserved"]}')
+        for kind in ('per_player', 'batched'):
+            s = r[kind]
+            click.echo(f'    {kind:10}  mean {s["mean"]:.2f}ms  p50 {s["p50"]:.2f}ms  p95 {s["p95"]:.2f}ms')
+
+
+@cli.command('loadtest')
+@click.option('--ops', default=500, show_default=True, help='Operations to run.')
+@click.option('--concurrency', default=20, show_default=True, help='Operations in flight at most.')
+@click.option('--rate', default=100.0, show_default=True, help='Operations started per second. 0 for as fast as possible.')
+@click.option('--users', default=50, show_default=True, help='Members with wallets.')
+@click.option('--mix', default='pay=4,cointoss=3,exchange=1,reward=2', show_default=True, help='Operation weights.')
+@click.option('--dir', 'directory', default='.', show_default=True, help='Directory for the scratch database.')
+def loadtest(ops, concurrency, rate, users, mix, directory):
+    """Load test the economy cogs offline with stand-ins for discord objects."""
+    from pathlib import Path
+    from benchmarks import remove_sqlite_files
+    path = Path(directory) / 'loadtest.db'
+    # must be set before db is imported
+    settings.DB_URL = f'sqlite+aiosqlite:///{path}'
+    settings.DB_READ_URL = settings.DB_URL
+    settings.DB_ENGINE_KWARGS = dict(future=True)
+    from benchmarks import loadtest
+    try:
+        mix = loadtest.parse_mix(mix)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--mix')
+    try:
+        r = asyncio.run(loadtest.run(ops=ops, concurrency=concurrency, rate=rate, users=users, mix=mix))
+    finally:
+        remove_sqlite_files(path)
+    s, w = r['all'], r['wait']
+    click.echo(f'[{"-" if r["failed"] else "+"}] {ops} operations in {r["elapsed"]:.2f}s: {r["throughput"]:.1f} ops/s  p50 {s["p50"]:.2f}ms  p95 {s["p95"]:.2f}ms  p99 {s["p99"]:.2f}ms ({s["n"]} ok or rejected)')
+    click.echo(f'    slot wait p50 {w["p50"]:.2f}ms  p95 {w["p95"]:.2f}ms  p99 {w["p99"]:.2f}ms')
+    for name, s in r['operations'].items():
+        outcomes = ', '.join(f'{s.get(outcome, 0)} {outcome}' for outcome in ('ok', 'rejected', 'locked', 'error'))
+        click.echo(f'    {name:8}  p50 {s["p50"]:.2f}ms  p95 {s["p95"]:.2f}ms  p99 {s["p99"]:.2f}ms  ({outcomes})')
+    click.echo(f'[{"-" if r["locked"] else "+"}] {r["locked"]} lock errors')
+    for error, count in r['errors'].most_common(10):
+        click.echo(f'[-] {count}x {error}')
+    if r['problems']:
+        click.echo(f'[-] Money not conserved: {len(r["problems"])} problems')
+        for problem in r['problems'][:20]:
+            click.echo(f'    {problem}')
+    else:
+        click.echo('[+] Money conserved: every balance matches the transaction ledger.')
+    if r['failed']:
+        click.echo(f'[-] Load test failed: {sum(r["errors"].values())} errors, {len(r["problems"])} money problems')
+        sys.exit(1)
+
+
+@cli.command('simulate-games')
+@click.option('--game', 'game_names', multiple=True, type=click.Choice(['cointoss', 'dice', 'guess_1p', 'guess_hilo', 'guess_multi']), help='Games to simulate. Defaults to all.')
+@click.option('--trials', default=1_000_000, show_default=True, help='Rounds per game.')
+@click.option('--seed', type=int, help='Seed for reproducible results.')
+@click.option('--players', default=4, show_default=True, help='Players per guess_multi game.')
+@click.option('--strategy', default='binary', show_default=True, type=click.Choice(['binary', 'random']), help='How the guess_hilo player uses the hints.')
+def simulate_games(game_names, trials, seed, players, strategy):
+    """Monte Carlo estimate of each game's expected value and house edge per unit bet."""
+    from economy import simulation
+    for game in game_names or ('cointoss', 'dice', 'guess_1p', 'guess_hilo', 'guess_multi'):
+        kwargs = {'guess_hilo': dict(strategy=strategy), 'guess_multi': dict(players=players)}.get(game, {})
+        r = simulation.run(game, trials, seed=seed, **kwargs)
+        click.echo(f'[+] {game} ({r["trials"]:,} rounds)')
+        click.echo(f'    EV {r["ev"]:+.4f} ± {1.96 * r["stderr"]:.4f}  variance {r["variance"]:.4f}  std {r["std"]:.4f}')
+        click.echo(f'    house edge {r["house_edge"]:+.2%}  win rate {r["win_rate"]:.2%}  payouts {r["worst"]:+.3f} to {r["best"]:+.3f}')
+
+
+@cli.command('bench-render')
+@click.option('--rows', multiple=True, type=int, help='Number of transactions to render. Defaults to 10, 100 and 1000.')
+@click.option('--repeat', default=20, show_default=True, help='Renders per row count.')
+def bench_render(rows, repeat):
+    """Benchmark rendering the transaction list template."""
+    from benchmarks import render
+    results = asyncio.run(render.run(rows or (10, 100, 1000), repeat=repeat))
+    for r in results:
+        click.echo(f'[+] {r["rows"]} rows ({r["chars"]} chars)')
+        for kind in ('fresh', 'shared'):
+            s = r[kind]
+            click.echo(f'    {kind:6} env  mean {s["mean"]:.2f}ms  p50 {s["p50"]:.2f}ms  p95 {s["p95"]:.2f}ms')
+
+
 @cli.command('clearreplitdb')
 def cleardb():
     """Empty replit-db."""
+    import db
     logger.info('Clearing replit-db')
-    for k in db.replit_db.keys():
-        del db.replit_db[k]
+    replit_db = db.get_replit_db()
+    for k in replit_db.keys():
+        del replit_db[k]
+
+
+@cli.command('import-replit-kv')
+@click.option('--prefix', default='econ__', show_default=True, help='Only import keys with this prefix.')
+@click.option('--overwrite', is_flag=True, help='Overwrite keys already in the kv table.')
+def import_replit_kv(prefix, overwrite):
+    """Copy settings from replit-db into the kv table."""
+    import kv
+    imported = asyncio.run(kv.import_from_replit(prefix, overwrite=overwrite))
+    click.echo(f'[+] Imported {len(imported)} keys: {imported}')
+
 
 @cli.command('init')
 @click.option('--force', is_flag=True, help='Force adding initial currency if db already exists.')
@@ -71,7 +282,7 @@ def init(force):
     
     Creates a database and creates an initial currency.
     """
-    no_db = not os.path.exists(settings.DB_PATH)
+    no_db = not asyncio.run(_has_tables())
     if (no_db):
         click.echo('[+] No DB. Creating...')
         initdb()
@@ -79,6 +290,7 @@ def init(force):
     if (no_db or force):
         logger.info('Adding intial currency')
         click.echo('[+] Adding a currency...')
+        import economy
         economy.create_initial_currency()
     else:
         click.echo('[-] DB exists. Not creating currency. Add "--force" to force.')
@@ -104,5 +316,26 @@ def replace_policy_file(delete=False):
     return
 
 
+@cli.command('profile-startup')
+@click.option('--top', default=15, show_default=True, help='Number of packages and modules to list.')
+@click.option('--until-ready', is_flag=True, help='Also connect to discord and report the time to the first on_ready. Needs a token.')
+def profile_startup(top, until_ready):
+    """Report import cost per package/module and time to first on_ready."""
+    from benchmarks import startup
+    result = startup.profile(until_ready=until_ready)
+    if result['returncode'] != 0:
+        click.echo(f'[-] Startup failed:\n{result["stderr_tail"]}')
+        return
+    click.echo(f'[+] Total import time: {result["total_import"] / 1e6:.3f}s ({len(result["modules"])} modules)')
+    click.echo(f'[+] Top packages by import time (self):')
+    for package, us in result['packages'][:top]:
+        click.echo(f'    {us / 1000:9.1f}ms  {package}')
+    click.echo(f'[+] Top modules by cumulative import time:')
+    for module, self_us, cumulative_us in result['modules'][:top]:
+        click.echo(f'    {cumulative_us / 1000:9.1f}ms  {module}')
+    if result['ready'] is not None:
+        click.echo(f'[+] Time to first on_ready: {result["ready"]:.3f}s')
+
+
 if __name__ == '__main__':
     cli()
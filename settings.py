@@ -31,6 +31,10 @@ ALL_EXTENSIONS = {
 
     'extensions.greetings': True,
     'extensions.guessing_game': True,
+
+    'extensions.storage': True,
+
+    'nlp': True,
 }
 
 EXTENSIONS = [extension for extension, enabled in ALL_EXTENSIONS.items() if enabled]
@@ -39,11 +43,96 @@ EXTENSIONS = [extension for extension, enabled in ALL_EXTENSIONS.items() if enab
 
 # Database:
 
-# pysqlite for sync, aiosqlite for async
+# Storage backend: 'sqlite' or 'postgresql'
+DB_BACKEND = os.getenv('DB_BACKEND', default='sqlite')
+
 DB_NAME = 'database'
 DB_PATH = f'{DB_NAME}.db'
-DB_URL = f'sqlite+aiosqlite:///{DB_PATH}'
-DB_ENGINE_KWARGS = dict(future=True)
+
+# Reporting queries (logs, status, lists) use a separate read-only engine with its own pool
+# so they never hold up balance updates.
+DB_READ_POOL_KWARGS = dict(pool_size=5, max_overflow=5)
+
+if DB_BACKEND == 'postgresql':
+    # asyncpg for async, psycopg2 for sync
+    # Install with `poetry install -E postgres`
+    DB_URL = os.getenv('DATABASE_URL', default=f'postgresql+asyncpg://localhost/{DB_NAME}')
+    # e.g. a replica
+    DB_READ_URL = os.getenv('DATABASE_READ_URL', default=DB_URL)
+    DB_ENGINE_KWARGS = dict(
+        future=True,
+        pool_size=int(os.getenv('DB_POOL_SIZE', default=10)),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', default=10)),
+        # drop connections the server closed while idle
+        pool_pre_ping=True,
+        # asyncpg prepared statement cache size per connection
+        connect_args=dict(statement_cache_size=int(os.getenv('DB_STATEMENT_CACHE_SIZE', default=100))),
+    )
+else:
+    # pysqlite for sync, aiosqlite for async
+    DB_URL = os.getenv('DATABASE_URL', default=f'sqlite+aiosqlite:///{DB_PATH}')
+    # database file of an overridden url, e.g. sqlite+aiosqlite:///data/bot.db -> data/bot.db
+    DB_PATH = DB_URL.split(':///', 1)[-1].split('?', 1)[0]
+    # Read-only SQLite connections rely on WAL mode.
+    DB_READ_URL = os.getenv('DATABASE_READ_URL', default=f'sqlite+aiosqlite:///file:{DB_PATH}?mode=ro&uri=true')
+    DB_ENGINE_KWARGS = dict(future=True)
+
+# SQLite pragmas applied on every new connection -- see `db.apply_storage_profile`
+DB_STORAGE_PROFILE = os.getenv('DB_STORAGE_PROFILE', default='wal')
+DB_STORAGE_PROFILES = {
+    # sqlite defaults: rollback journal, writers lock out readers
+    'default': {},
+    # write-ahead log: readers don't block writers and vice versa
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative values are in KiB
+        'busy_timeout': 5000,  # ms
+        'temp_store': 'MEMORY',
+    },
+}
+
+# Seconds between WAL checkpoints run by the `extensions.storage` extension
+DB_WAL_CHECKPOINT_INTERVAL = 300
+
+# Query instrumentation -- see `db.QueryStats` and the `debug queries` admin command
+# Statements slower than this are logged with their parameters
+DB_SLOW_QUERY_SECONDS = float(os.getenv('DB_SLOW_QUERY_SECONDS', default=0.25))
+# The same statement this many times in one command is logged as a likely N+1 query
+DB_N_PLUS_ONE_THRESHOLD = 5
+# Commands whose query stats are kept
+DB_QUERY_STATS_HISTORY = 200
+
+
+# Profiling -- see `profiling.StackSampler` and the `profile` admin command
+# Seconds between stack samples
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Profiles stop after this many seconds at the latest
+PROFILE_MAX_SECONDS = 300
+
+# Event loop watchdog -- see `loop_watchdog.LoopWatchdog`
+# Seconds between heartbeats
+WATCHDOG_INTERVAL = 0.1
+# Loop lag logged as a stall
+WATCHDOG_STALL_SECONDS = float(os.getenv('WATCHDOG_STALL_SECONDS', default=0.1))
+# Log the stack of the code blocking the loop
+WATCHDOG_CAPTURE_STACKS = bool(DEBUG)
+
+# Shared pools for blocking work -- see `executors`
+EXECUTOR_THREADS = int(os.getenv('EXECUTOR_THREADS', default=8))
+EXECUTOR_PROCESSES = int(os.getenv('EXECUTOR_PROCESSES', default=2))
+# Calls submitted at once per worker, more wait on the event loop
+EXECUTOR_QUEUE_FACTOR = 4
+# Default seconds before a call is given up on
+EXECUTOR_TIMEOUT = 60
+
+
+# Max transaction/reward log rows per query. Logs are paginated in discord.
+LOG_ROW_LIMIT = 1000
+
+# Old ledger rows are moved here by `run.py archive-ledger`
+LEDGER_ARCHIVE_PATH = Path(__file__).parent / 'archive'
 
 
 if DEBUG:
@@ -95,6 +184,29 @@ LOGGING_CONFIG = {
 }
 
 
+# NLP
+
+# Messages read by `nlp read_history` unless a limit is given -- scans resume, so run it again for more
+NLP_READ_HISTORY_LIMIT = 1000
+# Messages per bulk insert when reading channel history
+NLP_INGEST_BATCH_SIZE = 500
+# Batches read from discord but not stored yet before reading pauses
+NLP_INGEST_QUEUE_SIZE = 4
+# Messages tokenized per transaction when updating term counts
+NLP_TERMS_BATCH_SIZE = 2000
+
+
+# Templates
+
+TEMPLATES_DIR = Path(__file__).parent / 'templates'
+# Check template files for changes on every render -- for development
+TEMPLATES_AUTO_RELOAD = os.getenv('TEMPLATES_AUTO_RELOAD', default='').lower() in ('1', 'true', 'yes')
+# Cache compiled templates on disk (in the temp dir) so restarts skip compilation
+TEMPLATES_BYTECODE_CACHE = True
+# Paginated lists with at least this many rows are rendered in a thread
+TEMPLATES_THREAD_RENDER_ROWS = 200
+
+
 # Embed color theme
 THEME = {
     'success': 'green',
@@ -114,3 +226,21 @@ DEFAULT_TIP = 10
 
 BASE_CURRENCY = 'BPY'
 
+
+
+# Gambling
+
+# Max rounds per batch bet command e.g. `cointoss_n`
+GAMBLING_MAX_BATCH = 1000
+# Max rounds simulated by the `odds` command
+GAMBLING_SIMULATION_MAX_TRIALS = 1_000_000
+
+# Fixed master seed for game outcomes -- see `economy.rng`. Random if not set.
+GAME_RNG_SEED = int(os.getenv('GAME_RNG_SEED')) if os.getenv('GAME_RNG_SEED') else None
+# Outcomes drawn per refill of a game's buffer
+GAME_RNG_BLOCK_SIZE = 4096
+# Start a new epoch once a game drew this many outcomes of the current one
+GAME_RNG_EPOCH_MAX_POSITION = 10_000_000
+
+# Interactive games left open by a restart are resumed if they are younger than this (seconds), otherwise refunded
+GAME_RESUME_MAX_AGE = 60 * 60
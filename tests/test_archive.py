@@ -0,0 +1,140 @@
+"""Ledger archival: monthly segments, their indexes, filtered reads and summaries."""
+import asyncio
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+import db, settings
+from economy import archive, models
+
+
+# (id, user id, currency symbol, amount, created)
+TRANSACTIONS = [
+    (1, 1, 'AA', Decimal('5'), datetime(2021, 1, 5)),
+    (2, 2, 'BB', Decimal('-2'), datetime(2021, 1, 20)),
+    (3, 1, 'BB', Decimal('3'), datetime(2021, 2, 1)),
+    (4, 2, 'AA', Decimal('1'), datetime(2021, 3, 1)),
+    # stays in the hot table
+    (5, 1, 'AA', Decimal('7'), datetime(2021, 6, 1)),
+]
+CUTOFF = datetime(2021, 4, 1)
+
+
+@pytest.fixture(autouse=True)
+def archive_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'LEDGER_ARCHIVE_PATH', str(tmp_path / 'archive'))
+
+
+def _run(tmp_path, test):
+    async def main():
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+                currency_ids = {}
+                for symbol in ('AA', 'BB'):
+                    res = await conn.execute(insert(models.Currency.__table__).values(name=symbol, symbol=symbol))
+                    currency_ids[symbol] = res.inserted_primary_key[0]
+                await conn.execute(insert(db.User.__table__), [dict(id=1, name='one'), dict(id=2, name='two')])
+                await conn.execute(insert(models.TransactionLog.__table__), [
+                    dict(id=id, user_id=user_id, currency_id=currency_ids[symbol], amount=amount, created=created, transaction_type='deposit', note='')
+                    for id, user_id, symbol, amount, created in TRANSACTIONS
+                ])
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+def _ids(rows):
+    return [row.id for row in rows]
+
+
+def test_archive_moves_rows_to_monthly_segments(tmp_path):
+    async def test(async_session):
+        assert await archive.archive_ledger('transaction', CUTOFF, batch_size=2, async_session=async_session) == 4
+        months = sorted(path.name for path in archive.ledger_path('transaction').glob('*.jsonl.gz'))
+        assert months == ['2021-01.jsonl.gz', '2021-02.jsonl.gz', '2021-03.jsonl.gz']
+        assert archive.segment_index('transaction', '2021-01') == dict(user_ids={1, 2}, symbols={'AA', 'BB'})
+
+        async with async_session() as session:
+            res = await session.execute(select(models.TransactionLog.id))
+            assert res.scalars().all() == [5]
+            res = await session.execute(
+                select(models.LedgerSummary.user_id, models.Currency.symbol, models.LedgerSummary.amount, models.LedgerSummary.count).
+                join(models.Currency, models.Currency.id == models.LedgerSummary.currency_id)
+            )
+            summaries = {(user_id, symbol): (amount, count) for user_id, symbol, amount, count in res.all()}
+        assert summaries == {
+            (1, 'AA'): (Decimal('5'), 1), (1, 'BB'): (Decimal('3'), 1),
+            (2, 'AA'): (Decimal('1'), 1), (2, 'BB'): (Decimal('-2'), 1),
+        }
+    _run(tmp_path, test)
+
+
+def test_iter_archived_filters_and_orders(tmp_path):
+    async def test(async_session):
+        await archive.archive_ledger('transaction', CUTOFF, async_session=async_session)
+        assert _ids(archive.iter_archived('transaction')) == [4, 3, 2, 1]
+        assert _ids(archive.iter_archived('transaction', newest_first=False)) == [1, 2, 3, 4]
+        assert _ids(archive.iter_archived('transaction', user_ids=[1])) == [3, 1]
+        assert _ids(archive.iter_archived('transaction', symbols=['BB'])) == [3, 2]
+        assert _ids(archive.iter_archived('transaction', user_ids=[2], symbols=['AA'])) == [4]
+        row = next(archive.iter_archived('transaction', user_ids=[2], symbols=['AA']))
+        assert row.archived and row.user.name == 'two' and row.currency.symbol == 'AA' and row.amount == Decimal('1')
+    _run(tmp_path, test)
+
+
+def test_segments_that_cannot_match_are_not_opened(tmp_path, monkeypatch):
+    async def test(async_session):
+        await archive.archive_ledger('transaction', CUTOFF, async_session=async_session)
+        opened = []
+        iter_records = archive._iter_records
+
+        def tracked(segment):
+            opened.append(segment.name)
+            return iter_records(segment)
+        monkeypatch.setattr(archive, '_iter_records', tracked)
+        # user 2 has no rows in February, symbol BB none in March
+        assert _ids(archive.iter_archived('transaction', user_ids=[2])) == [4, 2]
+        assert _ids(archive.iter_archived('transaction', symbols=['BB'])) == [3, 2]
+        assert sorted(opened) == ['2021-01.jsonl.gz', '2021-01.jsonl.gz', '2021-02.jsonl.gz', '2021-03.jsonl.gz']
+    _run(tmp_path, test)
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    async def test(async_session):
+        await archive.archive_ledger('transaction', CUTOFF, async_session=async_session)
+        archive.index_path('transaction', '2021-02').unlink()
+        assert archive.segment_index('transaction', '2021-02') == dict(user_ids={1}, symbols={'BB'})
+        assert json.loads(archive.index_path('transaction', '2021-02').read_text()) == dict(user_ids=[1], symbols=['BB'])
+    _run(tmp_path, test)
+
+
+def test_with_archived_tops_up_to_limit(tmp_path):
+    async def test(async_session):
+        await archive.archive_ledger('transaction', CUTOFF, async_session=async_session)
+        async with async_session() as session:
+            res = await session.execute(select(models.TransactionLog))
+            hot = res.scalars().all()
+        assert _ids(archive.with_archived('transaction', hot, user_ids=[1], limit=2)) == [5, 3]
+        assert _ids(archive.with_archived('transaction', hot, limit=None)) == [5, 4, 3, 2, 1]
+    _run(tmp_path, test)
+
+
+def test_export_writes_archived_and_hot_rows(tmp_path):
+    async def test(async_session):
+        await archive.archive_ledger('transaction', CUTOFF, async_session=async_session)
+        fp = io.StringIO()
+        assert await archive.export_ledger('transaction', fp, async_session=async_session) == 5
+        records = [json.loads(line) for line in fp.getvalue().splitlines()]
+        assert [(r['id'], r.get('archived', False)) for r in records] == [(1, True), (2, True), (3, True), (4, True), (5, False)]
+    _run(tmp_path, test)
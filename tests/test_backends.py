@@ -0,0 +1,104 @@
+"""Smoke tests of the dialect specific statements against SQLite and Postgres.
+
+SQLite runs against a scratch file. Postgres runs when `TEST_POSTGRES_URL` points at a scratch database,
+e.g. `TEST_POSTGRES_URL=postgresql+asyncpg://localhost/botterpy_test pytest`. Its tables are dropped.
+"""
+import asyncio
+import os
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+import db
+from economy import models
+from economy.repositories import WalletRepository
+
+
+# larger than a 32 bit integer, like every Discord id
+USER_ID = 2 ** 62 + 1
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def engine_url(request, tmp_path):
+    if request.param == 'sqlite':
+        return f'sqlite+aiosqlite:///{tmp_path / "test.db"}'
+    url = os.getenv('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    return url
+
+
+async def _setup(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.drop_all)
+        await conn.run_sync(db.Base.metadata.create_all)
+        res = await conn.execute(insert(models.Currency.__table__).values(name='Test coin', symbol='TC'))
+        currency_id = res.inserted_primary_key[0]
+        await conn.execute(insert(db.User.__table__).values(id=USER_ID, name='user'))
+        res = await conn.execute(insert(models.Wallet.__table__).values(user_id=USER_ID))
+        wallet_id = res.inserted_primary_key[0]
+        await conn.execute(insert(models.CurrencyBalance.__table__).values(wallet_id=wallet_id, currency_id=currency_id, balance=10))
+    return wallet_id, currency_id
+
+
+def _run(engine_url, test):
+    async def main():
+        engine = db.create_db_engine(engine_url)
+        try:
+            ids = await _setup(engine)
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session, *ids)
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.drop_all)
+            await engine.dispose()
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('dialect', [sqlite.dialect(), postgresql.dialect()])
+def test_upsert_compiles(dialect):
+    table = db.User.__table__
+    do_nothing = db.upsert(dialect.name, table, dict(id=USER_ID), ['id'])
+    assert 'ON CONFLICT (id) DO NOTHING' in str(do_nothing.compile(dialect=dialect))
+    update = db.upsert(dialect.name, table, dict(id=USER_ID, name='a'), ['id'], update_columns=['name'])
+    assert 'DO UPDATE SET name = excluded.name' in str(update.compile(dialect=dialect))
+
+
+def test_upsert_unknown_dialect():
+    with pytest.raises(NotImplementedError):
+        db.upsert('mysql', db.User.__table__, dict(id=1), ['id'])
+
+
+def test_upsert(engine_url):
+    async def test(async_session, wallet_id, currency_id):
+        async with async_session() as session, session.begin():
+            repo = WalletRepository(session)
+            await repo.ensure_user(USER_ID, 'renamed')
+            await repo.ensure_user(USER_ID + 1)
+            await repo.ensure_balances(wallet_id, [currency_id])
+        async with async_session() as session:
+            res = await session.execute(select(db.User.id, db.User.name).order_by(db.User.id))
+            assert res.all() == [(USER_ID, 'renamed'), (USER_ID + 1, None)]
+            res = await session.execute(select(models.CurrencyBalance.balance))
+            assert res.scalars().all() == [Decimal(10)]
+    _run(engine_url, test)
+
+
+def test_adjust_balance(engine_url):
+    async def test(async_session, wallet_id, currency_id):
+        async with async_session() as session, session.begin():
+            repo = WalletRepository(session)
+            balance = await repo.get_currency_balance(USER_ID, 'TC')
+            assert await repo.adjust_balance(balance, Decimal(5)) == Decimal(15)
+            assert await repo.adjust_balance(balance, Decimal(-15)) == Decimal(0)
+            # would go negative
+            assert await repo.adjust_balance(balance, Decimal(-1)) is None
+        async with async_session() as session:
+            res = await session.execute(select(models.CurrencyBalance.balance))
+            assert res.scalar_one() == Decimal(0)
+    _run(engine_url, test)
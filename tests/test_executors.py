@@ -0,0 +1,92 @@
+"""Bounded thread and process pools: timeouts, slots held by running work, contextvars and worker start method."""
+import asyncio
+import contextvars
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pytest
+
+import executors, settings
+
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+@pytest.fixture(autouse=True)
+def queue_factor(monkeypatch):
+    # one slot per worker
+    monkeypatch.setattr(settings, 'EXECUTOR_QUEUE_FACTOR', 1)
+
+
+def test_timed_out_work_keeps_its_slot():
+    pool = executors.BoundedExecutor('test', ThreadPoolExecutor, 1)
+    release = threading.Event()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(release.wait, timeout=0.05)
+        # still running -- the next call waits for the slot
+        waiting = asyncio.ensure_future(pool.run(lambda: 'done', timeout=5))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        release.set()
+        assert await asyncio.wait_for(waiting, 5) == 'done'
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_errors_release_the_slot():
+    pool = executors.BoundedExecutor('test', ThreadPoolExecutor, 1)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(ZeroDivisionError):
+                await pool.run(lambda: 1 / 0)
+        assert await pool.run(sum, [1, 2], start=3) == 6
+    try:
+        asyncio.run(main())
+    finally:
+        pool.shutdown()
+
+
+def test_run_in_thread_copies_contextvars():
+    async def main():
+        request_id.set('abc')
+        return await executors.run_in_thread(request_id.get)
+    try:
+        assert asyncio.run(main()) == 'abc'
+    finally:
+        executors.shutdown()
+
+
+def test_process_workers_are_not_forked():
+    pool = executors.BoundedExecutor('test', ProcessPoolExecutor, 1, mp_context=executors._mp_context())
+    expected = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    assert pool.executor_kwargs['mp_context'].get_start_method() == expected
+
+    async def main():
+        return await pool.run(math.factorial, 20, timeout=30)
+    try:
+        assert asyncio.run(main()) == math.factorial(20)
+    finally:
+        pool.shutdown()
+
+
+def test_shutdown_restarts_on_next_use():
+    pool = executors.BoundedExecutor('test', ThreadPoolExecutor, 2)
+
+    async def main():
+        return await pool.run(math.factorial, 5)
+    assert asyncio.run(main()) == 120
+    first = pool._executor
+    pool.shutdown()
+    assert pool._executor is None and pool._slots is None
+    # a new event loop gets new slots
+    assert asyncio.run(main()) == 120
+    assert pool._executor is not first
+    pool.shutdown()
@@ -0,0 +1,62 @@
+"""Key-value store: cached reads, write-through updates and deletes."""
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import db, kv
+
+
+def _run(tmp_path, test):
+    async def main():
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+class CountingStore(kv.KeyValueStore):
+    loads = 0
+
+    async def load(self):
+        self.loads += 1
+        await super().load()
+
+
+def test_keys_are_loaded_once(tmp_path):
+    async def test(async_session):
+        await kv.KeyValueStore(async_session).set('a', 1)
+        store = CountingStore(async_session)
+        # concurrent first reads share one load
+        assert await asyncio.gather(store.get('a'), store.get('a'), store.get('b', 'default')) == [1, 1, 'default']
+        assert await store.keys() == ['a']
+        assert store.loads == 1
+    _run(tmp_path, test)
+
+
+def test_writes_go_through_to_the_database(tmp_path):
+    async def test(async_session):
+        store = kv.KeyValueStore(async_session)
+        await store.set('settings', dict(symbol='BPY', amounts=[1, 2]))
+        await store.set('count', 1)
+        await store.set('count', 2)
+        await store.delete('missing')
+        assert await store.get('count') == 2
+        # a new process sees the same values
+        other = kv.KeyValueStore(async_session)
+        assert await other.get('settings') == dict(symbol='BPY', amounts=[1, 2])
+        assert await other.get('count') == 2
+
+        await other.delete('settings')
+        assert await other.get('settings') is None
+        # the first store's cache is stale until reloaded
+        assert await store.get('settings') is not None
+        store.clear_cache()
+        assert await store.get('settings') is None
+        assert sorted(await store.keys()) == ['count']
+    _run(tmp_path, test)
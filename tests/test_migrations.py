@@ -0,0 +1,87 @@
+"""Migrations run down to an empty schema and back up, and bring tables created by older versions up to date."""
+import asyncio
+
+from sqlalchemy import inspect, text
+
+import db, migrations
+
+
+def _run(tmp_path, test):
+    async def main():
+        db.import_models(['economy', 'nlp'])
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+                await conn.run_sync(migrations.stamp)
+            await test(engine)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+async def _inspect(engine, func):
+    async with engine.connect() as conn:
+        return await conn.run_sync(lambda sync_conn: func(inspect(sync_conn)))
+
+
+async def _columns(engine, table_name):
+    return await _inspect(engine, lambda inspector: {c['name'] for c in inspector.get_columns(table_name)})
+
+
+def test_stamped_database_has_nothing_to_do(tmp_path):
+    async def test(engine):
+        assert await migrations.migrate(engine) == []
+        assert all(applied for _, applied in await migrations.status(engine))
+    _run(tmp_path, test)
+
+
+def test_plan_to_version(tmp_path):
+    async def test(engine):
+        async with engine.begin() as conn:
+            steps = await conn.run_sync(migrations.plan, '0007')
+        # newest first
+        assert [(m.version, upgrade) for m, upgrade in steps] == [('0010', False), ('0009', False), ('0008', False)]
+    _run(tmp_path, test)
+
+
+def test_down_and_up(tmp_path):
+    async def test(engine):
+        added = {'ledger_summary', 'kv', 'game_session', 'channel_ingest_state', 'term_count', 'message_thread', 'message_fts'}
+        await migrations.migrate(engine, '0000')
+        assert not any(applied for _, applied in await migrations.status(engine))
+        assert not added & set(await _inspect(engine, lambda inspector: inspector.get_table_names()))
+
+        steps = await migrations.migrate(engine)
+        assert all(upgrade for _, upgrade in steps) and len(steps) == len(migrations.load_migrations())
+        assert added <= set(await _inspect(engine, lambda inspector: inspector.get_table_names()))
+        assert 'rng_epoch' in await _columns(engine, 'game_session')
+        indexes = await _inspect(engine, lambda inspector: {i['name'] for i in inspector.get_indexes('transaction')})
+        assert 'ix_transaction_user_id_created' in indexes
+    _run(tmp_path, test)
+
+
+def test_upgrade_alters_existing_tables(tmp_path):
+    async def test(engine):
+        # tables created before 0007 and 0010
+        async with engine.begin() as conn:
+            await conn.execute(text('ALTER TABLE game_session DROP COLUMN rng_epoch'))
+            await conn.execute(text('ALTER TABLE channel_ingest_state DROP COLUMN terms_message_id'))
+        await migrations.migrate(engine, '0006')
+        assert 'terms_message_id' not in await _columns(engine, 'channel_ingest_state')
+
+        await migrations.migrate(engine)
+        assert 'terms_message_id' in await _columns(engine, 'channel_ingest_state')
+        assert 'rng_epoch' in await _columns(engine, 'game_session')
+    _run(tmp_path, test)
+
+
+def test_fts_triggers_index_new_messages(tmp_path):
+    async def test(engine):
+        async with engine.begin() as conn:
+            await conn.execute(text("INSERT INTO user (id, name) VALUES (1, 'a')"))
+            await conn.execute(text("INSERT INTO message (id, author_id, content) VALUES (1, 1, 'hello world')"))
+        async with engine.connect() as conn:
+            res = await conn.execute(text("SELECT rowid FROM message_fts WHERE message_fts MATCH 'hello'"))
+            assert res.scalars().all() == [1]
+    _run(tmp_path, test)
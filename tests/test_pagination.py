@@ -0,0 +1,70 @@
+"""Pagination of long replies: page limits, line splits and code blocks carried across pages."""
+import asyncio
+
+import util
+
+
+def _pages(pages):
+    async def main():
+        return [page async for page in pages]
+    return asyncio.run(main())
+
+
+def test_short_text_is_one_page():
+    assert _pages(util.paginate_text('hello\nworld')) == [('hello\nworld', False)]
+    assert _pages(util.paginate_text('  \n')) == []
+
+
+def test_pages_split_on_lines():
+    lines = [f'line {i:03}\n' for i in range(100)]
+    pages = _pages(util.paginate_text(''.join(lines), limit=100))
+    assert all(len(page) <= 100 for page, _ in pages)
+    assert [more for _, more in pages] == [True] * (len(pages) - 1) + [False]
+    # no line is cut in half
+    assert ''.join(page for page, _ in pages) == ''.join(lines)
+    assert all(page.endswith('\n') for page, _ in pages)
+
+
+def test_code_blocks_are_reopened():
+    text = '```diff\n' + ''.join(f'+ added {i}\n' for i in range(30)) + '```\nafter\n'
+    pages = _pages(util.paginate_text(text, limit=80))
+    assert len(pages) > 1
+    for page, _ in pages[:-1]:
+        assert len(page) <= 80
+        assert page.startswith('```diff\n') and page.rstrip().endswith('```')
+    assert pages[-1][0].endswith('after\n')
+    # the diff survives with only the extra fences added
+    body = ''.join(page.replace('```diff\n', '').replace('```', '') for page, _ in pages)
+    assert body == text.replace('```diff\n', '').replace('```', '')
+
+
+def test_long_lines_are_hard_split():
+    pages = _pages(util.paginate_text('x' * 250, limit=100))
+    assert all(len(page) <= 100 for page, _ in pages)
+    assert ''.join(page for page, _ in pages) == 'x' * 250
+
+
+def test_chunks_are_consumed_lazily():
+    consumed = []
+
+    async def chunks():
+        for i in range(10):
+            consumed.append(i)
+            yield f'chunk {i}\n' * 5
+
+    async def main():
+        pages = util.paginate(chunks(), limit=50)
+        page, more = await pages.__anext__()
+        assert more and len(page) <= 50
+        assert len(consumed) < 10
+        await pages.aclose()
+    asyncio.run(main())
+
+
+def test_paginate_template(tmp_path, monkeypatch):
+    (tmp_path / 'rows.txt.jinja2').write_text('{% for row in rows %}\n{{ row }}\n{% endfor %}\n')
+    monkeypatch.setattr(util, '_template_env', util.get_template_env(str(tmp_path), auto_reload=False, bytecode_cache=False))
+    rows = [f'row {i}' for i in range(50)]
+    pages = _pages(util.paginate_template('rows.txt.jinja2', dict(rows=rows), limit=60))
+    assert all(len(page) <= 60 for page, _ in pages)
+    assert ''.join(page for page, _ in pages).split() == ' '.join(rows).split()
@@ -0,0 +1,126 @@
+"""Game RNG streams: reproducible outcomes, resuming epochs from the kv store and replaying them."""
+import asyncio
+
+import numpy as np
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import db, kv
+from economy.rng import GameRNG, GameStream, RingBuffer
+
+
+BLOCK_SIZE = 16
+
+
+def _run(tmp_path, test):
+    async def main():
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+async def _restored(async_session, seed=None):
+    # a fresh store and generator, like after a restart
+    rng = GameRNG(seed=seed, block_size=BLOCK_SIZE)
+    await rng.restore(kv.KeyValueStore(async_session))
+    return rng
+
+
+async def _stop(rng):
+    if rng._checkpoint_task is not None:
+        await rng._checkpoint_task
+    await rng.checkpoint()
+
+
+class _MemoryStore:
+    """Stand-in for `kv.KeyValueStore` without a database."""
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    async def set(self, key, value):
+        self.values[key] = value
+
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(4)
+    buffer.push(np.array([1, 2, 3]))
+    assert buffer.pop(2).tolist() == [1, 2]
+    buffer.push(np.array([4, 5, 6]))
+    assert buffer.free == 0
+    assert buffer.pop(4).tolist() == [3, 4, 5, 6]
+    with pytest.raises(ValueError):
+        buffer.pop(1)
+
+
+def test_stream_refills_across_blocks():
+    values = GameStream('dice', 1, BLOCK_SIZE).pop(BLOCK_SIZE * 5 + 3)
+    assert len(values) == BLOCK_SIZE * 5 + 3
+    assert values.min() >= 1 and values.max() <= 6
+    # outcomes only depend on the seed
+    assert (GameStream('dice', 1, 4).pop(len(values)) == values).all()
+
+
+def test_advance_matches_drawing():
+    values = GameStream('guess_hilo', 7, BLOCK_SIZE).pop(1000)
+    stream = GameStream('guess_hilo', 7, BLOCK_SIZE)
+    stream.pop(5)
+    stream.advance(600)
+    assert stream.position == 605
+    assert (stream.pop(395) == values[605:]).all()
+
+
+def test_same_seed_same_sequence(tmp_path):
+    async def test(async_session):
+        first = GameRNG(seed=42, block_size=BLOCK_SIZE)
+        await first.restore(kv.KeyValueStore(async_session))
+        rolls = first.draw_n('dice', 100)
+        await _stop(first)
+        # a new database starts the same epoch of the same seed
+        other = GameRNG(seed=42, block_size=BLOCK_SIZE)
+        await other.restore(_MemoryStore())
+        assert other.epoch == first.epoch == 1
+        assert (other.draw_n('dice', 100) == rolls).all()
+        assert (first.replay('dice', 0, 100) == rolls).all()
+    _run(tmp_path, test)
+
+
+def test_restore_resumes_after_restart(tmp_path):
+    async def test(async_session):
+        rng = await _restored(async_session, seed=42)
+        drawn = rng.draw_n('cointoss', BLOCK_SIZE * 3)
+        await _stop(rng)
+
+        restarted = await _restored(async_session, seed=42)
+        assert restarted.epoch == rng.epoch
+        # saved ahead of the draws -- never deals the same outcomes again
+        start = restarted.position('cointoss')
+        assert start >= len(drawn)
+        values = restarted.draw_n('cointoss', 10)
+        assert (values == rng.replay('cointoss', start, 10)).all()
+    _run(tmp_path, test)
+
+
+def test_new_epoch_when_seed_changes(tmp_path):
+    async def test(async_session):
+        rng = await _restored(async_session, seed=1)
+        rolls = rng.draw_n('dice', BLOCK_SIZE * 2 + 1)
+        await _stop(rng)
+
+        changed = await _restored(async_session, seed=2)
+        assert changed.epoch == rng.epoch + 1
+        assert changed.position('dice') == 0
+        # the earlier epoch can still be replayed
+        assert (changed.replay('dice', 0, len(rolls), epoch=rng.epoch) == rolls).all()
+        with pytest.raises(ValueError):
+            changed.replay('dice', 0, 1, epoch=99)
+    _run(tmp_path, test)
@@ -0,0 +1,87 @@
+"""Full-text message search over the FTS5 index."""
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import db
+from nlp.models import Message
+from nlp.repositories import MessageRepository, fts_query
+
+
+# (id, channel id, author id, content, created)
+MESSAGES = [
+    (1, 10, 1, 'Python is great', datetime(2021, 1, 1)),
+    (2, 10, 2, 'python python python, all day long', datetime(2021, 1, 2)),
+    (3, 20, 1, 'I prefer pythons the snakes', datetime(2021, 1, 3)),
+    (4, 20, 2, 'nothing to see here', datetime(2021, 1, 4)),
+    (5, 10, 1, "c'est déjà l'été", datetime(2021, 1, 5)),
+]
+
+
+def _run(tmp_path, test):
+    async def main():
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+                await conn.execute(insert(db.User.__table__), [dict(id=1, name='one'), dict(id=2, name='two')])
+                await conn.execute(insert(Message.__table__), [
+                    dict(id=id, channel_id=channel_id, author_id=author_id, content=content, created_at=created)
+                    for id, channel_id, author_id, content, created in MESSAGES
+                ])
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+async def _search(async_session, query, **kwargs):
+    async with async_session() as session:
+        return await MessageRepository(session).search(query, **kwargs)
+
+
+def _ids(rows):
+    return [row.id for row in rows]
+
+
+def test_fts_query_quotes_terms():
+    assert fts_query('python "OR" -snake') == '"python" "OR" "snake"'
+    assert fts_query('pyth* AND') == '"pyth"* "AND"'
+    assert fts_query('"(*') == ''
+
+
+def test_search_ranks_best_matches_first(tmp_path):
+    async def test(async_session):
+        rows = await _search(async_session, 'python')
+        assert _ids(rows) == [2, 1]
+        assert rows[0].rank <= rows[1].rank
+        assert '**python**' in rows[0].snippet.lower()
+        # prefix search, diacritics are ignored
+        assert sorted(_ids(await _search(async_session, 'pyth*'))) == [1, 2, 3]
+        assert _ids(await _search(async_session, 'deja ete')) == [5]
+        # all terms must match
+        assert _ids(await _search(async_session, 'python snakes')) == []
+        assert await _search(async_session, '?!') == []
+        assert _ids(await _search(async_session, 'python', limit=1)) == [2]
+    _run(tmp_path, test)
+
+
+def test_search_filters(tmp_path):
+    async def test(async_session):
+        assert sorted(_ids(await _search(async_session, 'pyth*', channel_id=20))) == [3]
+        assert sorted(_ids(await _search(async_session, 'pyth*', author_id=1))) == [1, 3]
+        assert sorted(_ids(await _search(async_session, 'pyth*', after=datetime(2021, 1, 2), before=datetime(2021, 1, 3)))) == [2]
+    _run(tmp_path, test)
+
+
+def test_index_follows_edits(tmp_path):
+    async def test(async_session):
+        async with async_session() as session, session.begin():
+            await session.execute(update(Message.__table__).where(Message.id == 4).values(content='python after all'))
+        assert sorted(_ids(await _search(async_session, 'python'))) == [1, 2, 4]
+        assert _ids(await _search(async_session, 'nothing')) == []
+    _run(tmp_path, test)
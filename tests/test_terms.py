@@ -0,0 +1,111 @@
+"""Term counts: tokenizing, incremental catch up of stored messages and burst scores."""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+import db, executors
+from nlp import analytics, ingest
+from nlp.models import ChannelIngestState, TermCount
+
+
+CHANNEL_ID = 10
+TODAY = datetime.utcnow().replace(hour=12)
+
+
+@pytest.fixture(autouse=True)
+def shutdown_executors():
+    yield
+    executors.shutdown()
+
+
+def _row(id, content, created_at=TODAY):
+    return dict(
+        id=id, channel_id=CHANNEL_ID, author_id=1, content=content, created_at=created_at,
+        mentions=None, channel_mentions=None, jump_url=None, reference_id=None,
+    )
+
+
+async def _store(async_session, rows):
+    async with async_session() as session, session.begin():
+        await ingest.write_batch(session, CHANNEL_ID, rows, {1: 'one'})
+
+
+async def _counts(async_session):
+    async with async_session() as session:
+        res = await session.execute(select(TermCount.term, TermCount.count))
+        return dict(res.all())
+
+
+def _run(tmp_path, test):
+    async def main():
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+def test_tokenize_skips_stopwords_mentions_and_urls():
+    assert analytics.tokenize('The <@123> bot is in C++ and C#, see https://example.com/x') == ['bot', 'c++', 'c#', 'see']
+    assert analytics.tokenize(None) == []
+
+
+def test_count_terms_per_day():
+    counts = analytics.count_terms([
+        (datetime(2021, 1, 1, 8), 'python python rust'),
+        (datetime(2021, 1, 1, 20), 'rust'),
+        (datetime(2021, 1, 2), 'python'),
+        (datetime(2021, 1, 3), 'the and'),
+    ])
+    assert sorted(counts) == [
+        (date(2021, 1, 1), 'python', 2), (date(2021, 1, 1), 'rust', 2), (date(2021, 1, 2), 'python', 1),
+    ]
+    assert analytics.count_terms([]) == []
+
+
+def test_catch_up_only_counts_new_messages(tmp_path):
+    async def test(async_session):
+        await _store(async_session, [_row(1, 'python rust'), _row(2, 'python'), _row(3, 'go')])
+        assert await analytics.catch_up(batch_size=2, async_session=async_session) == 2
+        assert await _counts(async_session) == dict(python=2, rust=1, go=1)
+        # nothing new to count
+        assert await analytics.catch_up(async_session=async_session) == 0
+
+        await _store(async_session, [_row(4, 'python')])
+        assert await analytics.catch_up(channel_id=CHANNEL_ID, async_session=async_session) == 1
+        assert await _counts(async_session) == dict(python=3, rust=1, go=1)
+        async with async_session() as session:
+            state = await session.get(ChannelIngestState, CHANNEL_ID)
+        assert state.terms_message_id == state.last_message_id == 4
+
+        async with async_session() as session:
+            assert dict(await analytics.top_terms(session)) == dict(python=3, rust=1, go=1)
+            assert await analytics.top_terms(session, limit=1) == [('python', 3)]
+            assert await analytics.top_terms(session, channel_id=CHANNEL_ID + 1) == []
+    _run(tmp_path, test)
+
+
+def test_burst_scores():
+    today = date(2021, 1, 15)
+    rows = [(today - timedelta(days=d), 'steady', 3) for d in range(15)]
+    rows += [(today, 'burst', 10), (today - timedelta(days=3), 'burst', 1), (today, 'rare', 1)]
+    # outside both windows
+    rows += [(today - timedelta(days=30), 'burst', 100)]
+    scores = analytics.burst_scores(rows, recent_days=1, baseline_days=14, today=today)
+    assert [term for term, *_ in scores] == ['burst', 'steady']
+    term, recent, mean, z = scores[0]
+    assert recent == 10 and mean == pytest.approx(1 / 14) and z > 0
+    assert scores[1][1:] == (3, 3.0, 0.0)
+    assert analytics.burst_scores([], 1, 14) == []
+    with pytest.raises(ValueError):
+        analytics.burst_scores(rows, recent_days=0, baseline_days=14)
+    with pytest.raises(ValueError):
+        analytics.burst_scores(rows, recent_days=1, baseline_days=0)
@@ -0,0 +1,111 @@
+"""Reply threads: thread rows written with each batch, whole threads and interactions between authors."""
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+import db
+from nlp import ingest
+from nlp.models import Message, MessageThread, ChannelIngestState
+from nlp.repositories import MessageRepository
+
+
+CHANNEL_ID = 10
+AUTHORS = {1: 'one', 2: 'two', 3: 'three'}
+
+
+def _row(id, author_id, reference_id=None):
+    return dict(
+        id=id, channel_id=CHANNEL_ID, author_id=author_id, content=f'message {id}', created_at=datetime(2021, 1, 1, 0, id),
+        mentions=None, channel_mentions=None, jump_url=None, reference_id=reference_id,
+    )
+
+
+async def _store(async_session, rows):
+    async with async_session() as session, session.begin():
+        return await ingest.write_batch(session, CHANNEL_ID, rows, AUTHORS)
+
+
+async def _threads(async_session):
+    async with async_session() as session:
+        res = await session.execute(select(MessageThread.message_id, MessageThread.root_id, MessageThread.depth))
+        return {message_id: (root_id, depth) for message_id, root_id, depth in res.all()}
+
+
+def _run(tmp_path, test):
+    async def main():
+        engine = db.create_db_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(db.Base.metadata.create_all)
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            await test(async_session)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+def test_thread_rows_resolve_parents_within_the_batch():
+    rows = [_row(3, 1, reference_id=2), _row(2, 2, reference_id=1), _row(4, 3, reference_id=100), _row(5, 1)]
+    assert ingest.thread_rows(rows, {100: (50, 1)}) == [
+        dict(message_id=2, root_id=1, depth=1),
+        dict(message_id=3, root_id=1, depth=2),
+        dict(message_id=4, root_id=50, depth=2),
+        dict(message_id=5, root_id=5, depth=0),
+    ]
+
+
+def test_write_batch_threads_across_batches(tmp_path):
+    async def test(async_session):
+        assert await _store(async_session, [_row(1, 1), _row(2, 2, reference_id=1), _row(3, 3)]) == 3
+        # parents from an earlier batch, and one that was never stored
+        assert await _store(async_session, [_row(4, 1, reference_id=2), _row(5, 3, reference_id=4), _row(6, 2, reference_id=99)]) == 3
+        assert await _threads(async_session) == {
+            1: (1, 0), 2: (1, 1), 3: (3, 0), 4: (1, 2), 5: (1, 3), 6: (6, 0),
+        }
+        async with async_session() as session:
+            assert (await session.get(Message, 6)).reference_id is None
+            state = await session.get(ChannelIngestState, CHANNEL_ID)
+        assert (state.last_message_id, state.message_count) == (6, 6)
+
+        # a re-scan doesn't count messages twice
+        assert await _store(async_session, [_row(5, 3, reference_id=4), _row(6, 2)]) == 0
+        async with async_session() as session:
+            state = await session.get(ChannelIngestState, CHANNEL_ID)
+        assert (state.last_message_id, state.message_count) == (6, 6)
+    _run(tmp_path, test)
+
+
+def test_parent_stored_before_threads_is_the_root(tmp_path):
+    async def test(async_session):
+        async with async_session() as session, session.begin():
+            await session.execute(insert(db.User.__table__).values(id=1, name='one'))
+            await session.execute(insert(Message.__table__).values(_row(1, 1)))
+        await _store(async_session, [_row(2, 2, reference_id=1)])
+        assert await _threads(async_session) == {2: (1, 1)}
+    _run(tmp_path, test)
+
+
+def test_thread_and_interactions(tmp_path):
+    async def test(async_session):
+        await _store(async_session, [
+            _row(1, 1), _row(2, 2, reference_id=1), _row(3, 1, reference_id=2), _row(4, 2, reference_id=3),
+            _row(5, 3, reference_id=1), _row(6, 3, reference_id=5), _row(7, 1),
+        ])
+        async with async_session() as session:
+            repo = MessageRepository(session)
+            thread = await repo.thread(4)
+            assert [(row.id, row.depth) for row in thread] == [(1, 0), (2, 1), (3, 2), (4, 3), (5, 1), (6, 2)]
+            assert [row.id for row in await repo.thread(1, limit=2)] == [1, 2]
+            assert [row.id for row in await repo.thread(7)] == [7]
+            assert await repo.thread(100) == []
+
+            # self replies are ignored
+            interactions = await repo.interactions()
+            assert interactions[0] == (2, 1, 2)
+            assert sorted(tuple(row) for row in interactions) == [(1, 2, 1), (2, 1, 2), (3, 1, 1)]
+            assert sorted(tuple(row) for row in await repo.interactions(author_id=3)) == [(3, 1, 1)]
+    _run(tmp_path, test)
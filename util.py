@@ -1,33 +1,67 @@
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import logging
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
 from discord.ext import commands
 import discord
-from babel.dates import format_datetime
 
 import settings
 
+logger = logging.getLogger(__name__)
+
 #
 # Jinja2 templating:
 
 def dt_format(value, format='short'):
+    # babel's locale data is slow to import -- only load it when a template needs it
+    from babel.dates import format_datetime
     if format == 'long':
         format = "EEEE, d. MMMM y 'at' HH:mm"
     else:
         format = format="EE dd.MM.y HH:mm"
     return format_datetime(value, format)
 
-def get_template_env(template_dir='templates'):
+def get_template_env(template_dir=None, auto_reload=None, bytecode_cache=None):
+    if template_dir is None:
+        template_dir = settings.TEMPLATES_DIR
+    if auto_reload is None:
+        auto_reload = settings.TEMPLATES_AUTO_RELOAD
+    if bytecode_cache is None:
+        bytecode_cache = settings.TEMPLATES_BYTECODE_CACHE
     env = Environment(
         loader=FileSystemLoader(template_dir),
         autoescape=select_autoescape(),
         enable_async=True,
         trim_blocks = True,
-        lstrip_blocks = True
+        lstrip_blocks = True,
+        auto_reload=auto_reload,
+        bytecode_cache=FileSystemBytecodeCache() if bytecode_cache else None,
+        # keep every template compiled
+        cache_size=-1,
     )
     env.filters['dt_format'] = dt_format
     return env
 
+# process-wide environment -- see `default_template_env`
+_template_env = None
+
+def default_template_env():
+    global _template_env
+    if _template_env is None:
+        _template_env = get_template_env()
+    return _template_env
+
+def preload_templates(env=None):
+    """Compile all templates up front. Returns the number of templates loaded."""
+    if env is None:
+        env = default_template_env()
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    logger.debug(f'Preloaded {len(names)} templates')
+    return len(names)
+
 def get_template(template):
-    env = get_template_env('templates')
+    env = default_template_env()
     return env.get_template(template)
 
 async def render_template(template_name, template_context=None):
@@ -37,6 +71,90 @@ async def render_template(template_name, template_context=None):
     text = await tmpl.render_async(**template_context)
     return text
 
+def render_template_sync(template_name, template_context=None):
+    """Render without the event loop, e.g. in a thread with `executors.run_in_thread`.
+
+    The environment is async -- jinja runs the render on a private event loop in the calling thread.
+    """
+    if template_context is None:
+        template_context = {}
+    return get_template(template_name).render(**template_context)
+
+async def render_template_chunks(template_name, template_context=None):
+    """Yields rendered template output in chunks as jinja generates it."""
+    if template_context is None:
+        template_context = {}
+    tmpl = get_template(template_name)
+    async for chunk in tmpl.generate_async(**template_context):
+        yield chunk
+
+
+#
+# Pagination
+
+DISCORD_MESSAGE_LIMIT = 2000
+FENCE = '```'
+
+async def _lines(chunks):
+    buffer = ''
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split('\n')
+        for line in complete:
+            yield line + '\n'
+    if buffer:
+        yield buffer
+
+def _close_page(page, fence):
+    if not fence:
+        return page
+    if not page.endswith('\n'):
+        page += '\n'
+    return page + FENCE
+
+async def paginate(chunks, limit=DISCORD_MESSAGE_LIMIT):
+    """Packs an async iterable of text chunks into pages of at most `limit` characters.
+
+    Yields (page, more) tuples. Pages are split on line boundaries where possible and code blocks are closed
+    and reopened (with the same language) across pages so discord formatting survives.
+    Chunks are only consumed when the next page is requested.
+    """
+    fence = None  # opening line of the current code block e.g. ```diff
+    page = ''
+    reserve = len(FENCE) + 1
+
+    def reopen():
+        return fence + '\n' if fence else ''
+
+    async for line in _lines(chunks):
+        if line.strip().startswith(FENCE):
+            fence_after = None if fence else line.strip()
+        else:
+            fence_after = fence
+        if len(page) + len(line) + (reserve if fence_after else 0) > limit and page.strip() and page != reopen():
+            yield _close_page(page, fence), True
+            page = reopen()
+        # hard split lines too long for a page
+        while len(page) + len(line) + (reserve if fence_after else 0) > limit:
+            room = limit - len(page) - (reserve if fence else 0)
+            page, line = page + line[:room], line[room:]
+            yield _close_page(page, fence), True
+            page = reopen()
+        page += line
+        fence = fence_after
+    if page.strip() and page != reopen():
+        yield _close_page(page, fence), False
+
+def paginate_template(template_name, template_context=None, limit=DISCORD_MESSAGE_LIMIT):
+    """Lazily render a template into (page, more) tuples. See `paginate`."""
+    return paginate(render_template_chunks(template_name, template_context), limit=limit)
+
+def paginate_text(text, limit=DISCORD_MESSAGE_LIMIT):
+    """Already rendered text into (page, more) tuples. See `paginate`."""
+    async def chunks():
+        yield text
+    return paginate(chunks(), limit=limit)
+
 
 #
 # Misc 